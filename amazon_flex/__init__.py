@@ -1,10 +1,17 @@
 \
 import os
 from flask import Flask
-from .models import db, ensure_schema
 from dotenv import load_dotenv
 
+# Imports do app ficam dentro de create_app: o pacote pode ser importado sem
+# Flask-SQLAlchemy (o app raiz usa amazon_flex.migracoes e amazon_flex.metricas)
+
 def create_app():
+    from .models import db
+    from .migracoes import migrar
+    from .perfil_sqlite import perfil_do_ambiente, perfil_atual, aplicar as aplicar_perfil
+    from . import orcamento_sql, relatorio_pdf, cache, metricas
+
     load_dotenv()
     app = Flask(__name__, instance_relative_config=True, template_folder="../templates", static_folder="../static")
 
@@ -16,25 +23,39 @@ def create_app():
     os.makedirs(app.instance_path, exist_ok=True)
     app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{db_path}"
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    # Perfil SQLite (WAL, synchronous, mmap, cache...) aplicado em cada conexão
+    app.config["SQLITE_PERFIL"] = perfil_do_ambiente()
+    # Datas nos formulários de período dos relatórios
+    app.jinja_env.filters["strftime"] = lambda d, formato: d.strftime(formato)
 
     # Init DB
     db.init_app(app)
 
     with app.app_context():
-        # Habilita FK no SQLite
+        # Habilita FK e o perfil de desempenho no SQLite
         from sqlalchemy import event
-        from sqlalchemy.engine import Engine
 
-        @event.listens_for(Engine, "connect")
+        @event.listens_for(db.engine, "connect")
         def set_sqlite_pragma(dbapi_connection, connection_record):
-            cursor = dbapi_connection.cursor()
-            try:
-                cursor.execute("PRAGMA foreign_keys=ON")
-            finally:
-                cursor.close()
+            aplicar_perfil(dbapi_connection, app.config["SQLITE_PERFIL"])
+
+        # Limite de consultas por request (debug)
+        orcamento_sql.init_app(app, db.engine)
+        # Latência, SQL e templates por endpoint (/metricas)
+        metricas.init_app(app, db.engine)
 
-        db.create_all()
-        ensure_schema()
+        # Mapper events que sobem a versão dos dados (chave dos caches)
+        from . import versao  # noqa: F401
+        # Mapper events que mantêm lucro/custo por milha gravados em cada corrida
+        from . import derivados  # noqa: F401
+
+        # Uma consulta à schema_version; migra só se houver migração pendente
+        migrar()
+
+    # PDFs de relatório (pool de geração e cache em instance/)
+    relatorio_pdf.init_app(app)
+    # Cache de resultados dos relatórios (memória + disco opcional)
+    cache.init_app(app)
 
     # Blueprints
     from .routes.stations import bp as stations_bp
@@ -49,6 +70,17 @@ def create_app():
     app.register_blueprint(relatorios_bp)
     app.register_blueprint(backup_bp)
 
+    # CLI
+    from .resumo import reconstruir_cmd
+    from .planos import verificar_cmd
+    app.cli.add_command(reconstruir_cmd)
+    app.cli.add_command(verificar_cmd)
+    from .derivados import recalcular_cmd
+    app.cli.add_command(recalcular_cmd)
+    from .importacao import importar_corridas_cmd, importar_despesas_cmd
+    app.cli.add_command(importar_corridas_cmd)
+    app.cli.add_command(importar_despesas_cmd)
+
     @app.get("/")
     def index():
         from flask import redirect, url_for
@@ -56,6 +88,9 @@ def create_app():
 
     @app.get("/saude")
     def saude():
-        return {"ok": True, "version": "v1.0.0"}
+        with db.engine.connect() as conn:
+            sqlite = perfil_atual(conn.connection.dbapi_connection)
+        return {"ok": True, "version": "v1.0.0", "sqlite": sqlite,
+                "cache": app.extensions["cache_relatorios"].estatisticas()}
 
     return app
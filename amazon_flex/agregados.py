@@ -0,0 +1,320 @@
+from datetime import datetime, timedelta
+from sqlalchemy import func, select, and_, case
+from .models import db, ScheduledRide, Station, ResumoDiario
+
+
+def limites(inicio, fim):
+    """Converte as datas do período em limites datetime (00:00 do início até 23:59:59 do fim)."""
+    return datetime.combine(inicio, datetime.min.time()), datetime.combine(fim, datetime.max.time())
+
+
+def filtro_corridas(inicio, fim, station_id=None):
+    """Condição usada por todos os relatórios para selecionar as corridas do período."""
+    dt_ini, dt_fim = limites(inicio, fim)
+    conds = [
+        ScheduledRide.inicio >= dt_ini,
+        ScheduledRide.fim <= dt_fim,
+        ScheduledRide.exclude_from_reports.is_(False),
+    ]
+    if station_id:
+        conds.append(ScheduledRide.station_id == int(station_id))
+    return and_(*conds)
+
+
+def indicadores(receita, custo, milhas):
+    """Lucro, margem (%) e custo por milha a partir dos totais."""
+    lucro = receita - custo
+    margem = (lucro/receita*100.0) if receita > 0 else 0.0
+    custo_milha = (custo/milhas) if milhas > 0 else 0.0
+    return lucro, margem, custo_milha
+
+
+def filtro_resumo(inicio, fim):
+    """Mesmo período de filtro_corridas, aplicado às linhas de resumo_diario."""
+    return and_(ResumoDiario.dia >= inicio, ResumoDiario.dia_fim <= fim)
+
+
+def consulta_totais(inicio, fim, station_id=None):
+    """SELECT único com todos os totais do período sobre resumo_diario.
+
+    As somas das corridas e o total de despesas (todas as despesas do período,
+    independente de estação) voltam na mesma linha, lendo uma linha por dia e
+    estação em vez de cada corrida.
+    """
+    def soma(col):
+        if station_id:
+            col = case((ResumoDiario.station_id == int(station_id), col), else_=0.0)
+        return func.coalesce(func.sum(col), 0.0)
+
+    stmt = select(
+        soma(ResumoDiario.valor).label("valor"),
+        soma(ResumoDiario.gorjeta).label("gorjeta"),
+        soma(ResumoDiario.distance_miles).label("milhas"),
+        soma(ResumoDiario.horas).label("horas"),
+        soma(ResumoDiario.qtd).label("qtd"),
+        func.coalesce(func.sum(ResumoDiario.despesas), 0.0).label("despesas"),
+    ).where(filtro_resumo(inicio, fim))
+    return stmt
+
+
+def totais(inicio, fim, station_id=None):
+    """Totais do período (receita, custo, lucro, margem, milhas, horas, qtd...)."""
+    row = db.session.execute(consulta_totais(inicio, fim, station_id)).one()
+
+    receita = float(row.valor) + float(row.gorjeta)
+    custo = float(row.despesas)
+    milhas = float(row.milhas)
+    lucro, margem, custo_milha = indicadores(receita, custo, milhas)
+    return {
+        "valor": float(row.valor),
+        "gorjeta": float(row.gorjeta),
+        "receita": receita,
+        "milhas": milhas,
+        "horas": float(row.horas),
+        "qtd": int(row.qtd),
+        "custo": custo,
+        "lucro": lucro,
+        "margem": margem,
+        "custo_milha": custo_milha,
+    }
+
+
+def consulta_por_estacao(inicio, fim):
+    """Totais por estação em uma única consulta (GROUP BY station_id em resumo_diario).
+
+    Custos de cada estação são apenas as despesas vinculadas às corridas dela
+    no período. Todas as estações aparecem, mesmo sem corridas no período.
+    """
+    resumo = (
+        select(
+            ResumoDiario.station_id.label("station_id"),
+            func.sum(ResumoDiario.valor).label("valor"),
+            func.sum(ResumoDiario.gorjeta).label("gorjeta"),
+            func.sum(ResumoDiario.distance_miles).label("milhas"),
+            func.sum(ResumoDiario.despesas_vinculadas).label("custos"),
+        )
+        .where(filtro_resumo(inicio, fim), ResumoDiario.station_id != 0)
+        .group_by(ResumoDiario.station_id)
+        .subquery()
+    )
+    stmt = (
+        select(
+            Station.nome,
+            Station.codigo,
+            func.coalesce(resumo.c.valor, 0.0).label("valor"),
+            func.coalesce(resumo.c.gorjeta, 0.0).label("gorjeta"),
+            func.coalesce(resumo.c.milhas, 0.0).label("milhas"),
+            func.coalesce(resumo.c.custos, 0.0).label("custos"),
+        )
+        .outerjoin(resumo, resumo.c.station_id == Station.id)
+        .order_by(Station.nome)
+    )
+    return stmt
+
+
+def por_estacao(inicio, fim):
+    """Linhas do comparativo por estação (valores sem arredondar)."""
+    linhas = []
+    for row in db.session.execute(consulta_por_estacao(inicio, fim)):
+        receita = float(row.valor) + float(row.gorjeta)
+        custos_est = float(row.custos)
+        milhas = float(row.milhas)
+        lucro, margem, custo_milha = indicadores(receita, custos_est, milhas)
+        linhas.append({
+            "estacao": f"{row.nome}" + (f" ({row.codigo})" if row.codigo else ""),
+            "receita": receita,
+            "custos": custos_est,
+            "lucro": lucro,
+            "margem": margem,
+            "milhas": milhas,
+            "custo_milha": custo_milha,
+        })
+    return linhas
+
+
+def consulta_exportacao(inicio, fim, station_id=None):
+    """Colunas do export CSV, com o nome da estação via JOIN (sem carregar objetos)."""
+    return (
+        select(
+            ScheduledRide.id, ScheduledRide.inicio, ScheduledRide.fim, ScheduledRide.horas,
+            ScheduledRide.valor, ScheduledRide.gorjeta, ScheduledRide.distance_miles,
+            Station.nome, ScheduledRide.exclude_from_reports,
+        )
+        .outerjoin(Station, Station.id == ScheduledRide.station_id)
+        .where(filtro_corridas(inicio, fim, station_id))
+        .order_by(ScheduledRide.inicio.asc())
+    )
+
+
+# Métricas do ranking e se um valor maior é melhor
+METRICAS_RANKING = {"por_hora": True, "por_milha": True, "lucro": True, "margem": True, "custo_milha": False}
+
+
+def _metrica(nome, receita, custos, lucro, horas, milhas):
+    """(expressão, condição para a métrica existir) de uma métrica do ranking."""
+    return {
+        "por_hora": (receita / horas, horas > 0),
+        "por_milha": (receita / milhas, milhas > 0),
+        "lucro": (lucro, None),
+        "margem": (lucro * 100.0 / receita, receita > 0),
+        "custo_milha": (custos / milhas, milhas > 0),
+    }[nome]
+
+
+def _limitar(stmt, expr, cond, crescente, n, id_col):
+    # ORDER BY ... LIMIT: o SQLite guarda só as n melhores linhas ao percorrer o período
+    if cond is not None:
+        stmt = stmt.where(cond)
+    return stmt.order_by(expr.asc() if crescente else expr.desc(), id_col).limit(n)
+
+
+def consulta_ranking_corridas(inicio, fim, metrica, n, crescente=False, station_id=None):
+    """n corridas do período ordenadas pela métrica, a partir das colunas derivadas."""
+    r = ScheduledRide
+    expr, cond = _metrica(metrica, r.receita_total, r.despesas_vinculadas, r.lucro, r.horas, r.distance_miles)
+    stmt = (
+        select(r.id, r.inicio, r.fim, Station.nome.label("estacao"), r.horas, r.distance_miles.label("milhas"),
+               r.receita_total.label("receita"), r.despesas_vinculadas.label("custos"), r.lucro,
+               expr.label("valor"))
+        .outerjoin(Station, Station.id == r.station_id)
+        .where(filtro_corridas(inicio, fim, station_id))
+    )
+    return _limitar(stmt, expr, cond, crescente, n, r.id)
+
+
+def consulta_ranking_estacoes(inicio, fim, metrica, n, crescente=False):
+    """n estações ordenadas pela métrica sobre os totais do período em resumo_diario."""
+    resumo = (
+        select(
+            ResumoDiario.station_id.label("station_id"),
+            func.sum(ResumoDiario.valor + ResumoDiario.gorjeta).label("receita"),
+            func.sum(ResumoDiario.despesas_vinculadas).label("custos"),
+            func.sum(ResumoDiario.horas).label("horas"),
+            func.sum(ResumoDiario.distance_miles).label("milhas"),
+            func.sum(ResumoDiario.qtd).label("qtd"),
+        )
+        .where(filtro_resumo(inicio, fim), ResumoDiario.station_id != 0)
+        .group_by(ResumoDiario.station_id)
+        .subquery()
+    )
+    c = resumo.c
+    expr, cond = _metrica(metrica, c.receita, c.custos, c.receita - c.custos, c.horas, c.milhas)
+    stmt = (
+        select(Station.id, Station.nome.label("estacao"), Station.codigo, c.qtd, c.horas, c.milhas,
+               c.receita, c.custos, (c.receita - c.custos).label("lucro"), expr.label("valor"))
+        .join(resumo, c.station_id == Station.id)
+        .where(c.qtd > 0)
+    )
+    return _limitar(stmt, expr, cond, crescente, n, Station.id)
+
+
+def ranking(alvo, inicio, fim, metrica, n, station_id=None):
+    """{"melhores": [...], "piores": [...]} com até n linhas cada (duas consultas com LIMIT)."""
+    maior_melhor = METRICAS_RANKING[metrica]
+
+    def linhas(crescente):
+        if alvo == "estacoes":
+            stmt = consulta_ranking_estacoes(inicio, fim, metrica, n, crescente)
+        else:
+            stmt = consulta_ranking_corridas(inicio, fim, metrica, n, crescente, station_id)
+        return [dict(row._mapping) for row in db.session.execute(stmt)]
+
+    return {"melhores": linhas(not maior_melhor), "piores": linhas(maior_melhor)}
+
+
+# Chave do bucket na série (texto YYYY-MM-DD do primeiro dia); semana começa na segunda
+BUCKETS_SERIE = {
+    "dia": lambda dia: func.date(dia),
+    "semana": lambda dia: func.date(dia, "weekday 0", "-6 days"),
+    "mes": lambda dia: func.strftime("%Y-%m-01", dia),
+}
+CAMPOS_SERIE = ("valor", "gorjeta", "milhas", "horas", "qtd", "despesas")
+
+
+def consulta_serie(inicio, fim, intervalo, station_id=None):
+    """Somas por dia/semana/mês sobre resumo_diario, agrupadas no SQLite.
+
+    Mesmas regras de consulta_totais: a estação filtra as corridas, as
+    despesas são todas as do dia (a soma dos buckets bate com o total do período).
+    """
+    chave = BUCKETS_SERIE[intervalo](ResumoDiario.dia)
+
+    def soma(col):
+        if station_id:
+            col = case((ResumoDiario.station_id == int(station_id), col), else_=0.0)
+        return func.coalesce(func.sum(col), 0.0)
+
+    return (
+        select(
+            chave.label("periodo"),
+            soma(ResumoDiario.valor).label("valor"),
+            soma(ResumoDiario.gorjeta).label("gorjeta"),
+            soma(ResumoDiario.distance_miles).label("milhas"),
+            soma(ResumoDiario.horas).label("horas"),
+            soma(ResumoDiario.qtd).label("qtd"),
+            func.coalesce(func.sum(ResumoDiario.despesas), 0.0).label("despesas"),
+        )
+        .where(filtro_resumo(inicio, fim))
+        .group_by(chave)
+        .order_by(chave)
+    )
+
+
+def _chave_bucket(dia, intervalo):
+    if intervalo == "semana":
+        return dia - timedelta(days=dia.weekday())
+    if intervalo == "mes":
+        return dia.replace(day=1)
+    return dia
+
+
+def _colunas(rows, rotulos):
+    """Linhas do GROUP BY em colunas densas (buckets sem dados = 0), na ordem de `rotulos`."""
+    por_periodo = {r.periodo: r for r in rows}
+    colunas = {c: [] for c in CAMPOS_SERIE}
+    for rotulo in rotulos:
+        r = por_periodo.get(rotulo)
+        for c in CAMPOS_SERIE:
+            colunas[c].append(float(getattr(r, c)) if r is not None else 0.0)
+    colunas["qtd"] = [int(q) for q in colunas["qtd"]]
+    colunas["receita"] = [v + g for v, g in zip(colunas["valor"], colunas["gorjeta"])]
+    colunas["lucro"] = [r - d for r, d in zip(colunas["receita"], colunas["despesas"])]
+    return colunas
+
+
+def _media_movel(valores, janela, inicio):
+    """Média das últimas `janela` posições para cada posição a partir de `inicio` (somas acumuladas)."""
+    acum = [0.0]
+    for v in valores:
+        acum.append(acum[-1] + v)
+    return [(acum[i + 1] - acum[max(0, i + 1 - janela)]) / janela for i in range(inicio, len(valores))]
+
+
+def serie(inicio, fim, intervalo="dia", station_id=None):
+    """Série do período em colunas (para gráficos) e médias móveis de 7/30 dias da receita diária.
+
+    A receita diária é lida desde 29 dias antes do início, para as médias do
+    começo do período já terem a janela completa.
+    """
+    antes = inicio - timedelta(days=29)
+    dias = [antes + timedelta(days=i) for i in range((fim - antes).days + 1)]
+    diario = _colunas(db.session.execute(consulta_serie(antes, fim, "dia", station_id)),
+                      [d.isoformat() for d in dias])
+
+    if intervalo == "dia":
+        rotulos = [d.isoformat() for d in dias[29:]]
+        buckets = {c: v[29:] for c, v in diario.items()}
+    else:
+        rotulos = list(dict.fromkeys(_chave_bucket(d, intervalo).isoformat() for d in dias[29:]))
+        buckets = _colunas(db.session.execute(consulta_serie(inicio, fim, intervalo, station_id)), rotulos)
+
+    return {
+        "rotulos": rotulos,
+        **buckets,
+        "medias": {
+            "rotulos": [d.isoformat() for d in dias[29:]],
+            "receita": diario["receita"][29:],
+            "media_7": _media_movel(diario["receita"], 7, 29),
+            "media_30": _media_movel(diario["receita"], 30, 29),
+        },
+    }
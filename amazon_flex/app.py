@@ -1,43 +1,44 @@
 import os
-from datetime import date, datetime
-from flask import Flask, render_template, redirect, url_for, request, flash, jsonify, send_file
+import time
+from datetime import date, datetime, timedelta
+from flask import Flask, render_template, stream_template, redirect, url_for, request, session, flash, get_flashed_messages, jsonify, send_file
 from flask_login import login_user, logout_user, login_required, current_user
-from sqlalchemy import text
 from io import BytesIO
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
 
 from .extensions import db, login_manager
+from .migracoes import executar, adicionar_colunas
+from . import metricas
 from .models import User, Shift, Trip, Expense, ScheduledRide
 
+# Colunas que bancos criados por versões anteriores podem não ter (migração 2)
+_COLUNAS = {
+    'users': {'id':'INTEGER','email':'VARCHAR(120)','password_hash':'VARCHAR(255)','created_at':'DATETIME'},
+    'shifts': {'id':'INTEGER','date':'DATE','hours_worked':'FLOAT','created_at':'DATETIME'},
+    'trips': {'id':'INTEGER','shift_id':'INTEGER','fare_amount':'FLOAT','fuel_cost':'FLOAT','odometer':'FLOAT','tips':'FLOAT','created_at':'DATETIME'},
+    'expenses': {'id':'INTEGER','shift_id':'INTEGER','trip_id':'INTEGER','exp_date':'DATE','category':'VARCHAR(100)','amount':'FLOAT','notes':'VARCHAR(500)','created_at':'DATETIME'},
+    'scheduled_rides': {
+        'id':'INTEGER','title':'VARCHAR(120)','start_dt':'DATETIME','end_dt':'DATETIME',
+        'hours_planned':'FLOAT','expected_block_pay':'FLOAT','tips':'FLOAT','fuel_cost':'FLOAT',
+        'odometer_start':'FLOAT','odometer_end':'FLOAT','notes':'VARCHAR(500)','created_at':'DATETIME'
+    },
+}
+
+# Versões do schema deste app em schema_version (app="amazon_flex_legado"); ver amazon_flex.migracoes
+MIGRACOES = [
+    (1, "tabelas", lambda conn: db.metadata.create_all(bind=conn)),
+    (2, "colunas ausentes de bancos antigos", lambda conn: adicionar_colunas(
+        conn, [(t, c, tipo) for t, cols in _COLUNAS.items() for c, tipo in cols.items()])),
+    # Janela do calendário (/api/agendamentos) e relatórios filtram por start_dt
+    (3, "índice scheduled_rides.start_dt", lambda conn: conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_scheduled_rides_start_dt ON scheduled_rides (start_dt)")),
+]
+
 def _ensure_schema(app):
+    # Uma consulta à schema_version por boot; migra só se houver pendência
     with app.app_context():
-        db.create_all()
-
-        def cols(table):
-            rows = db.session.execute(text(f"PRAGMA table_info({table});")).mappings().all()
-            return {r['name']: r for r in rows}
-
-        expected = {
-            'users': {'id':'INTEGER','email':'VARCHAR(120)','password_hash':'VARCHAR(255)','created_at':'DATETIME'},
-            'shifts': {'id':'INTEGER','date':'DATE','hours_worked':'FLOAT','created_at':'DATETIME'},
-            'trips': {'id':'INTEGER','shift_id':'INTEGER','fare_amount':'FLOAT','fuel_cost':'FLOAT','odometer':'FLOAT','tips':'FLOAT','created_at':'DATETIME'},
-            'expenses': {'id':'INTEGER','shift_id':'INTEGER','trip_id':'INTEGER','exp_date':'DATE','category':'VARCHAR(100)','amount':'FLOAT','notes':'VARCHAR(500)','created_at':'DATETIME'},
-            'scheduled_rides': {
-                'id':'INTEGER','title':'VARCHAR(120)','start_dt':'DATETIME','end_dt':'DATETIME',
-                'hours_planned':'FLOAT','expected_block_pay':'FLOAT','tips':'FLOAT','fuel_cost':'FLOAT',
-                'odometer_start':'FLOAT','odometer_end':'FLOAT','notes':'VARCHAR(500)','created_at':'DATETIME'
-            },
-        }
-        for table, cmap in expected.items():
-            try:
-                existing = cols(table)
-            except Exception:
-                existing = {}
-            for name, sqltype in cmap.items():
-                if name not in existing:
-                    db.session.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {sqltype};"))
-        db.session.commit()
+        executar(db.session, "amazon_flex_legado", MIGRACOES)
 
 def _seed_admin():
     email = os.getenv("ADMIN_EMAIL")
@@ -62,6 +63,7 @@ def create_app():
         SECRET_KEY=secret,
         SQLALCHEMY_DATABASE_URI=f"sqlite:///{os.path.join(instance_dir, db_file)}",
         SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        DASHBOARD_TTL=float(os.getenv("DASHBOARD_TTL", "30")),
     )
 
     db.init_app(app)
@@ -75,6 +77,8 @@ def create_app():
     with app.app_context():
         _ensure_schema(app)
         _seed_admin()
+        # Latência, SQL e templates por endpoint (/metricas)
+        metricas.init_app(app, db.engine)
 
     # ----------- Autenticação -----------
     @app.route("/registrar", methods=["GET", "POST"])
@@ -121,18 +125,36 @@ def create_app():
             return redirect(url_for("dashboard"))
         return render_template("index.html")
 
+    # Totais do dashboard: calculados numa consulta só e guardados por DASHBOARD_TTL
+    # segundos; as rotas que gravam turnos/corridas/despesas limpam o cache.
+    dashboard_cache = {"totais": None, "ate": 0.0}
+
+    def _invalidar_dashboard():
+        dashboard_cache["totais"] = None
+
+    def _totais_dashboard():
+        agora = time.monotonic()
+        if dashboard_cache["totais"] is not None and agora < dashboard_cache["ate"]:
+            return dashboard_cache["totais"]
+        f = db.func
+        shifts = db.select(f.count(Shift.id).label("shifts")).subquery()
+        trips = db.select(
+            f.count(Trip.id).label("trips"),
+            f.coalesce(f.sum(Trip.fare_amount), 0.0).label("fare"),
+            f.coalesce(f.sum(Trip.tips), 0.0).label("tips"),
+            f.coalesce(f.sum(Trip.fuel_cost), 0.0).label("fuel"),
+        ).subquery()
+        expenses = db.select(f.coalesce(f.sum(Expense.amount), 0.0).label("expenses")).subquery()
+        # Três subconsultas de uma linha: cada tabela é lida uma vez, num único SELECT
+        juntas = shifts.join(trips, db.true()).join(expenses, db.true())
+        row = db.session.execute(db.select(shifts, trips, expenses).select_from(juntas)).mappings().one()
+        dashboard_cache.update(totais=dict(row), ate=agora + app.config["DASHBOARD_TTL"])
+        return dashboard_cache["totais"]
+
     @app.get("/dashboard")
     @login_required
     def dashboard():
-        total_shifts = db.session.query(Shift).count()
-        total_trips = db.session.query(Trip).count()
-        total_fare = db.session.query(db.func.coalesce(db.func.sum(Trip.fare_amount), 0.0)).scalar()
-        total_tips = db.session.query(db.func.coalesce(db.func.sum(Trip.tips), 0.0)).scalar()
-        total_fuel = db.session.query(db.func.coalesce(db.func.sum(Trip.fuel_cost), 0.0)).scalar()
-        total_expenses = db.session.query(db.func.coalesce(db.func.sum(Expense.amount), 0.0)).scalar()
-        return render_template("dashboard.html",
-                               totals=dict(shifts=total_shifts, trips=total_trips, fare=total_fare,
-                                           tips=total_tips, fuel=total_fuel, expenses=total_expenses))
+        return render_template("dashboard.html", totals=_totais_dashboard())
 
     # ----------- Forms simples -----------
     @app.route("/shift/nova", methods=["GET", "POST"])
@@ -144,6 +166,7 @@ def create_app():
             s = Shift(date=d, hours_worked=hours)
             db.session.add(s)
             db.session.commit()
+            _invalidar_dashboard()
             return redirect(url_for("dashboard"))
         return render_template("shift_form.html")
 
@@ -159,6 +182,7 @@ def create_app():
             t = Trip(shift_id=shift_id, fare_amount=fare, fuel_cost=fuel, odometer=odo, tips=tips)
             db.session.add(t)
             db.session.commit()
+            _invalidar_dashboard()
             return redirect(url_for("dashboard"))
         shifts = db.session.query(Shift).order_by(Shift.date.desc()).all()
         return render_template("trip_form.html", shifts=shifts)
@@ -178,6 +202,7 @@ def create_app():
                         exp_date=exp_date, category=category, amount=amount, notes=notes)
             db.session.add(e)
             db.session.commit()
+            _invalidar_dashboard()
             return redirect(url_for("dashboard"))
         shifts = db.session.query(Shift).order_by(Shift.date.desc()).all()
         trips = db.session.query(Trip).order_by(Trip.id.desc()).all()
@@ -217,6 +242,7 @@ def create_app():
                                odometer_end=od_end, notes=notes)
             db.session.add(sr)
             db.session.commit()
+            _tocar_agendamentos()
             flash("Corrida agendada.", "success")
             return redirect(url_for("calendar_view"))
         return render_template("scheduled_form.html", mode="new")
@@ -243,6 +269,7 @@ def create_app():
             r.odometer_end = float(od_end) if od_end else None
             r.notes = request.form.get("notes") or None
             db.session.commit()
+            _tocar_agendamentos()
             flash("Agendamento atualizado.", "success")
             return redirect(url_for("calendar_view"))
         return render_template("scheduled_form.html", mode="edit", ride=r)
@@ -256,13 +283,63 @@ def create_app():
         else:
             db.session.delete(r)
             db.session.commit()
+            _tocar_agendamentos()
             flash("Agendamento excluído.", "success")
         return redirect(url_for("calendar_view"))
 
+    # Feed do calendário. O mtime do arquivo abaixo (em ns) é a "versão" dos
+    # agendamentos: as rotas que gravam tocam o arquivo e o ETag vem dele, então um
+    # refresh sem mudanças responde 304 sem abrir o banco. Sem Last-Modified: com
+    # resolução de 1 s, uma gravação no mesmo segundo passaria por "não modificado".
+    agendamentos_versao = os.path.join(instance_dir, "agendamentos.versao")
+
+    def _tocar_agendamentos():
+        with open(agendamentos_versao, "a"):
+            pass
+        os.utime(agendamentos_versao)
+
+    if not os.path.exists(agendamentos_versao):
+        _tocar_agendamentos()
+
+    _BRL = str.maketrans({",": ".", ".": ","})
+
+    def _brl(valor):
+        return f"{valor:,.2f}".translate(_BRL)
+
+    def _parse_janela(valor):
+        # FullCalendar manda ISO com fuso (ex.: 2025-01-01T00:00:00-03:00); o banco guarda hora local sem fuso
+        return datetime.fromisoformat(valor.replace("Z", "+00:00")).replace(tzinfo=None)
+
+    def _sem_cache(resp, etag):
+        resp.set_etag(etag)
+        resp.headers["Cache-Control"] = "private, no-cache"
+        return resp
+
     @app.get("/api/agendamentos")
-    @login_required
     def api_scheduled():
-        rides = db.session.query(ScheduledRide).order_by(ScheduledRide.start_dt.asc()).all()
+        try:
+            hoje = datetime.combine(date.today(), datetime.min.time())
+            inicio = _parse_janela(request.args["start"]) if request.args.get("start") else hoje - timedelta(days=31)
+            fim = _parse_janela(request.args["end"]) if request.args.get("end") else hoje + timedelta(days=62)
+        except ValueError:
+            return jsonify(error="start/end inválidos"), 400
+
+        etag = f"{os.stat(agendamentos_versao).st_mtime_ns:x}-{inicio:%Y%m%d%H%M}-{fim:%Y%m%d%H%M}"
+        # 304 antes do login_required, que carrega o usuário do banco: basta a
+        # sessão assinada ter um usuário (quem tem o ETag já recebeu o corpo logado)
+        if session.get("_user_id") and request.if_none_match.contains(etag):
+            return _sem_cache(app.response_class(status=304), etag)
+        return _agendamentos(inicio, fim, etag)
+
+    @login_required
+    def _agendamentos(inicio, fim, etag):
+        SR = ScheduledRide
+        rows = db.session.execute(
+            db.select(SR.id, SR.title, SR.start_dt, SR.end_dt, SR.hours_planned, SR.expected_block_pay, SR.tips)
+            .where(SR.start_dt >= inicio, SR.start_dt < fim)
+            .order_by(SR.start_dt.asc())
+        ).all()
+
         def event_title(r):
             parts = [r.title or "Corrida"]
             if r.end_dt:
@@ -272,61 +349,92 @@ def create_app():
             if dur:
                 parts.append(f"{dur:.1f}h")
             if r.expected_block_pay:
-                parts.append(f"R$ {r.expected_block_pay:,.2f}".replace(',', 'X').replace('.', ',').replace('X','.'))
+                parts.append(f"R$ {_brl(r.expected_block_pay)}")
             if r.tips:
-                parts.append(f"+ gorj R$ {r.tips:,.2f}".replace(',', 'X').replace('.', ',').replace('X','.'))
+                parts.append(f"+ gorj R$ {_brl(r.tips)}")
             return " • ".join(parts)
-        return jsonify([{
+
+        resp = jsonify([{
             "id": r.id,
             "title": event_title(r),
             "start": r.start_dt.isoformat(),
             "end": r.end_dt.isoformat() if r.end_dt else None,
-        } for r in rides])
+        } for r in rows])
+        return _sem_cache(resp, etag)
 
     # ----------- Relatórios + PDF + Líquido -----------
+    # Linhas lidas por vez ao listar o relatório (HTML em streaming e PDF)
+    RELATORIO_LOTE = 500
+
     def _calc_report(inicio, fim):
-        items, totais = [], dict(horas=0.0, km=0.0, valor=0.0, tips=0.0, combustivel=0.0, despesas=0.0, qtd=0, liquido=0.0)
+        """Totais do período numa consulta e um gerador com as linhas (não monta lista).
+
+        Duração (julianday) e km (diferença do odômetro) são calculados no SQLite.
+        """
         dt_ini = datetime.fromisoformat(inicio)
         dt_fim = datetime.fromisoformat(fim)
-        q = db.session.query(ScheduledRide).filter(ScheduledRide.start_dt >= dt_ini, ScheduledRide.start_dt <= dt_fim).order_by(ScheduledRide.start_dt.asc())
-        for r in q.all():
-            horas = (r.end_dt - r.start_dt).total_seconds() / 3600.0 if r.end_dt else (r.hours_planned or 0.0)
-            km = 0.0
-            if r.odometer_start is not None and r.odometer_end is not None:
-                km = max(0.0, r.odometer_end - r.odometer_start)
-            valor = r.expected_block_pay or 0.0
-            tips = r.tips or 0.0
-            fuel = r.fuel_cost or 0.0
-            items.append(dict(
-                data=r.start_dt.strftime("%d/%m/%Y %H:%M"),
-                horas=horas, km=km, valor=valor, tips=tips, combustivel=fuel,
-                titulo=r.title or "Corrida", notas=r.notes or ""
-            ))
-            totais["horas"] += horas
-            totais["km"] += km
-            totais["valor"] += valor
-            totais["tips"] += tips
-            totais["combustivel"] += fuel
-            totais["qtd"] += 1
+        SR, f = ScheduledRide, db.func
+        horas = db.case(
+            (SR.end_dt.isnot(None), (f.julianday(SR.end_dt) - f.julianday(SR.start_dt)) * 24.0),
+            else_=f.coalesce(SR.hours_planned, 0.0),
+        )
+        km = db.case(
+            (db.and_(SR.odometer_start.isnot(None), SR.odometer_end.isnot(None)),
+             f.max(0.0, SR.odometer_end - SR.odometer_start)),  # max() escalar do SQLite
+            else_=0.0,
+        )
+        valor = f.coalesce(SR.expected_block_pay, 0.0)
+        tips = f.coalesce(SR.tips, 0.0)
+        fuel = f.coalesce(SR.fuel_cost, 0.0)
+        periodo = (SR.start_dt >= dt_ini, SR.start_dt <= dt_fim)
+
         # Despesas gerais (fora combustível já informado nas corridas)
-        exp_q = db.session.query(Expense).filter(Expense.exp_date >= dt_ini.date(), Expense.exp_date <= dt_fim.date())
-        despesas = sum((e.amount or 0.0) for e in exp_q.all())
-        totais["despesas"] = despesas
+        despesas = db.select(f.coalesce(f.sum(Expense.amount), 0.0)).where(
+            Expense.exp_date >= dt_ini.date(), Expense.exp_date <= dt_fim.date()
+        ).scalar_subquery()
+        t = db.session.execute(db.select(
+            f.coalesce(f.sum(horas), 0.0).label("horas"),
+            f.coalesce(f.sum(km), 0.0).label("km"),
+            f.coalesce(f.sum(valor), 0.0).label("valor"),
+            f.coalesce(f.sum(tips), 0.0).label("tips"),
+            f.coalesce(f.sum(fuel), 0.0).label("combustivel"),
+            f.count(SR.id).label("qtd"),
+            despesas.label("despesas"),
+        ).where(*periodo)).mappings().one()
+        totais = dict(t)
         totais["liquido"] = (totais["valor"] + totais["tips"]) - (totais["combustivel"] + totais["despesas"])
-        return items, totais
+
+        linhas = db.select(
+            SR.start_dt, horas.label("horas"), km.label("km"), valor.label("valor"), tips.label("tips"),
+            fuel.label("combustivel"), SR.title, SR.notes,
+        ).where(*periodo).order_by(SR.start_dt.asc()).execution_options(yield_per=RELATORIO_LOTE)
+
+        def items():
+            for r in db.session.execute(linhas):
+                yield dict(
+                    data=r.start_dt.strftime("%d/%m/%Y %H:%M"),
+                    horas=r.horas, km=r.km, valor=r.valor, tips=r.tips, combustivel=r.combustivel,
+                    titulo=r.title or "Corrida", notas=r.notes or ""
+                )
+        return items(), totais
 
     @app.route("/relatorios", methods=["GET"])
     @login_required
     def reports():
         inicio = request.values.get("inicio")
         fim = request.values.get("fim")
-        items, totais = [], dict(horas=0.0, km=0.0, valor=0.0, tips=0.0, combustivel=0.0, despesas=0.0, qtd=0, liquido=0.0)
+        items, totais = (), dict(horas=0.0, km=0.0, valor=0.0, tips=0.0, combustivel=0.0, despesas=0.0, qtd=0, liquido=0.0)
         if inicio and fim:
             try:
                 items, totais = _calc_report(inicio, fim)
             except ValueError:
                 flash("Datas inválidas.", "warning")
-        return render_template("reports.html", items=items, totais=totais, inicio=inicio, fim=fim)
+        if not totais["qtd"]:
+            return render_template("reports.html", items=(), totais=totais, inicio=inicio, fim=fim)
+        # As linhas vão sendo lidas do banco enquanto a página é enviada. As mensagens
+        # flash saem da sessão antes, pois ela é gravada junto com os cabeçalhos.
+        get_flashed_messages(with_categories=True)
+        return stream_template("reports.html", items=items, totais=totais, inicio=inicio, fim=fim)
 
     @app.get("/relatorios/pdf")
     @login_required
@@ -1,17 +1,89 @@
 \
 import os
-from flask import Blueprint, send_file, request, redirect, url_for, flash, current_app
+import sqlite3
+import tempfile
+import zlib
+from flask import Blueprint, Response, request, redirect, url_for, flash, current_app
 from werkzeug.utils import secure_filename
 from .models import db
 
 bp = Blueprint("backup", __name__, url_prefix="/backup")
 
+# Snapshot via API de backup do SQLite fora do WAL: páginas copiadas por
+# passo e pausa entre passos (cada passo segura o banco só por alguns
+# milissegundos). Uma escrita de outra conexão reinicia a cópia do zero;
+# depois de BACKUP_REINICIOS reinícios o snapshot desiste.
+BACKUP_PAGINAS = 256
+BACKUP_PAUSA = 0.005
+BACKUP_REINICIOS = 5
+CHUNK = 64 * 1024
+
+def _db_path():
+    db_uri = current_app.config["SQLALCHEMY_DATABASE_URI"]
+    assert db_uri.startswith("sqlite:///"), "Somente SQLite é suportado para backup."
+    return db_uri.replace("sqlite:///","")
+
+class BackupInterrompido(RuntimeError):
+    """O banco mudou durante a cópia mais vezes que BACKUP_REINICIOS."""
+
+def snapshot(db_path, destino):
+    """Copia o banco vivo para `destino` de forma consistente (inclui páginas ainda no WAL).
+
+    Em WAL a cópia é um passo só (pages=-1) dentro de uma transação de
+    leitura: o snapshot é fixo e os escritores seguem gravando no WAL, então
+    nada reinicia. No modo rollback um passo único travaria as escritas até
+    o fim; a cópia vai em passos e levanta BackupInterrompido se as escritas
+    de outras conexões a reiniciarem demais.
+    """
+    src = sqlite3.connect(db_path)
+    dst = sqlite3.connect(destino)
+    try:
+        if src.execute("PRAGMA journal_mode").fetchone()[0].lower() == "wal":
+            src.backup(dst, pages=-1)
+            return
+        anterior, reinicios = None, 0
+        def progresso(status, restantes, total):
+            nonlocal anterior, reinicios
+            if anterior is not None and restantes > anterior:  # recomeçou do início
+                reinicios += 1
+                if reinicios > BACKUP_REINICIOS:
+                    raise BackupInterrompido(f"backup reiniciado {reinicios} vezes por escritas concorrentes")
+            anterior = restantes
+        src.backup(dst, pages=BACKUP_PAGINAS, sleep=BACKUP_PAUSA, progress=progresso)
+    finally:
+        dst.close()
+        src.close()
+
+def _compressor(tipo):
+    """Objeto com compress()/flush() para o tipo pedido, ou None sem compressão."""
+    if tipo == "gzip":
+        return zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 = formato gzip
+    if tipo == "zstd":
+        import zstandard  # opcional: pip install zstandard
+        return zstandard.ZstdCompressor().compressobj()
+    return None
+
+def _ler_em_partes(caminho, comp):
+    with open(caminho, "rb") as f:
+        while True:
+            parte = f.read(CHUNK)
+            if not parte:
+                break
+            if comp is not None:
+                parte = comp.compress(parte)
+                if not parte:
+                    continue
+            yield parte
+    if comp is not None:
+        yield comp.flush()
+
 @bp.get("/")
 def index():
     return """
     <div style='font-family: system-ui, sans-serif; padding:20px'>
       <h2>Backup & Restore</h2>
-      <p><a href='/backup/download' class='btn btn-primary'>Baixar backup (DB)</a></p>
+      <p><a href='/backup/download' class='btn btn-primary'>Baixar backup (DB)</a>
+         · <a href='/backup/download?compressao=gzip'>compactado (.gz)</a></p>
       <form method='post' action='/backup/restore' enctype='multipart/form-data'>
         <label>Restaurar banco (.db/.sqlite):</label><br>
         <input type='file' name='dbfile' accept='.db,.sqlite' required>
@@ -23,14 +95,141 @@ def index():
 
 @bp.get("/download")
 def download():
+    """Envia um snapshot consistente do banco, em partes e opcionalmente compactado.
+
+    ?compressao=gzip ou ?compressao=zstd (este exige o pacote zstandard).
+    """
+    db_path = _db_path()
+    tipo = request.args.get("compressao") or None
+    try:
+        comp = _compressor(tipo)
+    except ImportError:
+        flash("Compressão zstd indisponível (instale o pacote zstandard).", "warning")
+        return redirect(url_for("backup.index"))
+
+    fd, tmp_path = tempfile.mkstemp(suffix=".db", dir=os.path.dirname(db_path))
+    os.close(fd)
+    try:
+        snapshot(db_path, tmp_path)
+    except BackupInterrompido as e:
+        os.remove(tmp_path)
+        return f"Backup não concluído: {e}. Tente de novo.", 503, {"Retry-After": "5"}
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+    filename = os.path.basename(db_path) + {"gzip": ".gz", "zstd": ".zst"}.get(tipo, "")
+    resp = Response(_ler_em_partes(tmp_path, comp),
+                    mimetype="application/gzip" if tipo == "gzip" else "application/octet-stream")
+    if comp is None:
+        resp.headers["Content-Length"] = str(os.path.getsize(tmp_path))
+    resp.headers["Content-Disposition"] = f"attachment; filename={filename}"
+    resp.call_on_close(lambda: os.path.exists(tmp_path) and os.remove(tmp_path))
+    return resp
+
+def _colunas_adicionaveis():
+    """{tabela: colunas} que as migrações acrescentam, dispensáveis no backup enviado."""
+    from .migracoes import COLUNAS_ADICIONADAS, COLUNAS_DERIVADAS
+    cols = {}
+    for tabela, coluna, _ in COLUNAS_ADICIONADAS + COLUNAS_DERIVADAS:
+        cols.setdefault(tabela, set()).add(coluna)
+    return cols
+
+def _salvar_upload(file, destino):
+    """Grava o upload em disco em partes, sem carregar o arquivo na memória."""
+    with open(destino, "wb") as f:
+        while True:
+            parte = file.stream.read(CHUNK)
+            if not parte:
+                break
+            f.write(parte)
+
+def validar_candidato(caminho):
+    """Lista de problemas do banco enviado (vazia = pode restaurar).
+
+    O arquivo é aberto como imutável: é só nosso e assim o SQLite não cria -wal/-shm.
+    """
+    from .models import Station, ScheduledRide, Expense
+    try:
+        conn = sqlite3.connect(f"file:{caminho}?mode=ro&immutable=1", uri=True)
+    except sqlite3.Error as e:
+        return [f"não foi possível abrir o arquivo ({e})"]
+    try:
+        resultado = [r[0] for r in conn.execute("PRAGMA integrity_check")]
+        if resultado != ["ok"]:
+            return ["integrity_check: " + "; ".join(resultado[:5])]
+        problemas = []
+        adicionaveis = _colunas_adicionaveis()
+        for model in (Station, ScheduledRide, Expense):
+            tabela = model.__tablename__
+            existentes = {r[1] for r in conn.execute(f"PRAGMA table_info({tabela})")}
+            if not existentes:
+                problemas.append(f"tabela {tabela} ausente")
+                continue
+            obrigatorias = {c.name for c in model.__table__.columns} - adicionaveis.get(tabela, set())
+            faltando = obrigatorias - existentes
+            if faltando:
+                problemas.append(f"{tabela} sem coluna(s) {', '.join(sorted(faltando))}")
+        return problemas
+    except sqlite3.DatabaseError as e:
+        return [f"arquivo não é um banco SQLite válido ({e})"]
+    finally:
+        conn.close()
+
+def _trocar_banco(candidato, db_path):
+    """Copia o candidato para o banco vivo numa única transação.
+
+    A API de backup com pages=-1 grava tudo de uma vez sob o lock de escrita
+    do SQLite: qualquer processo lê o banco antigo inteiro ou o novo inteiro.
+    Trocar o arquivo com os.replace deixaria os outros workers com o inode
+    antigo aberto e o -wal/-shm do banco anterior ao lado do novo.
+    """
+    src = sqlite3.connect(f"file:{candidato}?mode=ro&immutable=1", uri=True)
+    dst = sqlite3.connect(db_path, timeout=30)
+    try:
+        src.backup(dst, pages=-1)
+    finally:
+        dst.close()
+        src.close()
+
+# Geração do banco: restore grava <db>.geracao; cada worker compara o mtime
+# antes de cada request e recria o pool de conexões quando muda.
+_geracao_vista = {}
+
+def _geracao_path(db_path):
+    return db_path + ".geracao"
+
+def _mtime(caminho):
+    try:
+        return os.stat(caminho).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+def sinalizar_workers(db_path):
+    caminho = _geracao_path(db_path)
+    with open(caminho, "w") as f:
+        f.write(str(os.getpid()))
+    _geracao_vista[caminho] = _mtime(caminho)
+
+@bp.before_app_request
+def _verificar_geracao():
     db_uri = current_app.config["SQLALCHEMY_DATABASE_URI"]
-    assert db_uri.startswith("sqlite:///"), "Somente SQLite é suportado para backup."
-    db_path = db_uri.replace("sqlite:///","")
-    filename = os.path.basename(db_path)
-    return send_file(db_path, as_attachment=True, download_name=filename)
+    if not db_uri.startswith("sqlite:///"):
+        return
+    caminho = _geracao_path(db_uri.replace("sqlite:///",""))
+    atual = _mtime(caminho)
+    vista = _geracao_vista.setdefault(caminho, atual)
+    if atual != vista:
+        _geracao_vista[caminho] = atual
+        db.session.remove()
+        db.engine.dispose()
 
 @bp.post("/restore")
 def restore():
+    """Restaura um backup: upload em partes, validação, migração do arquivo, troca atômica e aviso aos workers."""
+    from .migracoes import migrar_arquivo
+    from . import versao
+
     file = request.files.get("dbfile")
     if not file:
         flash("Nenhum arquivo enviado.", "warning")
@@ -40,27 +239,39 @@ def restore():
         flash("Envie um arquivo .db ou .sqlite.", "warning")
         return redirect(url_for("backup.index"))
 
-    db_uri = current_app.config["SQLALCHEMY_DATABASE_URI"]
-    assert db_uri.startswith("sqlite:///"), "Somente SQLite é suportado para restore."
-    db_path = db_uri.replace("sqlite:///","")
+    db_path = _db_path()
+    fd, tmp_path = tempfile.mkstemp(suffix=".uploading", dir=os.path.dirname(db_path))
+    os.close(fd)
+    try:
+        _salvar_upload(file, tmp_path)
+        problemas = validar_candidato(tmp_path)
+        if problemas:
+            flash("Backup recusado: " + "; ".join(problemas), "danger")
+            return redirect(url_for("backup.index"))
+        # Colunas/índices/resumo que o backup possa não ter entram no arquivo
+        # enviado; se a migração falhar o banco vivo continua intacto
+        try:
+            migrar_arquivo(tmp_path)
+        except Exception as e:
+            current_app.logger.exception("migração do backup enviado falhou")
+            flash(f"Backup recusado: a atualização do schema falhou ({e}).", "danger")
+            return redirect(url_for("backup.index"))
 
-    # Salva em temporário e troca
-    tmp_path = db_path + ".uploading"
-    file.save(tmp_path)
+        versao_anterior = versao.atual()
+        db.session.remove()
+        _trocar_banco(tmp_path, db_path)
+    finally:
+        for sufixo in ("", "-wal", "-shm"):
+            if os.path.exists(tmp_path + sufixo):
+                os.remove(tmp_path + sufixo)
 
-    # Fecha conexões pendentes
-    db.session.close()
+    # Este worker e os demais passam a abrir conexões novas
     db.engine.dispose()
+    sinalizar_workers(db_path)
 
-    # Troca o arquivo
-    os.replace(tmp_path, db_path)
-
-    # Opcional: revalidar schema (caso a estrutura esteja atrás/à frente)
-    try:
-        from .models import ensure_schema
-        ensure_schema()
-    except Exception:
-        pass
+    # Invalida os caches (a versão do backup pode ser menor que a do banco substituído)
+    versao.avancar_alem(versao_anterior)
+    db.session.commit()
 
     flash("Backup restaurado com sucesso! Os dados já estão ativos.", "success")
     return redirect(url_for("backup.index"))
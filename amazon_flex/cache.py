@@ -0,0 +1,139 @@
+"""Cache de resultados dos relatórios, chaveado pela versão dos dados.
+
+A chave é (endpoint, inicio, fim, station_id, versao_dados). Como toda
+alteração em corridas, despesas ou estações sobe a versão (ver
+amazon_flex.versao), uma entrada nunca fica desatualizada: ela só deixa de
+ser pedida e sai pelo LRU. Com RELATORIO_CACHE_DIR configurado, os
+resultados também vão para disco e são compartilhados entre os workers.
+"""
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+from flask import current_app
+
+_AUSENTE = object()
+
+
+class LRU:
+    """Dicionário limitado a `tamanho` entradas; a menos usada recentemente sai primeiro."""
+
+    def __init__(self, tamanho):
+        self.tamanho = tamanho
+        self._dados = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, chave, padrao=None):
+        with self._lock:
+            try:
+                self._dados.move_to_end(chave)
+            except KeyError:
+                return padrao
+            return self._dados[chave]
+
+    def set(self, chave, valor):
+        if self.tamanho <= 0:
+            return
+        with self._lock:
+            self._dados[chave] = valor
+            self._dados.move_to_end(chave)
+            while len(self._dados) > self.tamanho:
+                self._dados.popitem(last=False)
+
+    def limpar(self):
+        with self._lock:
+            self._dados.clear()
+
+    def __len__(self):
+        return len(self._dados)
+
+
+class CacheDisco:
+    """Um arquivo pickle por chave; grava em temporário e publica com os.replace."""
+
+    def __init__(self, diretorio, maximo):
+        self.diretorio = diretorio
+        self.maximo = maximo
+        os.makedirs(diretorio, exist_ok=True)
+
+    def _arquivo(self, chave):
+        return os.path.join(self.diretorio, hashlib.sha1(repr(chave).encode()).hexdigest() + ".pkl")
+
+    def get(self, chave, padrao=None):
+        try:
+            with open(self._arquivo(chave), "rb") as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return padrao
+
+    def set(self, chave, valor):
+        fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=self.diretorio)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(valor, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self._arquivo(chave))
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return
+        self._podar()
+
+    def _podar(self):
+        arquivos = [os.path.join(self.diretorio, n) for n in os.listdir(self.diretorio) if n.endswith(".pkl")]
+        if len(arquivos) <= self.maximo:
+            return
+        arquivos.sort(key=os.path.getmtime)
+        for velho in arquivos[:len(arquivos) - self.maximo]:
+            try:
+                os.remove(velho)
+            except OSError:
+                pass
+
+
+class CacheRelatorios:
+    def __init__(self, tamanho, diretorio=None, maximo_disco=500):
+        self.memoria = LRU(tamanho)
+        self.disco = CacheDisco(diretorio, maximo_disco) if diretorio else None
+        self.acertos = 0
+        self.falhas = 0
+
+    def obter(self, chave, calcular):
+        valor = self.memoria.get(chave, _AUSENTE)
+        if valor is _AUSENTE and self.disco is not None:
+            valor = self.disco.get(chave, _AUSENTE)
+            if valor is not _AUSENTE:
+                self.memoria.set(chave, valor)
+        if valor is not _AUSENTE:
+            self.acertos += 1
+            return valor
+        self.falhas += 1
+        valor = calcular()
+        self.memoria.set(chave, valor)
+        if self.disco is not None:
+            self.disco.set(chave, valor)
+        return valor
+
+    def estatisticas(self):
+        return {"itens": len(self.memoria), "acertos": self.acertos, "falhas": self.falhas,
+                "disco": self.disco.diretorio if self.disco else None}
+
+
+def init_app(app):
+    app.config.setdefault("RELATORIO_CACHE_TAMANHO", int(os.getenv("RELATORIO_CACHE_TAMANHO", "128")))
+    app.config.setdefault("RELATORIO_CACHE_DIR", os.getenv("RELATORIO_CACHE_DIR", ""))
+    app.config.setdefault("RELATORIO_CACHE_DISCO_MAX", int(os.getenv("RELATORIO_CACHE_DISCO_MAX", "500")))
+    diretorio = app.config["RELATORIO_CACHE_DIR"]
+    if diretorio and not os.path.isabs(diretorio):
+        diretorio = os.path.join(app.instance_path, diretorio)
+    app.extensions["cache_relatorios"] = CacheRelatorios(
+        app.config["RELATORIO_CACHE_TAMANHO"], diretorio or None, app.config["RELATORIO_CACHE_DISCO_MAX"],
+    )
+
+
+def em_cache(endpoint, inicio, fim, station_id, calcular):
+    """Resultado de `calcular()` para o período, reaproveitado enquanto a versão dos dados não muda."""
+    from .versao import atual
+    chave = (endpoint, inicio.isoformat(), fim.isoformat(), str(station_id) if station_id else None, atual())
+    return current_app.extensions["cache_relatorios"].obter(chave, calcular)
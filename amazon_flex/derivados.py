@@ -0,0 +1,131 @@
+"""Colunas derivadas de ScheduledRide: receita_total, despesas_vinculadas, lucro e custo_milha.
+
+receita_total = valor + gorjeta; despesas_vinculadas = soma das despesas da
+corrida; lucro = receita_total - despesas_vinculadas; custo_milha =
+despesas_vinculadas / distance_miles (0 sem milhas). Gravadas na própria
+linha para listar e ordenar corridas por lucro sem JOIN com expenses.
+
+Mapper events mantêm os valores: a corrida recalcula os seus ao ser gravada
+e cada despesa inserida, excluída ou alterada ajusta a corrida com um UPDATE
+na mesma transação. Inserções em massa (importação) usam iniciais() e
+somar_despesas(); recalcular() refaz tudo a partir das tabelas.
+"""
+import click
+from sqlalchemy import event, update, select, func, case, bindparam
+from sqlalchemy.orm import Session, object_session, attributes
+from .models import db, ScheduledRide, Expense
+
+CAMPOS = ("receita_total", "despesas_vinculadas", "lucro", "custo_milha")
+_EXPIRAR = "derivados_corridas_alteradas"
+
+_t = ScheduledRide.__table__
+
+
+def iniciais(row):
+    """Derivados de uma corrida nova (ainda sem despesas), para INSERT em massa."""
+    receita = (row.get("valor") or 0.0) + (row.get("gorjeta") or 0.0)
+    return {"receita_total": receita, "despesas_vinculadas": 0.0, "lucro": receita, "custo_milha": 0.0}
+
+
+def _custo_milha(despesas, milhas):
+    return case((milhas > 0, despesas / milhas), else_=0.0)
+
+
+@event.listens_for(ScheduledRide, "before_insert")
+def _corrida_nova(mapper, connection, target):
+    for campo, valor in iniciais({"valor": target.valor, "gorjeta": target.gorjeta}).items():
+        setattr(target, campo, valor)
+
+
+@event.listens_for(ScheduledRide, "before_update")
+def _corrida_alterada(mapper, connection, target):
+    if not any(attributes.get_history(target, c).has_changes() for c in ("valor", "gorjeta", "distance_miles")):
+        return
+    # As despesas podem ter mudado por UPDATE direto: usa o valor da linha
+    receita = (target.valor or 0.0) + (target.gorjeta or 0.0)
+    milhas = target.distance_miles or 0.0
+    target.receita_total = receita
+    target.lucro = receita - _t.c.despesas_vinculadas
+    target.custo_milha = _t.c.despesas_vinculadas / milhas if milhas > 0 else 0.0
+
+
+def _ajustar(connection, ride_id, delta, sessao):
+    despesas = _t.c.despesas_vinculadas + delta
+    connection.execute(update(_t).where(_t.c.id == ride_id).values(
+        despesas_vinculadas=despesas,
+        lucro=_t.c.receita_total - despesas,
+        custo_milha=_custo_milha(despesas, _t.c.distance_miles),
+    ))
+    if sessao is not None:
+        sessao.info.setdefault(_EXPIRAR, set()).add(ride_id)
+
+
+@event.listens_for(Expense, "after_insert")
+def _despesa_nova(mapper, connection, target):
+    if target.ride_id:
+        _ajustar(connection, target.ride_id, target.valor or 0.0, object_session(target))
+
+
+@event.listens_for(Expense, "after_delete")
+def _despesa_excluida(mapper, connection, target):
+    if target.ride_id:
+        _ajustar(connection, target.ride_id, -(target.valor or 0.0), object_session(target))
+
+
+@event.listens_for(Expense, "after_update")
+def _despesa_alterada(mapper, connection, target):
+    h_ride = attributes.get_history(target, "ride_id")
+    h_valor = attributes.get_history(target, "valor")
+    if not (h_ride.has_changes() or h_valor.has_changes()):
+        return
+    antigo_ride = h_ride.deleted[0] if h_ride.deleted else target.ride_id
+    antigo_valor = h_valor.deleted[0] if h_valor.deleted else target.valor
+    sessao = object_session(target)
+    if antigo_ride:
+        _ajustar(connection, antigo_ride, -(antigo_valor or 0.0), sessao)
+    if target.ride_id:
+        _ajustar(connection, target.ride_id, target.valor or 0.0, sessao)
+
+
+@event.listens_for(Session, "after_flush_postexec")
+def _expirar_corridas(session, flush_context):
+    # Corridas carregadas nesta sessão relêem os derivados no próximo acesso
+    for ride_id in session.info.pop(_EXPIRAR, ()):
+        ride = session.identity_map.get(session.identity_key(ScheduledRide, ride_id))
+        if ride is not None:
+            session.expire(ride, CAMPOS)
+
+
+def somar_despesas(deltas):
+    """Aplica {ride_id: soma das despesas novas} com um UPDATE em executemany (sem commit)."""
+    if not deltas:
+        return
+    despesas = _t.c.despesas_vinculadas + bindparam("b_delta")
+    stmt = update(_t).where(_t.c.id == bindparam("b_id")).values(
+        despesas_vinculadas=despesas,
+        lucro=_t.c.receita_total - despesas,
+        custo_milha=_custo_milha(despesas, _t.c.distance_miles),
+    )
+    db.session.connection().execute(stmt, [{"b_id": k, "b_delta": v} for k, v in deltas.items()])
+
+
+def recalcular(conn=None):
+    """Recalcula os derivados de todas as corridas com dois UPDATE (sem commit)."""
+    conn = conn if conn is not None else db.session.connection()
+    e = Expense.__table__
+    soma = select(func.coalesce(func.sum(e.c.valor), 0.0)).where(e.c.ride_id == _t.c.id).scalar_subquery()
+    conn.execute(update(_t).values(receita_total=_t.c.valor + _t.c.gorjeta, despesas_vinculadas=soma))
+    return conn.execute(update(_t).values(
+        lucro=_t.c.receita_total - _t.c.despesas_vinculadas,
+        custo_milha=_custo_milha(_t.c.despesas_vinculadas, _t.c.distance_miles),
+    )).rowcount
+
+
+@click.command("recalcular-derivados")
+def recalcular_cmd():
+    """Recalcula receita_total, despesas_vinculadas, lucro e custo_milha das corridas."""
+    from .versao import incrementar
+    n = recalcular()
+    incrementar()
+    db.session.commit()
+    click.echo(f"derivados recalculados: {n} corrida(s).")
@@ -0,0 +1,217 @@
+"""Importação em massa de corridas e despesas a partir de CSV.
+
+Corridas usam o mesmo layout do export (/relatorios/csv):
+id,inicio,fim,horas,valor,gorjeta,milhas,estacao,exclude_from_reports
+(a coluna id é ignorada; horas vazia é calculada a partir de inicio/fim).
+Despesas: data,descricao,valor,ride_id.
+
+O arquivo é lido linha a linha; as linhas válidas são inseridas em lotes de
+IMPORT_LOTE com executemany, tudo numa transação só. Com erros, nada é
+gravado, a menos que ignorar_erros=True (aí só as linhas válidas entram).
+resumo_diario e a versão dos dados são atualizados no fim, de uma vez; as
+colunas derivadas das corridas (amazon_flex.derivados) a cada lote.
+"""
+import csv
+from collections import namedtuple
+from datetime import datetime
+import click
+from sqlalchemy import insert, select
+from .models import db, ScheduledRide, Expense, Station
+from . import resumo, versao, derivados
+
+IMPORT_LOTE = 1000
+
+CAMPOS_CORRIDAS = ("inicio", "fim", "horas", "valor", "gorjeta", "milhas", "estacao", "exclude_from_reports")
+CAMPOS_DESPESAS = ("data", "descricao", "valor", "ride_id")
+
+Resultado = namedtuple("Resultado", "inseridas erros")
+
+
+class LinhaInvalida(ValueError):
+    pass
+
+
+def _numero(linha, campo):
+    texto = (linha.get(campo) or "").strip()
+    if not texto:
+        return 0.0
+    try:
+        valor = float(texto)
+    except ValueError:
+        raise LinhaInvalida(f"{campo}: número inválido ({texto!r})")
+    if valor < 0:
+        raise LinhaInvalida(f"{campo}: não pode ser negativo")
+    return valor
+
+
+def _data_hora(linha, campo):
+    texto = (linha.get(campo) or "").strip()
+    if not texto:
+        raise LinhaInvalida(f"{campo}: obrigatório")
+    try:
+        return datetime.fromisoformat(texto)
+    except ValueError:
+        raise LinhaInvalida(f"{campo}: data inválida ({texto!r})")
+
+
+def _booleano(texto):
+    return (texto or "").strip().lower() in ("1", "true", "sim", "s", "yes")
+
+
+def _leitor(arquivo, campos):
+    leitor = csv.DictReader(arquivo)
+    faltando = [c for c in campos if c not in (leitor.fieldnames or [])]
+    if faltando:
+        raise LinhaInvalida("cabeçalho sem as colunas: " + ", ".join(faltando))
+    return leitor
+
+
+def _corrida(linha, estacoes):
+    inicio = _data_hora(linha, "inicio")
+    fim = _data_hora(linha, "fim")
+    if fim <= inicio:
+        raise LinhaInvalida("fim deve ser depois do início")
+    nome = (linha.get("estacao") or "").strip()
+    if nome and nome not in estacoes:
+        raise LinhaInvalida(f"estação desconhecida: {nome!r}")
+    horas = _numero(linha, "horas") if (linha.get("horas") or "").strip() else round((fim - inicio).total_seconds()/3600.0, 2)
+    row = {
+        "inicio": inicio, "fim": fim, "horas": horas,
+        "valor": _numero(linha, "valor"), "gorjeta": _numero(linha, "gorjeta"),
+        "distance_miles": _numero(linha, "milhas"),
+        "station_id": estacoes[nome] if nome else None,
+        "exclude_from_reports": _booleano(linha.get("exclude_from_reports")),
+    }
+    row.update(derivados.iniciais(row))
+    return row
+
+
+def importar_corridas(arquivo, ignorar_erros=False):
+    """Importa corridas de um arquivo texto CSV aberto. Faz commit (ou rollback se houver erros)."""
+    try:
+        leitor = _leitor(arquivo, CAMPOS_CORRIDAS)
+    except LinhaInvalida as e:
+        return Resultado(0, [(1, str(e))])
+    estacoes = dict(db.session.execute(select(Station.nome, Station.id)).all())
+
+    erros, lote, inseridas = [], [], 0
+    deltas = {}
+    for n, linha in enumerate(leitor, start=2):
+        try:
+            row = _corrida(linha, estacoes)
+        except LinhaInvalida as e:
+            erros.append((n, str(e)))
+            continue
+        lote.append(row)
+        if not row["exclude_from_reports"]:
+            d = deltas.setdefault((row["inicio"].date(), row["fim"].date(), row["station_id"] or 0),
+                                  {"valor": 0.0, "gorjeta": 0.0, "distance_miles": 0.0, "horas": 0.0, "qtd": 0})
+            for campo in ("valor", "gorjeta", "distance_miles", "horas"):
+                d[campo] += row[campo]
+            d["qtd"] += 1
+        if len(lote) >= IMPORT_LOTE:
+            db.session.execute(insert(ScheduledRide), lote)
+            inseridas += len(lote)
+            lote = []
+    if lote:
+        db.session.execute(insert(ScheduledRide), lote)
+        inseridas += len(lote)
+    return _concluir(inseridas, erros, ignorar_erros, deltas)
+
+
+def importar_despesas(arquivo, ignorar_erros=False):
+    """Importa despesas (data,descricao,valor,ride_id); ride_id tem de existir."""
+    try:
+        leitor = _leitor(arquivo, CAMPOS_DESPESAS)
+    except LinhaInvalida as e:
+        return Resultado(0, [(1, str(e))])
+
+    erros, inseridas = [], 0
+    deltas = {}
+
+    def gravar(lote):
+        # Corridas referenciadas pelo lote numa consulta só
+        ids = {row["ride_id"] for _, row in lote if row["ride_id"]}
+        corridas = {r.id: r for r in db.session.execute(
+            select(ScheduledRide.id, ScheduledRide.inicio, ScheduledRide.fim,
+                   ScheduledRide.station_id, ScheduledRide.exclude_from_reports)
+            .where(ScheduledRide.id.in_(ids)))} if ids else {}
+        validas, por_corrida = [], {}
+        for n, row in lote:
+            ride = corridas.get(row["ride_id"])
+            if row["ride_id"] and ride is None:
+                erros.append((n, f"ride_id {row['ride_id']} não existe"))
+                continue
+            validas.append(row)
+            if ride is not None:
+                por_corrida[ride.id] = por_corrida.get(ride.id, 0.0) + row["valor"]
+            dia = row["data"].date()
+            deltas.setdefault((dia, dia, 0), {}).setdefault("despesas", 0.0)
+            deltas[(dia, dia, 0)]["despesas"] += row["valor"]
+            if ride is not None and not ride.exclude_from_reports:
+                chave = (ride.inicio.date(), ride.fim.date(), ride.station_id or 0)
+                d = deltas.setdefault(chave, {})
+                d["despesas_vinculadas"] = d.get("despesas_vinculadas", 0.0) + row["valor"]
+        if validas:
+            db.session.execute(insert(Expense), validas)
+            derivados.somar_despesas(por_corrida)
+        return len(validas)
+
+    lote = []
+    for n, linha in enumerate(leitor, start=2):
+        try:
+            ride_id = (linha.get("ride_id") or "").strip()
+            if ride_id and not ride_id.isdigit():
+                raise LinhaInvalida(f"ride_id inválido ({ride_id!r})")
+            row = {
+                "data": _data_hora(linha, "data"),
+                "descricao": (linha.get("descricao") or "").strip() or None,
+                "valor": _numero(linha, "valor"),
+                "ride_id": int(ride_id) if ride_id else None,
+            }
+        except LinhaInvalida as e:
+            erros.append((n, str(e)))
+            continue
+        lote.append((n, row))
+        if len(lote) >= IMPORT_LOTE:
+            inseridas += gravar(lote)
+            lote = []
+    if lote:
+        inseridas += gravar(lote)
+    erros.sort()
+    return _concluir(inseridas, erros, ignorar_erros, deltas)
+
+
+def _concluir(inseridas, erros, ignorar_erros, deltas):
+    if erros and not ignorar_erros:
+        db.session.rollback()
+        return Resultado(0, erros)
+    resumo.somar_lote(deltas)
+    if inseridas:
+        versao.incrementar()
+    db.session.commit()
+    return Resultado(inseridas, erros)
+
+
+def _relatar(resultado):
+    for n, msg in resultado.erros:
+        click.echo(f"linha {n}: {msg}", err=True)
+    click.echo(f"{resultado.inseridas} linha(s) importada(s), {len(resultado.erros)} erro(s).")
+    if resultado.erros and not resultado.inseridas:
+        raise SystemExit(1)
+
+
+@click.command("import-rides")
+@click.argument("arquivo", type=click.File("r", encoding="utf-8-sig"))
+@click.option("--ignorar-erros", is_flag=True, help="Grava as linhas válidas mesmo com erros nas demais.")
+def importar_corridas_cmd(arquivo, ignorar_erros):
+    """Importa corridas de um CSV no layout do export de relatórios."""
+    _relatar(importar_corridas(arquivo, ignorar_erros))
+
+
+@click.command("import-expenses")
+@click.argument("arquivo", type=click.File("r", encoding="utf-8-sig"))
+@click.option("--ignorar-erros", is_flag=True, help="Grava as linhas válidas mesmo com erros nas demais.")
+def importar_despesas_cmd(arquivo, ignorar_erros):
+    """Importa despesas de um CSV (data,descricao,valor,ride_id)."""
+    _relatar(importar_despesas(arquivo, ignorar_erros))
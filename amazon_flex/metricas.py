@@ -0,0 +1,165 @@
+"""Métricas de desempenho por request, exportadas em formato Prometheus (/metricas).
+
+Para cada endpoint: histograma de latência, requests por status, quantidade
+e tempo total de SQL (eventos before/after_cursor_execute do engine) e tempo
+de renderização por template. Consultas acima de SQL_LENTO_MS vão para o log
+"amazon_flex.sql_lento" com o endpoint que as disparou.
+
+A latência vai do before_request ao fechamento da resposta
+(call_on_close), então respostas em streaming (CSV, relatório) contam o
+envio do corpo inteiro e não só a montagem do gerador.
+
+Os números são do processo: com vários workers, cada scrape vê um worker
+(o rótulo pid identifica qual). O módulo só depende de Flask e SQLAlchemy:
+o app raiz usa o mesmo registro em /metrics, com o engine dele.
+"""
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from flask import g, has_request_context, request, template_rendered, before_render_template
+from sqlalchemy import event
+
+# Limites do histograma de latência (s)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+log_lento = logging.getLogger("amazon_flex.sql_lento")
+
+
+class Registro:
+    """Contadores do processo, protegidos por um lock."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencia = defaultdict(lambda: [0] * (len(BUCKETS) + 1))  # endpoint -> contagem por bucket (+Inf)
+        self.latencia_soma = defaultdict(float)
+        self.requests = defaultdict(int)        # (endpoint, status) -> n
+        self.sql_n = defaultdict(int)           # endpoint -> comandos
+        self.sql_tempo = defaultdict(float)     # endpoint -> s
+        self.sql_lentas = defaultdict(int)
+        self.template_n = defaultdict(int)      # template -> renders
+        self.template_tempo = defaultdict(float)
+
+    def observar_request(self, endpoint, status, duracao):
+        with self.lock:
+            contagens = self.latencia[endpoint]
+            for i, limite in enumerate(BUCKETS):
+                if duracao <= limite:
+                    contagens[i] += 1
+                    break
+            else:
+                contagens[-1] += 1
+            self.latencia_soma[endpoint] += duracao
+            self.requests[(endpoint, status)] += 1
+
+    def observar_sql(self, endpoint, duracao, lenta):
+        with self.lock:
+            self.sql_n[endpoint] += 1
+            self.sql_tempo[endpoint] += duracao
+            if lenta:
+                self.sql_lentas[endpoint] += 1
+
+    def observar_template(self, nome, duracao):
+        with self.lock:
+            self.template_n[nome] += 1
+            self.template_tempo[nome] += duracao
+
+    def prometheus(self):
+        pid = os.getpid()
+        linhas = []
+
+        def rot(**kw):
+            kw["pid"] = pid
+            return "{" + ",".join(f'{k}="{_escapar(v)}"' for k, v in kw.items()) + "}"
+
+        with self.lock:
+            linhas += ["# HELP http_request_duration_seconds Latência dos requests por endpoint.",
+                       "# TYPE http_request_duration_seconds histogram"]
+            for endpoint, contagens in sorted(self.latencia.items()):
+                acumulado = 0
+                for limite, n in zip(BUCKETS + ("+Inf",), contagens):
+                    acumulado += n
+                    linhas.append(f"http_request_duration_seconds_bucket{rot(endpoint=endpoint, le=limite)} {acumulado}")
+                linhas.append(f"http_request_duration_seconds_sum{rot(endpoint=endpoint)} {self.latencia_soma[endpoint]:.6f}")
+                linhas.append(f"http_request_duration_seconds_count{rot(endpoint=endpoint)} {acumulado}")
+
+            linhas += ["# HELP http_requests_total Requests por endpoint e status.", "# TYPE http_requests_total counter"]
+            for (endpoint, status), n in sorted(self.requests.items()):
+                linhas.append(f"http_requests_total{rot(endpoint=endpoint, status=status)} {n}")
+
+            linhas += ["# HELP sql_statements_total Comandos SQL executados por endpoint.", "# TYPE sql_statements_total counter"]
+            linhas += [f"sql_statements_total{rot(endpoint=e)} {n}" for e, n in sorted(self.sql_n.items())]
+            linhas += ["# HELP sql_duration_seconds_total Tempo em SQL por endpoint.", "# TYPE sql_duration_seconds_total counter"]
+            linhas += [f"sql_duration_seconds_total{rot(endpoint=e)} {t:.6f}" for e, t in sorted(self.sql_tempo.items())]
+            linhas += ["# HELP sql_slow_statements_total Comandos acima de SQL_LENTO_MS.", "# TYPE sql_slow_statements_total counter"]
+            linhas += [f"sql_slow_statements_total{rot(endpoint=e)} {n}" for e, n in sorted(self.sql_lentas.items())]
+
+            linhas += ["# HELP template_render_seconds Tempo de renderização por template.", "# TYPE template_render_seconds summary"]
+            for nome, n in sorted(self.template_n.items()):
+                linhas.append(f"template_render_seconds_sum{rot(template=nome)} {self.template_tempo[nome]:.6f}")
+                linhas.append(f"template_render_seconds_count{rot(template=nome)} {n}")
+        return "\n".join(linhas) + "\n"
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _endpoint():
+    if not has_request_context():
+        return "fora_de_request"
+    return request.endpoint or "sem_rota"
+
+
+def init_app(app, engine, caminho="/metricas"):
+    """Liga os hooks de request/SQL/template em `app` e registra a rota de exportação."""
+    app.config.setdefault("SQL_LENTO_MS", float(os.getenv("SQL_LENTO_MS", "200")))
+    registro = Registro()
+    app.extensions["metricas"] = registro
+
+    @app.before_request
+    def _inicio():
+        g.metricas_t0 = time.perf_counter()
+
+    @app.after_request
+    def _fim(resp):
+        t0 = g.get("metricas_t0")
+        if t0 is not None:
+            endpoint, status = _endpoint(), resp.status_code
+            resp.call_on_close(lambda: registro.observar_request(endpoint, status, time.perf_counter() - t0))
+        return resp
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _sql_inicio(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metricas_t0", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _sql_fim(conn, cursor, statement, parameters, context, executemany):
+        pilha = conn.info.get("metricas_t0")
+        if not pilha:
+            return
+        duracao = time.perf_counter() - pilha.pop()
+        endpoint = _endpoint()
+        lenta = duracao * 1000 >= app.config["SQL_LENTO_MS"]
+        registro.observar_sql(endpoint, duracao, lenta)
+        if lenta:
+            log_lento.warning("%.1f ms em %s: %s", duracao * 1000, endpoint, " ".join(statement.split())[:500])
+
+    def _template_inicio(sender, template, context, **extra):
+        if has_request_context():
+            g.setdefault("metricas_templates", []).append(time.perf_counter())
+
+    def _template_fim(sender, template, context, **extra):
+        pilha = g.get("metricas_templates") if has_request_context() else None
+        if pilha:
+            registro.observar_template(template.name or "?", time.perf_counter() - pilha.pop())
+
+    before_render_template.connect(_template_inicio, app, weak=False)
+    template_rendered.connect(_template_fim, app, weak=False)
+
+    @app.get(caminho, endpoint="metricas")
+    def metricas():
+        return registro.prometheus(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+    return registro
@@ -0,0 +1,202 @@
+"""Migrações versionadas do schema (tabela schema_version).
+
+No boot cada worker faz uma única consulta (a maior versão aplicada); se o
+banco já está na última, nada mais acontece, independente do tamanho do
+schema. Com migrações pendentes, o worker pega o lock de escrita do SQLite
+(BEGIN IMMEDIATE), relê a versão (outro worker pode ter acabado de migrar) e
+aplica as que faltam na mesma transação, registrando cada uma.
+
+schema_version é compartilhada pelos apps que usam o mesmo arquivo, separada
+pela coluna app. As migrações são idempotentes: um banco anterior a este
+controle passa por todas e fica registrado.
+
+executar() só depende do SQLAlchemy (recebe uma Session): o app raiz, que não
+usa Flask-SQLAlchemy, roda as migrações dele por aqui (schema.py).
+"""
+import time
+from datetime import datetime
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+# Tempo máximo esperando outro worker terminar de migrar (s)
+ESPERA_LOCK = 60
+
+CRIAR_TABELA = """
+CREATE TABLE IF NOT EXISTS schema_version (
+    app VARCHAR(40) NOT NULL,
+    versao INTEGER NOT NULL,
+    descricao VARCHAR(200),
+    aplicada_em DATETIME,
+    PRIMARY KEY (app, versao)
+)"""
+
+
+def versao_atual(sessao, app):
+    try:
+        return sessao.execute(text("SELECT max(versao) FROM schema_version WHERE app = :app"), {"app": app}).scalar() or 0
+    except OperationalError:  # tabela ainda não existe
+        sessao.rollback()
+        return 0
+
+
+def colunas(conn, tabela):
+    """Colunas existentes (só usado dentro das migrações)."""
+    return {r[1] for r in conn.exec_driver_sql(f"PRAGMA table_info({tabela})")}
+
+
+def adicionar_colunas(conn, lista):
+    """ALTER TABLE ADD COLUMN para cada (tabela, coluna, ddl) que ainda não existe."""
+    existentes = {}
+    for tabela, coluna, ddl in lista:
+        if tabela not in existentes:
+            existentes[tabela] = colunas(conn, tabela)
+        if coluna not in existentes[tabela]:
+            conn.exec_driver_sql(f"ALTER TABLE {tabela} ADD COLUMN {coluna} {ddl}")
+            existentes[tabela].add(coluna)
+
+
+def criar_indices(conn, nomes):
+    """CREATE INDEX IF NOT EXISTS para cada índice declarado nos models, pelo nome.
+
+    Pelo nome, e não por model.__table__.indexes: uma migração antiga não
+    pode criar índices sobre colunas que só migrações posteriores acrescentam.
+    """
+    from .models import db
+    indices = {idx.name: idx for tabela in db.metadata.tables.values() for idx in tabela.indexes}
+    for nome in nomes:
+        indices[nome].create(bind=conn, checkfirst=True)
+
+
+def _travar(sessao):
+    limite = time.monotonic() + ESPERA_LOCK
+    while True:
+        try:
+            sessao.execute(text("BEGIN IMMEDIATE"))
+            return
+        except OperationalError as e:
+            sessao.rollback()
+            if "locked" not in str(e) or time.monotonic() > limite:
+                raise
+            time.sleep(0.2)
+
+
+def executar(sessao, app, migracoes):
+    """Aplica as `migracoes` [(numero, descricao, funcao(conn)), ...] pendentes de `app`.
+
+    `sessao` é uma Session do SQLAlchemy (db.session nos apps Flask-SQLAlchemy).
+    Retorna a lista de números aplicados (vazia no caso comum).
+    """
+    ultima = migracoes[-1][0]
+    if versao_atual(sessao, app) >= ultima:
+        sessao.rollback()  # encerra a transação de leitura
+        return []
+
+    sessao.rollback()
+    _travar(sessao)
+    try:
+        conn = sessao.connection()
+        conn.exec_driver_sql(CRIAR_TABELA)
+        atual = versao_atual(sessao, app)
+        aplicadas = []
+        for numero, descricao, funcao in migracoes:
+            if numero <= atual:
+                continue
+            funcao(conn)
+            conn.execute(text("INSERT INTO schema_version (app, versao, descricao, aplicada_em) VALUES (:a, :v, :d, :t)"),
+                         {"a": app, "v": numero, "d": descricao, "t": datetime.utcnow()})
+            aplicadas.append(numero)
+        sessao.commit()
+        return aplicadas
+    except Exception:
+        sessao.rollback()
+        raise
+
+
+# ---------------------------------------------------------------------------
+# Migrações do app principal (amazon_flex.create_app)
+
+# Colunas acrescentadas a tabelas existentes; um backup antigo pode não tê-las
+# (backup.validar_candidato aceita e a migração 2 acrescenta após o restore).
+COLUNAS_ADICIONADAS = (
+    ("scheduled_rides", "station_id", "INTEGER"),
+    ("scheduled_rides", "distance_miles", "FLOAT DEFAULT 0.0 NOT NULL"),
+    ("scheduled_rides", "exclude_from_reports", "BOOLEAN DEFAULT 0 NOT NULL"),
+    ("expenses", "ride_id", "INTEGER"),
+)
+
+# Colunas derivadas das corridas (migração 5); recalculadas depois do restore
+COLUNAS_DERIVADAS = (
+    ("scheduled_rides", "receita_total", "FLOAT DEFAULT 0.0 NOT NULL"),
+    ("scheduled_rides", "despesas_vinculadas", "FLOAT DEFAULT 0.0 NOT NULL"),
+    ("scheduled_rides", "lucro", "FLOAT DEFAULT 0.0 NOT NULL"),
+    ("scheduled_rides", "custo_milha", "FLOAT DEFAULT 0.0 NOT NULL"),
+)
+
+
+def _m1_tabelas(conn):
+    from .models import db
+    db.metadata.create_all(bind=conn)
+
+
+def _m2_colunas(conn):
+    adicionar_colunas(conn, COLUNAS_ADICIONADAS)
+
+
+def _m3_indices(conn):
+    # create_all não cria índices novos em tabelas que já existiam
+    criar_indices(conn, ("ix_scheduled_rides_relatorio", "ix_scheduled_rides_station_inicio",
+                         "ix_scheduled_rides_inicio_id", "ix_expenses_data", "ix_expenses_data_id",
+                         "ix_expenses_ride_id"))
+
+
+def _m4_resumo_e_versao(conn):
+    from sqlalchemy.orm import Session
+    from .models import ScheduledRide, Expense, ResumoDiario
+    conn.exec_driver_sql("INSERT OR IGNORE INTO versao_dados (id, versao) VALUES (1, 0)")
+    # resumo_diario recém-criado num banco com dados: popula
+    sessao = Session(bind=conn)  # na transação da migração, sem depender de db.session
+    if sessao.query(ResumoDiario.dia).first() is None and (
+        sessao.query(ScheduledRide.id).first() or sessao.query(Expense.id).first()
+    ):
+        from .resumo import reconstruir
+        reconstruir(sessao)
+    sessao.close()
+
+
+def _m5_derivados(conn):
+    from .derivados import recalcular
+    adicionar_colunas(conn, COLUNAS_DERIVADAS)
+    criar_indices(conn, ("ix_scheduled_rides_lucro",))
+    recalcular(conn)
+
+
+def _m6_indices_listagens(conn):
+    criar_indices(conn, ("ix_scheduled_rides_inicio_id", "ix_expenses_data_id"))
+
+
+MIGRACOES = [
+    (1, "tabelas", _m1_tabelas),
+    (2, "colunas station_id, distance_miles, exclude_from_reports, ride_id", _m2_colunas),
+    (3, "índices dos relatórios", _m3_indices),
+    (4, "versao_dados e carga inicial do resumo_diario", _m4_resumo_e_versao),
+    (5, "colunas derivadas das corridas (receita_total, despesas_vinculadas, lucro, custo_milha)", _m5_derivados),
+    (6, "índices (inicio, id) e (data, id) das listagens", _m6_indices_listagens),
+]
+
+
+def migrar():
+    """Deixa o banco do app principal na última versão (chamar dentro do app context)."""
+    from .models import db
+    return executar(db.session, "amazon_flex", MIGRACOES)
+
+
+def migrar_arquivo(caminho):
+    """Migra um arquivo SQLite que não é o banco do app (o candidato do restore)."""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+    engine = create_engine(f"sqlite:///{caminho}")
+    try:
+        with Session(engine) as sessao:
+            return executar(sessao, "amazon_flex", MIGRACOES)
+    finally:
+        engine.dispose()
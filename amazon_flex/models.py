@@ -14,6 +14,17 @@ class Station(db.Model):
 
 class ScheduledRide(db.Model):
     __tablename__ = "scheduled_rides"
+    __table_args__ = (
+        # Filtro de período dos relatórios e listagem por início; cobre as colunas do export/somas
+        db.Index("ix_scheduled_rides_relatorio", "inicio", "fim", "exclude_from_reports", "station_id",
+                 "valor", "gorjeta", "distance_miles", "horas"),
+        # Relatório filtrado por estação (e o SET NULL ao excluir estação)
+        db.Index("ix_scheduled_rides_station_inicio", "station_id", "inicio"),
+        # Listagem ordenada por lucro (paginação por (lucro, id))
+        db.Index("ix_scheduled_rides_lucro", "lucro", "id"),
+        # Listagem por início: ORDER BY (inicio, id) direto do índice, sem B-tree temporária
+        db.Index("ix_scheduled_rides_inicio_id", "inicio", "id"),
+    )
     id = db.Column(db.Integer, primary_key=True)
     titulo = db.Column(db.String(160), nullable=True)
     inicio = db.Column(db.DateTime, nullable=False)
@@ -23,49 +34,61 @@ class ScheduledRide(db.Model):
     gorjeta = db.Column(db.Float, nullable=False, default=0.0)   # Tips
     distance_miles = db.Column(db.Float, nullable=False, default=0.0)  # Distância percorrida na corrida
     exclude_from_reports = db.Column(db.Boolean, nullable=False, server_default="0")
+    # Derivados mantidos por amazon_flex.derivados (não alterar direto)
+    receita_total = db.Column(db.Float, nullable=False, default=0.0)        # valor + gorjeta
+    despesas_vinculadas = db.Column(db.Float, nullable=False, default=0.0)  # soma das despesas da corrida
+    lucro = db.Column(db.Float, nullable=False, default=0.0)                # receita_total - despesas_vinculadas
+    custo_milha = db.Column(db.Float, nullable=False, default=0.0)          # despesas_vinculadas / distance_miles
     # Relação com estação
     station_id = db.Column(db.Integer, db.ForeignKey("stations.id", ondelete="SET NULL"))
-    station = db.relationship("Station", lazy="joined")
+    # Carregamento lazy: cada consulta escolhe joinedload/raiseload conforme o que usa
+    station = db.relationship("Station", lazy="select")
     # Expenses children
     expenses = db.relationship("Expense", backref="ride", cascade="all, delete-orphan", passive_deletes=True)
 
 class Expense(db.Model):
     __tablename__ = "expenses"
+    __table_args__ = (
+        db.Index("ix_expenses_data", "data", "valor"),
+        # Listagem por data (paginação por (data, id))
+        db.Index("ix_expenses_data_id", "data", "id"),
+        # Despesas da corrida (soma e CASCADE ao excluir corrida)
+        db.Index("ix_expenses_ride_id", "ride_id", "valor"),
+    )
     id = db.Column(db.Integer, primary_key=True)
     descricao = db.Column(db.String(160), nullable=True)
     data = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
-    valor = db.Column(db.Float, nullable=False, default=0.0)
-    ride_id = db.Column(db.Integer, db.ForeignKey("scheduled_rides.id", ondelete="CASCADE"), nullable=True)
+    # active_history: o valor antigo é carregado ao alterar (mesmo com o atributo
+    # expirado), para derivados retirar da corrida anterior o valor anterior
+    valor = db.column_property(db.Column(db.Float, nullable=False, default=0.0), active_history=True)
+    ride_id = db.column_property(db.Column(db.Integer, db.ForeignKey("scheduled_rides.id", ondelete="CASCADE"),
+                                           nullable=True), active_history=True)
 
-def ensure_schema():
-    """Cria colunas ausentes de forma simples (sem Alembic)"""
-    from sqlalchemy import inspect, text
-    insp = inspect(db.engine)
+class ResumoDiario(db.Model):
+    """Totais diários materializados, mantidos por amazon_flex.resumo.
 
-    # Tabelas
-    tables = insp.get_table_names()
-    expected = {"stations","scheduled_rides","expenses"}
-    if not expected.issubset(set(tables)):
-        db.create_all()
+    Chave (dia, dia_fim, station_id): dia/dia_fim são as datas de início e fim
+    da corrida, assim o filtro dos relatórios (inicio >= ... e fim <= ...) é
+    exato mesmo para corridas que viram a meia-noite. station_id 0 = sem estação.
+    Corridas "fora do relatório" não entram.
+    """
+    __tablename__ = "resumo_diario"
+    dia = db.Column(db.Date, primary_key=True)
+    dia_fim = db.Column(db.Date, primary_key=True)
+    station_id = db.Column(db.Integer, primary_key=True, default=0)
+    valor = db.Column(db.Float, nullable=False, default=0.0)
+    gorjeta = db.Column(db.Float, nullable=False, default=0.0)
+    distance_miles = db.Column(db.Float, nullable=False, default=0.0)
+    horas = db.Column(db.Float, nullable=False, default=0.0)
+    qtd = db.Column(db.Integer, nullable=False, default=0)
+    despesas_vinculadas = db.Column(db.Float, nullable=False, default=0.0)  # despesas das corridas do dia/estação
+    despesas = db.Column(db.Float, nullable=False, default=0.0)  # todas as despesas pela data delas (station_id 0)
 
-    # scheduled_rides.station_id
-    cols = [c["name"] for c in insp.get_columns("scheduled_rides")]
-    if "station_id" not in cols:
-        db.session.execute(text("ALTER TABLE scheduled_rides ADD COLUMN station_id INTEGER"))
-        db.session.commit()
-    # scheduled_rides.distance_miles
-    cols = [c['name'] for c in insp.get_columns('scheduled_rides')]
-    if 'distance_miles' not in cols:
-        db.session.execute(text("ALTER TABLE scheduled_rides ADD COLUMN distance_miles FLOAT DEFAULT 0.0 NOT NULL"))
-        db.session.commit()
+class VersaoDados(db.Model):
+    """Contador único (id=1) incrementado a cada flush que altera corridas, despesas ou estações.
 
-    # scheduled_rides.exclude_from_reports
-    cols = [c["name"] for c in insp.get_columns("scheduled_rides")]
-    if "exclude_from_reports" not in cols:
-        db.session.execute(text("ALTER TABLE scheduled_rides ADD COLUMN exclude_from_reports BOOLEAN DEFAULT 0 NOT NULL"))
-        db.session.commit()
-    # expenses.ride_id
-    cols = [c["name"] for c in insp.get_columns("expenses")]
-    if "ride_id" not in cols:
-        db.session.execute(text("ALTER TABLE expenses ADD COLUMN ride_id INTEGER"))
-        db.session.commit()
+    Fica no banco para valer entre workers; chaves de cache incluem esse número.
+    """
+    __tablename__ = "versao_dados"
+    id = db.Column(db.Integer, primary_key=True)
+    versao = db.Column(db.Integer, nullable=False, default=0)
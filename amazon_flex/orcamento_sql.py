@@ -0,0 +1,37 @@
+"""Orçamento de consultas SQL por request.
+
+Em modo debug (ou com SQL_ORCAMENTO=1) cada request pode executar no máximo
+SQL_MAX_CONSULTAS comandos; a consulta que passar do limite levanta
+OrcamentoSQLExcedido, com o traceback apontando para quem a disparou
+(tipicamente um lazy load dentro de um loop).
+"""
+import os
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+
+
+class OrcamentoSQLExcedido(RuntimeError):
+    pass
+
+
+def liberar():
+    """Desliga o orçamento no request atual (rotas administrativas, ex.: restore)."""
+    g.sql_orcamento_livre = True
+
+
+def init_app(app, engine):
+    app.config.setdefault("SQL_MAX_CONSULTAS", int(os.getenv("SQL_MAX_CONSULTAS", "20")))
+    app.config.setdefault("SQL_ORCAMENTO", os.getenv("SQL_ORCAMENTO", "") == "1")
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def contar(conn, cursor, statement, parameters, context, executemany):
+        if not has_request_context():
+            return
+        g.sql_consultas = g.get("sql_consultas", 0) + 1
+        if not (current_app.debug or current_app.config["SQL_ORCAMENTO"]) or g.get("sql_orcamento_livre"):
+            return
+        limite = current_app.config["SQL_MAX_CONSULTAS"]
+        if g.sql_consultas > limite:
+            raise OrcamentoSQLExcedido(
+                f"{request.endpoint}: mais de {limite} consultas SQL no request; última: {statement[:200]}"
+            )
@@ -0,0 +1,85 @@
+"""Paginação por cursor (keyset) sobre (coluna de ordenação, id).
+
+Cada página filtra a partir do último par (valor, id) visto em vez de usar
+OFFSET, então a página N custa o mesmo que a primeira. Os cursores vão na
+querystring como ?depois=<cursor> (próxima) e ?antes=<cursor> (anterior);
+um ?por_pagina= pedido segue nos links (Pagina.por_pagina).
+"""
+from collections import namedtuple
+from datetime import datetime
+from flask import request, url_for
+from sqlalchemy import and_, or_
+
+POR_PAGINA = 200
+POR_PAGINA_MAX = 500
+
+# por_pagina: tamanho pedido em ?por_pagina= (None = padrão), repassado nos links
+Pagina = namedtuple("Pagina", "itens proximo anterior por_pagina")
+
+
+def codificar(valor, id_):
+    if isinstance(valor, datetime):
+        valor = valor.isoformat()
+    return f"{valor}_{id_}"
+
+
+def decodificar(cursor, conv):
+    valor, id_ = cursor.rsplit("_", 1)
+    return conv(valor), int(id_)
+
+
+def apos(coluna, id_col, valor, id_, desc):
+    """(coluna, id) depois de (valor, id_) na ordem da listagem."""
+    if desc:
+        return or_(coluna < valor, and_(coluna == valor, id_col < id_))
+    return or_(coluna > valor, and_(coluna == valor, id_col > id_))
+
+
+def paginar(query, coluna, id_col, desc=True, conv=datetime.fromisoformat):
+    """Aplica a página pedida em request.args a `query` e retorna Pagina.
+
+    `conv` converte o valor do cursor (texto) de volta ao tipo da coluna.
+    Cursor inválido volta para a primeira página.
+    """
+    # LIMIT negativo no SQLite é "sem limite": nunca abaixo de 1
+    limite = max(1, min(request.args.get("por_pagina", POR_PAGINA, type=int) or POR_PAGINA, POR_PAGINA_MAX))
+    depois, antes = request.args.get("depois"), request.args.get("antes")
+    try:
+        cursor = decodificar(depois or antes, conv) if (depois or antes) else None
+    except ValueError:
+        cursor, depois, antes = None, None, None
+
+    ordem = (coluna.desc(), id_col.desc()) if desc else (coluna.asc(), id_col.asc())
+    inversa = (coluna.asc(), id_col.asc()) if desc else (coluna.desc(), id_col.desc())
+
+    if cursor and antes:
+        # volta: busca na ordem inversa a partir do cursor e desvira
+        q = query.filter(apos(coluna, id_col, *cursor, desc=not desc)).order_by(*inversa)
+        itens = q.limit(limite + 1).all()
+        mais = len(itens) > limite
+        itens = list(reversed(itens[:limite]))
+        tem_anterior, tem_proximo = mais, True
+    else:
+        if cursor:
+            query = query.filter(apos(coluna, id_col, *cursor, desc=desc))
+        itens = query.order_by(*ordem).limit(limite + 1).all()
+        mais = len(itens) > limite
+        itens = itens[:limite]
+        tem_anterior, tem_proximo = bool(cursor), mais
+
+    chave = lambda item: codificar(getattr(item, coluna.key), getattr(item, id_col.key))
+    return Pagina(
+        itens=itens,
+        proximo=chave(itens[-1]) if itens and tem_proximo else None,
+        anterior=chave(itens[0]) if itens and tem_anterior else None,
+        por_pagina=limite if "por_pagina" in request.args else None,
+    )
+
+
+def links(pagina, endpoint, **params):
+    """URLs de próxima/anterior para a versão JSON das listagens."""
+    params["por_pagina"] = pagina.por_pagina  # None não entra na URL
+    return {
+        "proximo": url_for(endpoint, depois=pagina.proximo, **params) if pagina.proximo else None,
+        "anterior": url_for(endpoint, antes=pagina.anterior, **params) if pagina.anterior else None,
+    }
@@ -0,0 +1,55 @@
+"""Perfil de desempenho do SQLite aplicado em cada conexão.
+
+Com vários workers do gunicorn, o journal padrão (rollback) faz leitores
+esperarem os escritores; em WAL leituras e escrita andam juntas. Os valores
+vêm de variáveis de ambiente (ao lado de DB_FILE, ver .env.example).
+"""
+import os
+
+# (pragma, variável de ambiente, padrão), aplicados nesta ordem: busy_timeout
+# vem antes de journal_mode, que precisa de lock para trocar para WAL e sem
+# espera falharia na hora com "database is locked" se outro processo escreve
+PRAGMAS = (
+    ("busy_timeout", "SQLITE_BUSY_TIMEOUT", "5000"),   # ms
+    ("journal_mode", "SQLITE_JOURNAL_MODE", "WAL"),
+    ("synchronous", "SQLITE_SYNCHRONOUS", "NORMAL"),
+    ("mmap_size", "SQLITE_MMAP_SIZE", "268435456"),   # 256 MiB
+    ("cache_size", "SQLITE_CACHE_SIZE", "-65536"),     # negativo = KiB (64 MiB)
+    ("temp_store", "SQLITE_TEMP_STORE", "MEMORY"),
+)
+NUMERICOS = {"mmap_size", "cache_size", "busy_timeout"}
+
+
+def perfil_do_ambiente():
+    """Lê o perfil das variáveis de ambiente; valor vazio desliga o pragma."""
+    perfil = {}
+    for pragma, env, padrao in PRAGMAS:
+        valor = os.getenv(env, padrao).strip()
+        if not valor:
+            continue
+        perfil[pragma] = int(valor) if pragma in NUMERICOS else valor.upper()
+    return perfil
+
+
+def aplicar(dbapi_connection, perfil):
+    """Executa foreign_keys=ON e os pragmas do perfil numa conexão DB-API."""
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA foreign_keys=ON")
+        for pragma, valor in perfil.items():
+            cursor.execute(f"PRAGMA {pragma}={valor}")
+    finally:
+        cursor.close()
+
+
+def perfil_atual(dbapi_connection):
+    """Valores em vigor na conexão (para o /saude)."""
+    cursor = dbapi_connection.cursor()
+    try:
+        atual = {}
+        for pragma, _, _ in PRAGMAS:
+            row = cursor.execute(f"PRAGMA {pragma}").fetchone()
+            atual[pragma] = row[0] if row else None
+        return atual
+    finally:
+        cursor.close()
@@ -0,0 +1,85 @@
+"""Verificação dos planos de consulta (EXPLAIN QUERY PLAN) dos relatórios e listagens.
+
+`flask --app run verificar-planos` falha (código 1) se alguma das consultas
+abaixo ler uma tabela grande inteira sem índice, ou se uma listagem paginada
+ordenar numa B-tree temporária em vez de seguir um índice. A tabela stations
+fica de fora: ela é listada inteira de propósito (filtros, comparativo).
+"""
+import re
+from datetime import date, datetime
+import click
+from sqlalchemy import select, text
+from .models import db, ScheduledRide, Expense
+from .agregados import (filtro_corridas, consulta_totais, consulta_por_estacao, consulta_exportacao,
+                        consulta_ranking_corridas, consulta_ranking_estacoes, consulta_serie)
+from .paginacao import apos
+
+TABELAS = {"scheduled_rides", "expenses", "resumo_diario"}
+SCAN_COMPLETO = re.compile(r"^SCAN (\w+)(?: AS \w+)?$")
+# Listagens paginadas: ORDER BY ... LIMIT tem de sair pronto do índice
+LISTAGENS = {"relatorios.index", "rides.index", "rides.index_lucro", "expenses.index", "expenses.index_corridas"}
+ORDEM_TEMPORARIA = re.compile(r"^USE TEMP B-TREE FOR (?:RIGHT PART OF |LAST TERM OF )?ORDER BY$")
+
+
+def consultas():
+    """(nome, statement) de cada consulta de relatório/listagem, com parâmetros de exemplo."""
+    ini, fim, est = date(2025, 1, 1), date(2025, 1, 31), 1
+    return [
+        ("relatorios.totais", consulta_totais(ini, fim)),
+        ("relatorios.totais_estacao", consulta_totais(ini, fim, est)),
+        ("relatorios.por_estacao", consulta_por_estacao(ini, fim)),
+        # corridas do PDF e do CSV
+        ("relatorios.corridas", consulta_exportacao(ini, fim)),
+        ("relatorios.corridas_estacao", consulta_exportacao(ini, fim, est)),
+        ("relatorios.ranking_corridas", consulta_ranking_corridas(ini, fim, "por_hora", 20)),
+        ("relatorios.ranking_estacoes", consulta_ranking_estacoes(ini, fim, "custo_milha", 20)),
+        ("relatorios.serie", consulta_serie(ini, fim, "semana", est)),
+        ("relatorios.index", _pagina(ScheduledRide, ScheduledRide.inicio, datetime(2025, 1, 15), desc=False,
+                                     filtro=filtro_corridas(ini, fim))),
+        ("rides.index", _pagina(ScheduledRide, ScheduledRide.inicio, datetime(2025, 1, 15))),
+        ("rides.index_lucro", _pagina(ScheduledRide, ScheduledRide.lucro, 100.0)),
+        ("expenses.index", _pagina(Expense, Expense.data, datetime(2025, 1, 15))),
+        ("expenses.index_corridas", select(ScheduledRide.id, ScheduledRide.inicio, ScheduledRide.titulo)
+            .order_by(ScheduledRide.inicio.desc()).limit(50)),
+    ]
+
+
+def _pagina(model, coluna, valor, desc=True, filtro=None):
+    """Página seguinte de uma listagem keyset (ver paginacao.paginar)."""
+    stmt = select(model) if filtro is None else select(model).where(filtro)
+    ordem = (coluna.desc(), model.id.desc()) if desc else (coluna.asc(), model.id.asc())
+    return stmt.where(apos(coluna, model.id, valor, 1, desc=desc)).order_by(*ordem).limit(201)
+
+
+def plano(stmt):
+    sql = str(stmt.compile(db.engine, compile_kwargs={"literal_binds": True}))
+    return [row[3] for row in db.session.execute(text("EXPLAIN QUERY PLAN " + sql))]
+
+
+def verificar():
+    """Retorna {nome: [linhas do plano com problema]} só das consultas com problema."""
+    falhas = {}
+    for nome, stmt in consultas():
+        ruins = [l for l in plano(stmt)
+                 if ((m := SCAN_COMPLETO.match(l)) and m.group(1) in TABELAS)
+                 or (nome in LISTAGENS and ORDEM_TEMPORARIA.match(l))]
+        if ruins:
+            falhas[nome] = ruins
+    return falhas
+
+
+@click.command("verificar-planos")
+@click.option("--mostrar", is_flag=True, help="Imprime o plano de todas as consultas.")
+def verificar_cmd(mostrar):
+    """Falha se alguma consulta fizer scan completo de tabela ou uma listagem ordenar sem índice."""
+    if mostrar:
+        for nome, stmt in consultas():
+            click.echo(nome)
+            for linha in plano(stmt):
+                click.echo(f"    {linha}")
+    falhas = verificar()
+    for nome, linhas in falhas.items():
+        click.echo(f"FALHA {nome}: " + "; ".join(linhas), err=True)
+    if falhas:
+        raise SystemExit(1)
+    click.echo("Planos OK: nenhum scan completo nem ordenação temporária nas listagens.")
@@ -0,0 +1,195 @@
+"""Geração do PDF de relatórios em arquivo, com cache em disco e pool de workers.
+
+Cada PDF é gravado em instance/relatorios_pdf/<chave>.pdf, onde a chave vem
+de (período, estação, versão dos dados): enquanto nada muda no banco o mesmo
+pedido é servido direto do disco. Períodos acima de PDF_SINCRONO_DIAS são
+gerados num ThreadPoolExecutor e a rota responde 202 com a URL de
+acompanhamento; um arquivo <chave>.pdf.parcial marca o trabalho em andamento
+para todos os workers do gunicorn.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Corridas lidas do banco por vez ao desenhar
+PDF_LOTE = 500
+# Marcador .parcial mais velho que isso é de um worker que morreu (s)
+PARCIAL_EXPIRA = 600
+
+_pool = None
+_pool_lock = threading.Lock()
+_falhas = {}  # chave -> mensagem do erro (apenas neste processo)
+
+
+def init_app(app):
+    app.config.setdefault("PDF_WORKERS", int(os.getenv("PDF_WORKERS", "2")))
+    app.config.setdefault("PDF_SINCRONO_DIAS", int(os.getenv("PDF_SINCRONO_DIAS", "92")))
+    app.config.setdefault("PDF_CACHE_MAX", int(os.getenv("PDF_CACHE_MAX", "50")))
+
+
+def _executor(app):
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=app.config["PDF_WORKERS"], thread_name_prefix="pdf")
+        return _pool
+
+
+def diretorio(app):
+    d = os.path.join(app.instance_path, "relatorios_pdf")
+    os.makedirs(d, exist_ok=True)
+    return d
+
+
+def chave(inicio, fim, station_id, versao):
+    bruto = f"{inicio.isoformat()}|{fim.isoformat()}|{station_id or ''}|{versao}"
+    return hashlib.sha1(bruto.encode()).hexdigest()[:24]
+
+
+def caminho(app, chave):
+    return os.path.join(diretorio(app), f"{chave}.pdf")
+
+
+def _marcador_ativo(marcador):
+    try:
+        return time.time() - os.path.getmtime(marcador) < PARCIAL_EXPIRA
+    except OSError:
+        return False
+
+
+def estado(app, chave):
+    """"pronto", "gerando", "erro" ou None (chave desconhecida)."""
+    destino = caminho(app, chave)
+    if os.path.exists(destino):
+        return "pronto"
+    if _marcador_ativo(destino + ".parcial"):
+        return "gerando"
+    if chave in _falhas:
+        return "erro"
+    return None
+
+
+def erro(chave):
+    return _falhas.get(chave)
+
+
+def _reservar(marcador):
+    """Cria o marcador de forma exclusiva; False se outro worker já está gerando."""
+    for _ in range(2):
+        try:
+            os.close(os.open(marcador, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except FileExistsError:
+            if _marcador_ativo(marcador):
+                return False
+            try:
+                os.remove(marcador)
+            except OSError:
+                pass
+    return False
+
+
+def _desenhar(destino, inicio, fim, station_id):
+    """Desenha o relatório em `destino`, lendo as corridas do banco em lotes."""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.units import mm
+    from .models import db, Station
+    from .agregados import totais, consulta_exportacao
+
+    t = totais(inicio, fim, station_id)
+
+    c = canvas.Canvas(destino, pagesize=A4)
+    W, H = A4
+    x, y = 20*mm, H-20*mm
+
+    def line(text, inc=7*mm):
+        nonlocal y
+        c.drawString(x, y, text)
+        y -= inc
+
+    c.setFont("Helvetica-Bold", 14)
+    line("Relatório - Amazon Flex")
+    c.setFont("Helvetica", 11)
+    line(f"Período: {inicio.strftime('%d/%m/%Y')} a {fim.strftime('%d/%m/%Y')}")
+    if station_id:
+        try:
+            est = db.session.get(Station, int(station_id))
+            line(f"Estação: {est.nome} ({est.codigo})" if est and est.codigo else f"Estação: {est.nome if est else '-'}")
+        except Exception:
+            pass
+
+    line("")
+    c.setFont("Helvetica-Bold", 12)
+    line("Resumo:")
+    c.setFont("Helvetica", 11)
+    line(f"Receita: $ {t['receita']:.2f}")
+    line(f"Custo:   $ {t['custo']:.2f}")
+    line(f"Lucro:   $ {t['lucro']:.2f}")
+    line(f"Margem:    {t['margem']:.2f}%")
+    line(f"Milhas:   {t['milhas']:.2f}")
+    line(f"Custo/Milha: $ {t['custo_milha']:.4f}")
+
+    line("")
+    c.setFont("Helvetica-Bold", 12)
+    line("Corridas consideradas:")
+    c.setFont("Helvetica", 10)
+    stmt = consulta_exportacao(inicio, fim, station_id).execution_options(yield_per=PDF_LOTE)
+    for r in db.session.execute(stmt):
+        if y < 30*mm:
+            c.showPage()
+            c.setFont("Helvetica", 10)
+            y = H-20*mm
+        line(f"{r.inicio.strftime('%d/%m/%Y %H:%M')} - {r.fim.strftime('%H:%M')} | {r.nome or '-'} | Horas: {r.horas:.2f} | Valor: ${r.valor:.2f} | Gorjeta: ${r.gorjeta:.2f}")
+
+    c.showPage()
+    c.save()
+
+
+def gerar(app, inicio, fim, station_id, chave):
+    """Gera o PDF da chave num arquivo temporário e publica com os.replace.
+
+    Roda no próprio app context (serve tanto para o request quanto para o pool).
+    """
+    destino = caminho(app, chave)
+    fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=diretorio(app))
+    os.close(fd)
+    try:
+        with app.app_context():
+            _desenhar(tmp, inicio, fim, station_id)
+        os.replace(tmp, destino)
+        _falhas.pop(chave, None)
+    except Exception as e:
+        app.logger.exception("falha ao gerar PDF %s", chave)
+        _falhas[chave] = str(e)
+        raise
+    finally:
+        for arq in (tmp, destino + ".parcial"):
+            if os.path.exists(arq):
+                os.remove(arq)
+    limpar(app)
+
+
+def agendar(app, inicio, fim, station_id, chave):
+    """Envia a geração para o pool, a menos que alguém já esteja gerando a chave."""
+    if not _reservar(caminho(app, chave) + ".parcial"):
+        return
+    _falhas.pop(chave, None)
+    _executor(app).submit(gerar, app, inicio, fim, station_id, chave)
+
+
+def limpar(app):
+    """Mantém só os PDF_CACHE_MAX arquivos mais recentes (versões antigas deixam de ser pedidas)."""
+    d = diretorio(app)
+    pdfs = sorted(
+        (os.path.join(d, n) for n in os.listdir(d) if n.endswith(".pdf")),
+        key=os.path.getmtime, reverse=True,
+    )
+    for velho in pdfs[app.config["PDF_CACHE_MAX"]:]:
+        try:
+            os.remove(velho)
+        except OSError:
+            pass
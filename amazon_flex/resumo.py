@@ -0,0 +1,141 @@
+"""Manutenção incremental da tabela resumo_diario.
+
+As rotas que gravam corridas/despesas chamam estas funções na mesma
+transação da alteração; `flask --app run reconstruir-resumo` refaz tudo a
+partir das tabelas brutas.
+
+As somas incrementais em float acumulam resto de arredondamento: uma linha
+cujos campos voltam a zero (dentro de TOLERANCIA) é apagada, e a diferença
+que sobra nas demais só some com reconstruir-resumo, que também serve para
+corrigir esse desvio depois de muitas edições.
+"""
+from datetime import date
+import click
+from sqlalchemy import func, select, insert
+from .models import db, ResumoDiario, ScheduledRide, Expense
+
+CAMPOS = ("valor", "gorjeta", "distance_miles", "horas", "qtd", "despesas_vinculadas", "despesas")
+
+# Abaixo disso a soma conta como zero (resto de arredondamento)
+TOLERANCIA = 1e-6
+
+
+def _somar(dia, dia_fim, station_id, **deltas):
+    chave = (dia, dia_fim, station_id or 0)
+    row = db.session.get(ResumoDiario, chave)
+    if row is None:
+        row = ResumoDiario(dia=dia, dia_fim=dia_fim, station_id=station_id or 0,
+                           **{c: 0 for c in CAMPOS})
+        db.session.add(row)
+    for campo, delta in deltas.items():
+        setattr(row, campo, (getattr(row, campo) or 0) + delta)
+    if all(abs(getattr(row, c) or 0) < TOLERANCIA for c in CAMPOS):
+        # Dia/estação que ficou vazio: sem linha, como no reconstruir()
+        if row in db.session.new:
+            db.session.expunge(row)
+        else:
+            db.session.delete(row)
+            db.session.flush()  # senão o próximo _somar da mesma chave ainda acharia a linha excluída
+
+
+def aplicar_corrida(ride, sinal=1):
+    """Soma (sinal=1) ou retira (sinal=-1) a corrida e suas despesas vinculadas.
+
+    Na edição, chame com -1 antes de alterar os campos e com +1 depois.
+    """
+    if ride.exclude_from_reports:
+        return
+    _somar(ride.inicio.date(), ride.fim.date(), ride.station_id,
+           valor=sinal*(ride.valor or 0.0),
+           gorjeta=sinal*(ride.gorjeta or 0.0),
+           distance_miles=sinal*(ride.distance_miles or 0.0),
+           horas=sinal*(ride.horas or 0.0),
+           qtd=sinal,
+           despesas_vinculadas=sinal*sum(e.valor or 0.0 for e in ride.expenses))
+
+
+def remover_corrida(ride):
+    """Retira a corrida e as despesas dela, que são excluídas em cascata."""
+    aplicar_corrida(ride, -1)
+    for e in ride.expenses:
+        _somar(e.data.date(), e.data.date(), 0, despesas=-(e.valor or 0.0))
+
+
+def aplicar_despesa(e, sinal=1):
+    """Soma (sinal=1) ou retira (sinal=-1) uma despesa."""
+    valor = sinal*(e.valor or 0.0)
+    _somar(e.data.date(), e.data.date(), 0, despesas=valor)
+    ride = db.session.get(ScheduledRide, e.ride_id) if e.ride_id else None
+    if ride is not None and not ride.exclude_from_reports:
+        _somar(ride.inicio.date(), ride.fim.date(), ride.station_id, despesas_vinculadas=valor)
+
+
+def somar_lote(deltas):
+    """Aplica {(dia, dia_fim, station_id): {campo: delta}} de uma vez (importação em massa)."""
+    for (dia, dia_fim, station_id), d in deltas.items():
+        _somar(dia, dia_fim, station_id, **d)
+
+
+def remover_estacao(station_id):
+    """Move as linhas da estação excluída para "sem estação" (o banco faz SET NULL nas corridas)."""
+    for row in ResumoDiario.query.filter_by(station_id=station_id).all():
+        _somar(row.dia, row.dia_fim, 0, **{c: getattr(row, c) for c in CAMPOS})
+        db.session.delete(row)
+
+
+def reconstruir(sessao=None):
+    """Apaga e recalcula todo o resumo com três GROUP BY (sem commit).
+
+    `sessao` padrão: db.session (as migrações passam uma sessão sobre a conexão delas).
+    """
+    sessao = sessao if sessao is not None else db.session
+    sessao.query(ResumoDiario).delete()
+
+    linhas = {}
+    def linha(dia, dia_fim, station_id):
+        chave = (date.fromisoformat(dia), date.fromisoformat(dia_fim), station_id or 0)
+        if chave not in linhas:
+            linhas[chave] = dict(zip(("dia", "dia_fim", "station_id"), chave), **{c: 0 for c in CAMPOS})
+        return linhas[chave]
+
+    dia = func.date(ScheduledRide.inicio)
+    dia_fim = func.date(ScheduledRide.fim)
+    valida = ScheduledRide.exclude_from_reports.is_(False)
+    corridas = select(
+        dia, dia_fim, ScheduledRide.station_id,
+        func.sum(ScheduledRide.valor), func.sum(ScheduledRide.gorjeta),
+        func.sum(ScheduledRide.distance_miles), func.sum(ScheduledRide.horas),
+        func.count(ScheduledRide.id),
+    ).where(valida).group_by(dia, dia_fim, ScheduledRide.station_id)
+    for d, df, sid, valor, gorjeta, milhas, horas, qtd in sessao.execute(corridas):
+        l = linha(d, df, sid)
+        l.update(valor=valor or 0.0, gorjeta=gorjeta or 0.0, distance_miles=milhas or 0.0,
+                 horas=horas or 0.0, qtd=qtd)
+
+    vinculadas = (
+        select(dia, dia_fim, ScheduledRide.station_id, func.sum(Expense.valor))
+        .join(Expense, Expense.ride_id == ScheduledRide.id)
+        .where(valida)
+        .group_by(dia, dia_fim, ScheduledRide.station_id)
+    )
+    for d, df, sid, total in sessao.execute(vinculadas):
+        linha(d, df, sid)["despesas_vinculadas"] = total or 0.0
+
+    dia_desp = func.date(Expense.data)
+    despesas = select(dia_desp, func.sum(Expense.valor)).group_by(dia_desp)
+    for d, total in sessao.execute(despesas):
+        linha(d, d, 0)["despesas"] = total or 0.0
+
+    if linhas:
+        sessao.execute(insert(ResumoDiario), list(linhas.values()))
+    return len(linhas)
+
+
+@click.command("reconstruir-resumo")
+def reconstruir_cmd():
+    """Recalcula a tabela resumo_diario a partir de corridas e despesas (zera o desvio de arredondamento)."""
+    from .versao import incrementar
+    n = reconstruir()
+    incrementar()
+    db.session.commit()
+    click.echo(f"resumo_diario reconstruído: {n} linha(s).")
@@ -1,18 +1,38 @@
 \
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from datetime import datetime
+from sqlalchemy.orm import joinedload, raiseload
 from ..models import db, Expense, ScheduledRide
+from .. import resumo
+from ..paginacao import paginar, links
+
+# Corridas oferecidas no select "Corrida (opcional)"
+CORRIDAS_NO_FORM = 50
 
 bp = Blueprint("expenses", __name__, url_prefix="/despesas")
 
 def parse_date(value: str):
     return datetime.strptime(value, "%Y-%m-%d")
 
+def expense_json(e):
+    return {"id": e.id, "descricao": e.descricao, "data": e.data.isoformat(), "valor": e.valor, "ride_id": e.ride_id}
+
 @bp.get("/")
 def index():
-    despesas = Expense.query.order_by(Expense.data.desc()).limit(200).all()
-    rides = ScheduledRide.query.order_by(ScheduledRide.inicio.desc()).limit(200).all()
-    return render_template("expenses/index.html", despesas=despesas, rides=rides)
+    # A tabela mostra só o início da corrida vinculada
+    q = Expense.query.options(
+        joinedload(Expense.ride).load_only(ScheduledRide.id, ScheduledRide.inicio).raiseload("*"),
+    )
+    pagina = paginar(q, Expense.data, Expense.id)
+    # Só as colunas usadas no select, das corridas mais recentes
+    rides = (db.session.query(ScheduledRide.id, ScheduledRide.inicio, ScheduledRide.titulo)
+             .order_by(ScheduledRide.inicio.desc()).limit(CORRIDAS_NO_FORM).all())
+    return render_template("expenses/index.html", despesas=pagina.itens, rides=rides, pagina=pagina)
+
+@bp.get("/json")
+def index_json():
+    pagina = paginar(Expense.query.options(raiseload("*")), Expense.data, Expense.id)
+    return jsonify(itens=[expense_json(e) for e in pagina.itens], **links(pagina, "expenses.index_json"))
 
 @bp.route("/nova", methods=["POST"])
 def nova():
@@ -22,13 +42,38 @@ def nova():
     ride_id = request.form.get("ride_id") or None
     e = Expense(descricao=descricao, data=data, valor=valor, ride_id=int(ride_id) if ride_id else None)
     db.session.add(e)
+    resumo.aplicar_despesa(e)
     db.session.commit()
     flash("Despesa lançada!", "success")
     return redirect(url_for("expenses.index"))
 
+@bp.route("/importar", methods=["GET","POST"])
+def importar():
+    """Importa despesas de um CSV (data,descricao,valor,ride_id)."""
+    import io
+    from ..importacao import importar_despesas, CAMPOS_DESPESAS
+    from ..orcamento_sql import liberar
+    from .rides import ERROS_NA_TELA
+    resultado = None
+    if request.method == "POST":
+        file = request.files.get("arquivo")
+        if not file:
+            flash("Nenhum arquivo enviado.", "warning")
+            return redirect(url_for("expenses.importar"))
+        liberar()  # um INSERT e uma busca de corridas por lote
+        arquivo = io.TextIOWrapper(file.stream, encoding="utf-8-sig", newline="")
+        resultado = importar_despesas(arquivo, ignorar_erros=bool(request.form.get("ignorar_erros")))
+        if resultado.inseridas:
+            flash(f"{resultado.inseridas} despesa(s) importada(s).", "success")
+        elif resultado.erros:
+            flash("Nada foi importado: corrija os erros abaixo.", "danger")
+    return render_template("importar.html", titulo="Importar despesas", layout=",".join(CAMPOS_DESPESAS),
+                           voltar=url_for("expenses.index"), resultado=resultado, erros_max=ERROS_NA_TELA)
+
 @bp.post("/<int:id>/excluir")
 def excluir(id):
     e = Expense.query.get_or_404(id)
+    resumo.aplicar_despesa(e, -1)
     db.session.delete(e)
     db.session.commit()
     flash("Despesa excluída.", "success")
@@ -1,215 +1,158 @@
 \
-from flask import Blueprint, render_template, request
+from flask import Blueprint, render_template, request, abort
 from datetime import datetime, timedelta
-from sqlalchemy import func
-from ..models import db, ScheduledRide, Expense, Station
+from sqlalchemy.orm import joinedload, raiseload
+from ..models import db, Station, ScheduledRide
+from ..agregados import (totais, por_estacao, consulta_exportacao, filtro_corridas,
+                         ranking as consultar_ranking, METRICAS_RANKING,
+                         serie as consultar_serie, BUCKETS_SERIE)
+from ..cache import em_cache
+from ..paginacao import paginar
 
 bp = Blueprint("relatorios", __name__, url_prefix="/relatorios")
 
+# Linhas buscadas por vez no export CSV
+CSV_LOTE = 1000
+
+# Linhas em cada lado do ranking (?n=)
+RANKING_N = 20
+RANKING_MAX = 100
+
+# Rotas que respondem JSON (erros de parâmetro também em JSON)
+ROTAS_JSON = {"relatorios.ranking", "relatorios.serie"}
+
 def parse_date(s):
     return datetime.strptime(s, "%Y-%m-%d")
 
-@bp.route("/", methods=["GET"])
-def index():
-    # período padrão: últimos 30 dias
+def periodo():
+    """Lê inicio/fim/station_id da querystring (padrão: últimos 30 dias).
+
+    Valor inválido encerra o request com 400 (JSON nas ROTAS_JSON).
+    """
     fim = datetime.utcnow().date()
     inicio = fim - timedelta(days=30)
     s_in = request.args.get("inicio")
     s_fi = request.args.get("fim")
-    station_id = request.args.get("station_id") or None
+    try:
+        station_id = int(request.args.get("station_id") or 0) or None
+        if s_in and s_fi:
+            inicio = parse_date(s_in).date()
+            fim = parse_date(s_fi).date()
+    except ValueError:
+        erro = "inicio/fim devem ser AAAA-MM-DD e station_id um número inteiro"
+        if request.endpoint in ROTAS_JSON:
+            from flask import jsonify, make_response
+            abort(make_response(jsonify(erro=erro), 400))
+        abort(400, description=erro)
+    return inicio, fim, station_id
 
-    if s_in and s_fi:
-        inicio = parse_date(s_in).date()
-        fim = parse_date(s_fi).date()
-
-    # Consulta corridas
-    q_rides = ScheduledRide.query.filter(
-        ScheduledRide.inicio >= datetime.combine(inicio, datetime.min.time()),
-        ScheduledRide.fim <= datetime.combine(fim, datetime.max.time()),
-        ScheduledRide.exclude_from_reports.is_(False)
-    )
+@bp.route("/", methods=["GET"])
+def index():
+    inicio, fim, station_id = periodo()
+
+    # Totais e lista de estações reaproveitados enquanto os dados não mudam
+    dados = em_cache("relatorios.index", inicio, fim, station_id, lambda: {
+        "t": totais(inicio, fim, station_id),
+        "estacoes": [{"id": e.id, "nome": e.nome, "codigo": e.codigo}
+                     for e in Station.query.order_by(Station.nome).all()],
+    })
+    t = dados["t"]
+
+    # Corridas do período uma página por vez (keyset por (inicio, id), mais antigas primeiro)
+    q = (ScheduledRide.query.options(joinedload(ScheduledRide.station), raiseload("*"))
+         .filter(filtro_corridas(inicio, fim, station_id)))
+    pagina = paginar(q, ScheduledRide.inicio, ScheduledRide.id, desc=False)
+    pagina_params = {"inicio": inicio.isoformat(), "fim": fim.isoformat()}
     if station_id:
-        q_rides = q_rides.filter(ScheduledRide.station_id == int(station_id))
-
-    rides = q_rides.order_by(ScheduledRide.inicio.asc()).all()
-
-    # Totais receita
-    receita_valor = db.session.query(func.coalesce(func.sum(ScheduledRide.valor),0.0)).filter(q_rides.whereclause).scalar()
-    receita_tips  = db.session.query(func.coalesce(func.sum(ScheduledRide.gorjeta),0.0)).filter(q_rides.whereclause).scalar()
-    receita = float(receita_valor) + float(receita_tips)
-
-    # Distância total
-    total_milhas = db.session.query(func.coalesce(func.sum(ScheduledRide.distance_miles),0.0)).filter(q_rides.whereclause).scalar()
-    total_milhas = float(total_milhas)
-
-    # Despesas no período (todas, independente de estação)
-    despesas_total = db.session.query(func.coalesce(func.sum(Expense.valor),0.0)).filter(
-        Expense.data >= datetime.combine(inicio, datetime.min.time()),
-        Expense.data <= datetime.combine(fim, datetime.max.time()),
-    ).scalar()
-
-    custo = float(despesas_total)
-    lucro = receita - custo
-    margem = (lucro/receita*100.0) if receita > 0 else 0.0
-    custo_milha = (custo/total_milhas) if total_milhas > 0 else 0.0
-
-    estacoes = Station.query.order_by(Station.nome).all()
+        pagina_params["station_id"] = station_id
 
     return render_template("relatorios/index.html",
                            inicio=inicio, fim=fim,
-                           rides=rides,
-                           receita=round(receita,2),
-                           custo=round(custo,2),
-                           lucro=round(lucro,2),
-                           margem=round(margem,2),
-                           total_milhas=round(total_milhas,2),
-                           custo_milha=round(custo_milha,4),
-                           estacoes=estacoes,
-                           station_id=int(station_id) if station_id else None)
+                           rides=pagina.itens, pagina=pagina, pagina_params=pagina_params,
+                           receita=round(t["receita"],2),
+                           custo=round(t["custo"],2),
+                           lucro=round(t["lucro"],2),
+                           margem=round(t["margem"],2),
+                           total_milhas=round(t["milhas"],2),
+                           custo_milha=round(t["custo_milha"],4),
+                           estacoes=dados["estacoes"],
+                           station_id=station_id)
 \
 
 @bp.route("/pdf", methods=["GET"])
 def pdf():
-    # Gera o mesmo resumo do index, mas envia como PDF simples
-    from reportlab.lib.pagesizes import A4
-    from reportlab.pdfgen import canvas
-    from reportlab.lib.units import mm
+    """PDF do relatório, servido do cache em disco.
 
-    # Reaproveita a lógica
-    from flask import request, send_file
-    from io import BytesIO
+    Períodos até PDF_SINCRONO_DIAS são gerados no próprio request; acima
+    disso a geração vai para o pool e a resposta é 202 com a URL de status.
+    """
+    from flask import current_app, jsonify, send_file, url_for
+    from .. import relatorio_pdf, versao
 
-    # Parse de parâmetros
-    from datetime import datetime, timedelta
-    s_in = request.args.get("inicio")
-    s_fi = request.args.get("fim")
-    station_id = request.args.get("station_id") or None
-
-    # padrão: últimos 30 dias
-    fim_d = datetime.utcnow().date()
-    inicio_d = fim_d - timedelta(days=30)
-    if s_in and s_fi:
-        inicio_d = datetime.strptime(s_in, "%Y-%m-%d").date()
-        fim_d = datetime.strptime(s_fi, "%Y-%m-%d").date()
-
-    # Query de corridas aplicando filtros
-    from sqlalchemy import func
-    q_rides = ScheduledRide.query.filter(
-        ScheduledRide.inicio >= datetime.combine(inicio_d, datetime.min.time()),
-        ScheduledRide.fim <= datetime.combine(fim_d, datetime.max.time()),
-        ScheduledRide.exclude_from_reports.is_(False)
-    )
-    if station_id:
-        q_rides = q_rides.filter(ScheduledRide.station_id == int(station_id))
-
-    rides = q_rides.order_by(ScheduledRide.inicio.asc()).all()
-
-    receita_valor = db.session.query(func.coalesce(func.sum(ScheduledRide.valor),0.0)).filter(q_rides.whereclause).scalar()
-    receita_tips  = db.session.query(func.coalesce(func.sum(ScheduledRide.gorjeta),0.0)).filter(q_rides.whereclause).scalar()
-    receita = float(receita_valor) + float(receita_tips)
-
-    # Distância total
-    total_milhas = db.session.query(func.coalesce(func.sum(ScheduledRide.distance_miles),0.0)).filter(q_rides.whereclause).scalar()
-    total_milhas = float(total_milhas)
-
-    despesas_total = db.session.query(func.coalesce(func.sum(Expense.valor),0.0)).filter(
-        Expense.data >= datetime.combine(inicio_d, datetime.min.time()),
-        Expense.data <= datetime.combine(fim_d, datetime.max.time()),
-    ).scalar()
-    custo = float(despesas_total)
-    lucro = receita - custo
-    margem = (lucro/receita*100.0) if receita>0 else 0.0
-
-    buffer = BytesIO()
-    c = canvas.Canvas(buffer, pagesize=A4)
-    W, H = A4
-    x, y = 20*mm, H-20*mm
-
-    def line(text, inc=7*mm):
-        nonlocal y
-        c.drawString(x, y, text)
-        y -= inc
-
-    c.setFont("Helvetica-Bold", 14)
-    line("Relatório - Amazon Flex")
-    c.setFont("Helvetica", 11)
-    line(f"Período: {inicio_d.strftime('%d/%m/%Y')} a {fim_d.strftime('%d/%m/%Y')}")
-    if station_id:
-        try:
-            est = Station.query.get(int(station_id))
-            line(f"Estação: {est.nome} ({est.codigo})" if est and est.codigo else f"Estação: {est.nome if est else '-'}")
-        except Exception:
-            pass
-
-    line("")
-    c.setFont("Helvetica-Bold", 12)
-    line("Resumo:")
-    c.setFont("Helvetica", 11)
-    line(f"Receita: $ {receita:.2f}")
-    line(f"Custo:   $ {custo:.2f}")
-    line(f"Lucro:   $ {lucro:.2f}")
-    line(f"Margem:    {margem:.2f}%")
-    # total milhas
-    total_milhas = 0.0
-    from sqlalchemy import func
-    total_milhas = float(db.session.query(func.coalesce(func.sum(ScheduledRide.distance_miles),0.0)).filter(q_rides.whereclause).scalar())
-    custo_milha = (custo/total_milhas) if total_milhas>0 else 0.0
-    line(f"Milhas:   {total_milhas:.2f}")
-    line(f"Custo/Milha: $ {custo_milha:.4f}")
-
-    line("")
-    c.setFont("Helvetica-Bold", 12)
-    line("Corridas consideradas:")
-    c.setFont("Helvetica", 10)
-    for r in rides:
-        if y < 30*mm:
-            c.showPage()
-            y = H-20*mm
-        est_nome = r.station.nome if r.station else "-"
-        line(f"{r.inicio.strftime('%d/%m/%Y %H:%M')} - {r.fim.strftime('%H:%M')} | {est_nome} | Horas: {r.horas:.2f} | Valor: ${r.valor:.2f} | Gorjeta: ${r.gorjeta:.2f}")
-
-    c.showPage()
-    c.save()
-    buffer.seek(0)
+    inicio_d, fim_d, station_id = periodo()
+    app = current_app._get_current_object()
+    chave = relatorio_pdf.chave(inicio_d, fim_d, station_id, versao.atual())
     filename = f"relatorio_{inicio_d.isoformat()}_{fim_d.isoformat()}.pdf"
-    return send_file(buffer, as_attachment=True, download_name=filename, mimetype="application/pdf")
+
+    if relatorio_pdf.estado(app, chave) != "pronto":
+        if (fim_d - inicio_d).days > app.config["PDF_SINCRONO_DIAS"]:
+            relatorio_pdf.agendar(app, inicio_d, fim_d, station_id, chave)
+            url = url_for("relatorios.pdf_status", chave=chave, nome=filename)
+            return jsonify(status="gerando", url=url), 202, {"Location": url}
+        relatorio_pdf.gerar(app, inicio_d, fim_d, station_id, chave)
+
+    return send_file(relatorio_pdf.caminho(app, chave), as_attachment=True, download_name=filename, mimetype="application/pdf")
+
+@bp.route("/pdf/status/<chave>", methods=["GET"])
+def pdf_status(chave):
+    """Acompanhamento da geração em segundo plano: 202 enquanto gera, o PDF quando pronto."""
+    from flask import current_app, jsonify, send_file, url_for, abort
+    from werkzeug.utils import secure_filename
+    from .. import relatorio_pdf
+
+    if not chave.isalnum():
+        abort(404)
+    app = current_app._get_current_object()
+    filename = secure_filename(request.args.get("nome", "")) or "relatorio.pdf"
+    st = relatorio_pdf.estado(app, chave)
+    if st == "pronto":
+        return send_file(relatorio_pdf.caminho(app, chave), as_attachment=True, download_name=filename, mimetype="application/pdf")
+    if st == "gerando":
+        url = url_for("relatorios.pdf_status", chave=chave, nome=filename)
+        return jsonify(status="gerando", url=url), 202, {"Retry-After": "2"}
+    if st == "erro":
+        return jsonify(status="erro", erro=relatorio_pdf.erro(chave)), 500
+    return jsonify(status="desconhecido"), 404
 \
 
 @bp.route("/csv", methods=["GET"])
 def csv_export():
-    """Exporta CSV detalhado das corridas no período (com filtros)."""
+    """Exporta CSV detalhado das corridas no período (com filtros).
+
+    O arquivo é gerado em streaming: as linhas vêm do banco em lotes de
+    CSV_LOTE (yield_per, cursor no servidor) e cada lote é escrito e enviado
+    antes do próximo, então a memória não cresce com o tamanho do período.
+    """
     import csv
     from io import StringIO
-    from flask import Response, request
-    from datetime import datetime, timedelta
-
-    s_in = request.args.get("inicio")
-    s_fi = request.args.get("fim")
-    station_id = request.args.get("station_id") or None
-
-    fim = datetime.utcnow().date()
-    inicio = fim - timedelta(days=30)
-    if s_in and s_fi:
-        inicio = datetime.strptime(s_in, "%Y-%m-%d").date()
-        fim = datetime.strptime(s_fi, "%Y-%m-%d").date()
-
-    q = ScheduledRide.query.filter(
-        ScheduledRide.inicio >= datetime.combine(inicio, datetime.min.time()),
-        ScheduledRide.fim <= datetime.combine(fim, datetime.max.time()),
-        ScheduledRide.exclude_from_reports.is_(False)
-    )
-    if station_id:
-        q = q.filter(ScheduledRide.station_id == int(station_id))
-    rows = q.order_by(ScheduledRide.inicio.asc()).all()
-
-    output = StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["id","inicio","fim","horas","valor","gorjeta","milhas","estacao","exclude_from_reports"])
-    for r in rows:
-        est = r.station.nome if r.station else ""
-        writer.writerow([r.id, r.inicio.isoformat(sep=" "), r.fim.isoformat(sep=" "), f"{r.horas:.2f}", f"{r.valor:.2f}", f"{r.gorjeta:.2f}", f"{r.distance_miles:.2f}", est, int(r.exclude_from_reports)])
-
-    resp = Response(output.getvalue(), mimetype="text/csv")
+    from flask import Response, stream_with_context
+
+    inicio, fim, station_id = periodo()
+    stmt = consulta_exportacao(inicio, fim, station_id).execution_options(yield_per=CSV_LOTE)
+
+    def gerar():
+        output = StringIO()
+        writer = csv.writer(output)
+        writer.writerow(["id","inicio","fim","horas","valor","gorjeta","milhas","estacao","exclude_from_reports"])
+        yield output.getvalue()
+        for lote in db.session.execute(stmt).partitions():
+            output.seek(0)
+            output.truncate()
+            for r in lote:
+                writer.writerow([r.id, r.inicio.isoformat(sep=" "), r.fim.isoformat(sep=" "), f"{r.horas:.2f}", f"{r.valor:.2f}", f"{r.gorjeta:.2f}", f"{r.distance_miles:.2f}", r.nome or "", int(r.exclude_from_reports)])
+            yield output.getvalue()
+
+    resp = Response(stream_with_context(gerar()), mimetype="text/csv")
     fname = f"corridas_{inicio.isoformat()}_{fim.isoformat()}.csv"
     resp.headers["Content-Disposition"] = f"attachment; filename={fname}"
     return resp
@@ -218,74 +161,26 @@ def csv_export():
 @bp.route("/estacoes", methods=["GET"])
 def estacoes_compare():
     """Comparativo por estação: receita, custo (apenas despesas vinculadas às corridas da estação), lucro, margem, milhas, custo/milha."""
-    from datetime import datetime, timedelta
-    from sqlalchemy import func
-    from flask import request
-
-    s_in = request.args.get("inicio")
-    s_fi = request.args.get("fim")
-
-    fim = datetime.utcnow().date()
-    inicio = fim - timedelta(days=30)
-    if s_in and s_fi:
-        inicio = datetime.strptime(s_in, "%Y-%m-%d").date()
-        fim = datetime.strptime(s_fi, "%Y-%m-%d").date()
-
-    # Todas as estações com pelo menos 1 corrida no período
-    stations = db.session.query(Station).order_by(Station.nome).all()
-    data = []
-    for est in stations:
-        q = ScheduledRide.query.filter(
-            ScheduledRide.inicio >= datetime.combine(inicio, datetime.min.time()),
-            ScheduledRide.fim <= datetime.combine(fim, datetime.max.time()),
-            ScheduledRide.exclude_from_reports.is_(False),
-            ScheduledRide.station_id == est.id
-        )
-        receita_val = db.session.query(func.coalesce(func.sum(ScheduledRide.valor),0.0)).filter(q.whereclause).scalar()
-        receita_tip = db.session.query(func.coalesce(func.sum(ScheduledRide.gorjeta),0.0)).filter(q.whereclause).scalar()
-        receita = float(receita_val) + float(receita_tip)
-        milhas = float(db.session.query(func.coalesce(func.sum(ScheduledRide.distance_miles),0.0)).filter(q.whereclause).scalar())
-
-        # custos: somente despesas ligadas a corridas dessa estação
-        ride_ids = [r.id for r in q.all()]
-        if ride_ids:
-            custos = float(db.session.query(func.coalesce(func.sum(Expense.valor),0.0)).filter(Expense.ride_id.in_(ride_ids)).scalar())
-        else:
-            custos = 0.0
-        lucro = receita - custos
-        margem = (lucro/receita*100.0) if receita>0 else 0.0
-        custo_milha = (custos/milhas) if milhas>0 else 0.0
-
-        data.append({
-            "estacao": f"{est.nome}" + (f" ({est.codigo})" if est.codigo else ""),
-            "receita": round(receita,2),
-            "custos": round(custos,2),
-            "lucro": round(lucro,2),
-            "margem": round(margem,2),
-            "milhas": round(milhas,2),
-            "custo_milha": round(custo_milha,4),
-        })
-
-    # Totais gerais
-    q_all = ScheduledRide.query.filter(
-        ScheduledRide.inicio >= datetime.combine(inicio, datetime.min.time()),
-        ScheduledRide.fim <= datetime.combine(fim, datetime.max.time()),
-        ScheduledRide.exclude_from_reports.is_(False)
-    )
-    receita_val = db.session.query(func.coalesce(func.sum(ScheduledRide.valor),0.0)).filter(q_all.whereclause).scalar()
-    receita_tip = db.session.query(func.coalesce(func.sum(ScheduledRide.gorjeta),0.0)).filter(q_all.whereclause).scalar()
-    receita_total = float(receita_val) + float(receita_tip)
-    milhas_total = float(db.session.query(func.coalesce(func.sum(ScheduledRide.distance_miles),0.0)).filter(q_all.whereclause).scalar())
-
-    # despesas totais (todas as despesas do período, vinculadas ou não)
-    despesas_total = float(db.session.query(func.coalesce(func.sum(Expense.valor),0.0)).filter(
-        Expense.data >= datetime.combine(inicio, datetime.min.time()),
-        Expense.data <= datetime.combine(fim, datetime.max.time()),
-    ).scalar())
-
-    lucro_total = receita_total - despesas_total
-    margem_total = (lucro_total/receita_total*100.0) if receita_total>0 else 0.0
-    custo_milha_total = (despesas_total/milhas_total) if milhas_total>0 else 0.0
+    inicio, fim, _ = periodo()
+
+    linhas, t = em_cache("relatorios.estacoes_compare", inicio, fim, None,
+                         lambda: (por_estacao(inicio, fim), totais(inicio, fim)))
+
+    # Uma linha por estação, já agrupada no banco
+    data = [
+        {**l,
+         "receita": round(l["receita"],2),
+         "custos": round(l["custos"],2),
+         "lucro": round(l["lucro"],2),
+         "margem": round(l["margem"],2),
+         "milhas": round(l["milhas"],2),
+         "custo_milha": round(l["custo_milha"],4)}
+        for l in linhas
+    ]
+
+    # Totais gerais (despesas: todas as do período, vinculadas ou não)
+    receita_total, despesas_total, milhas_total = t["receita"], t["custo"], t["milhas"]
+    lucro_total, margem_total, custo_milha_total = t["lucro"], t["margem"], t["custo_milha"]
 
     return render_template("relatorios/estacoes.html",
                            inicio=inicio, fim=fim,
@@ -296,3 +191,68 @@ def estacoes_compare():
                            margem_total=round(margem_total,2),
                            milhas_total=round(milhas_total,2),
                            custo_milha_total=round(custo_milha_total,4))
+\
+
+@bp.route("/ranking", methods=["GET"])
+def ranking():
+    """Melhores e piores corridas ou estações do período por uma métrica (JSON).
+
+    ?alvo=corridas|estacoes&metrica=por_hora|por_milha|lucro|margem|custo_milha&n=20
+    Cada lado é um ORDER BY ... LIMIT n no banco; o período nunca é carregado inteiro.
+    """
+    from flask import jsonify
+    inicio, fim, station_id = periodo()
+    alvo = request.args.get("alvo", "corridas")
+    metrica = request.args.get("metrica", "por_hora")
+    if alvo not in ("corridas", "estacoes"):
+        return jsonify(erro="alvo deve ser corridas ou estacoes"), 400
+    if metrica not in METRICAS_RANKING:
+        return jsonify(erro="metrica deve ser " + ", ".join(METRICAS_RANKING)), 400
+    n = max(1, min(request.args.get("n", RANKING_N, type=int) or RANKING_N, RANKING_MAX))
+    if alvo == "estacoes":
+        station_id = None
+
+    lados = em_cache(f"relatorios.ranking.{alvo}.{metrica}.{n}", inicio, fim, station_id,
+                     lambda: consultar_ranking(alvo, inicio, fim, metrica, n, station_id))
+
+    def formatar(linha):
+        saida = {}
+        for k, v in linha.items():
+            if isinstance(v, datetime):
+                v = v.isoformat()
+            elif isinstance(v, float):
+                v = round(v, 4 if k == "valor" else 2)
+            saida[k] = v
+        return saida
+
+    return jsonify(alvo=alvo, metrica=metrica, n=n, inicio=inicio.isoformat(), fim=fim.isoformat(),
+                   station_id=station_id,
+                   melhores=[formatar(l) for l in lados["melhores"]],
+                   piores=[formatar(l) for l in lados["piores"]])
+\
+
+@bp.route("/serie", methods=["GET"])
+def serie():
+    """Série temporal do período para gráficos (JSON), agrupada no banco a partir de resumo_diario.
+
+    ?intervalo=dia|semana|mes (padrão dia) e os filtros de período/estação do relatório.
+    Colunas por bucket: valor, gorjeta, receita, milhas, horas, qtd, despesas, lucro;
+    em "medias", a receita diária com médias móveis de 7 e 30 dias.
+    """
+    from flask import jsonify
+    inicio, fim, station_id = periodo()
+    intervalo = request.args.get("intervalo", "dia")
+    if intervalo not in BUCKETS_SERIE:
+        return jsonify(erro="intervalo deve ser dia, semana ou mes"), 400
+    if fim < inicio:
+        return jsonify(erro="fim antes do início"), 400
+
+    dados = em_cache(f"relatorios.serie.{intervalo}", inicio, fim, station_id,
+                     lambda: consultar_serie(inicio, fim, intervalo, station_id))
+    arredondar = lambda valores: [round(v, 2) for v in valores]
+    return jsonify(
+        intervalo=intervalo, inicio=inicio.isoformat(), fim=fim.isoformat(),
+        station_id=station_id,
+        **{k: (v if k in ("rotulos", "qtd") else arredondar(v)) for k, v in dados.items() if k != "medias"},
+        medias={k: (v if k == "rotulos" else arredondar(v)) for k, v in dados["medias"].items()},
+    )
@@ -1,10 +1,26 @@
 \
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from datetime import datetime
+from sqlalchemy.orm import joinedload, raiseload
 from ..models import db, ScheduledRide, Station
+from .. import resumo
+from ..paginacao import paginar, links
 
 bp = Blueprint("rides", __name__, url_prefix="/corridas")
 
+# Erros de importação listados na página (o restante só é contado)
+ERROS_NA_TELA = 200
+
+# ?ordem= da listagem: coluna da paginação e conversão do cursor (maior primeiro)
+ORDENS = {
+    "inicio": (ScheduledRide.inicio, datetime.fromisoformat),
+    "lucro": (ScheduledRide.lucro, float),
+}
+
+def ordem_pedida():
+    ordem = request.args.get("ordem")
+    return ordem if ordem in ORDENS else "inicio"
+
 def parse_dt(value: str):
     # Espera formato HTML datetime-local: YYYY-MM-DDTHH:MM
     return datetime.strptime(value, "%Y-%m-%dT%H:%M")
@@ -15,10 +31,33 @@ def calcular_horas(dt_ini: datetime, dt_fim: datetime) -> float:
     delta = dt_fim - dt_ini
     return round(delta.total_seconds()/3600.0, 2)
 
+def ride_json(r):
+    return {
+        "id": r.id, "titulo": r.titulo,
+        "inicio": r.inicio.isoformat(), "fim": r.fim.isoformat(),
+        "horas": r.horas, "valor": r.valor, "gorjeta": r.gorjeta,
+        "distance_miles": r.distance_miles, "station_id": r.station_id,
+        "exclude_from_reports": bool(r.exclude_from_reports),
+        "receita_total": r.receita_total, "despesas_vinculadas": r.despesas_vinculadas,
+        "lucro": r.lucro, "custo_milha": r.custo_milha,
+    }
+
 @bp.get("/")
 def index():
-    rides = ScheduledRide.query.order_by(ScheduledRide.inicio.desc()).limit(200).all()
-    return render_template("rides/index.html", rides=rides)
+    ordem = ordem_pedida()
+    coluna, conv = ORDENS[ordem]
+    q = ScheduledRide.query.options(joinedload(ScheduledRide.station), raiseload("*"))
+    pagina = paginar(q, coluna, ScheduledRide.id, conv=conv)
+    return render_template("rides/index.html", rides=pagina.itens, pagina=pagina, ordem=ordem,
+                           pagina_params={"ordem": ordem} if ordem != "inicio" else {})
+
+@bp.get("/json")
+def index_json():
+    ordem = ordem_pedida()
+    coluna, conv = ORDENS[ordem]
+    pagina = paginar(ScheduledRide.query.options(raiseload("*")), coluna, ScheduledRide.id, conv=conv)
+    params = {"ordem": ordem} if ordem != "inicio" else {}
+    return jsonify(itens=[ride_json(r) for r in pagina.itens], **links(pagina, "rides.index_json", **params))
 
 @bp.route("/nova", methods=["GET","POST"])
 def nova():
@@ -42,16 +81,40 @@ def nova():
             exclude_from_reports=exclude_from_reports
         )
         db.session.add(ride)
+        resumo.aplicar_corrida(ride)
         db.session.commit()
         flash("Corrida criada!", "success")
         return redirect(url_for("rides.index"))
     return render_template("rides/form.html", estacoes=estacoes, ride=None)
 
+@bp.route("/importar", methods=["GET","POST"])
+def importar():
+    """Importa corridas de um CSV no layout do export de relatórios (ver amazon_flex.importacao)."""
+    import io
+    from ..importacao import importar_corridas, CAMPOS_CORRIDAS
+    from ..orcamento_sql import liberar
+    resultado = None
+    if request.method == "POST":
+        file = request.files.get("arquivo")
+        if not file:
+            flash("Nenhum arquivo enviado.", "warning")
+            return redirect(url_for("rides.importar"))
+        liberar()  # um INSERT por lote
+        arquivo = io.TextIOWrapper(file.stream, encoding="utf-8-sig", newline="")
+        resultado = importar_corridas(arquivo, ignorar_erros=bool(request.form.get("ignorar_erros")))
+        if resultado.inseridas:
+            flash(f"{resultado.inseridas} corrida(s) importada(s).", "success")
+        elif resultado.erros:
+            flash("Nada foi importado: corrija os erros abaixo.", "danger")
+    return render_template("importar.html", titulo="Importar corridas", layout=",".join(CAMPOS_CORRIDAS),
+                           voltar=url_for("rides.index"), resultado=resultado, erros_max=ERROS_NA_TELA)
+
 @bp.route("/<int:id>/editar", methods=["GET","POST"])
 def editar(id):
     ride = ScheduledRide.query.get_or_404(id)
     estacoes = Station.query.order_by(Station.nome).all()
     if request.method == "POST":
+        resumo.aplicar_corrida(ride, -1)
         ride.titulo = request.form.get("titulo","").strip() or None
         ride.inicio = parse_dt(request.form["inicio"])
         ride.fim = parse_dt(request.form["fim"])
@@ -62,6 +125,7 @@ def editar(id):
         ride.station_id = int(station_id) if station_id else None
         ride.exclude_from_reports = bool(request.form.get("exclude_from_reports"))
         ride.horas = calcular_horas(ride.inicio, ride.fim)
+        resumo.aplicar_corrida(ride)
         db.session.commit()
         flash("Corrida atualizada!", "success")
         return redirect(url_for("rides.index"))
@@ -70,6 +134,7 @@ def editar(id):
 @bp.post("/<int:id>/excluir")
 def excluir(id):
     ride = ScheduledRide.query.get_or_404(id)
+    resumo.remover_corrida(ride)
     db.session.delete(ride)
     db.session.commit()
     flash("Corrida excluída.", "success")
@@ -1,13 +1,23 @@
 \
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from ..models import db, Station
+from .. import resumo
+from ..paginacao import paginar, links
 
 bp = Blueprint("stations", __name__, url_prefix="/estacoes")
 
+def station_json(e):
+    return {"id": e.id, "nome": e.nome, "codigo": e.codigo, "endereco": e.endereco}
+
 @bp.get("/")
 def index():
-    estacoes = Station.query.order_by(Station.nome).all()
-    return render_template("stations/index.html", estacoes=estacoes)
+    pagina = paginar(Station.query, Station.nome, Station.id, desc=False, conv=str)
+    return render_template("stations/index.html", estacoes=pagina.itens, pagina=pagina)
+
+@bp.get("/json")
+def index_json():
+    pagina = paginar(Station.query, Station.nome, Station.id, desc=False, conv=str)
+    return jsonify(itens=[station_json(e) for e in pagina.itens], **links(pagina, "stations.index_json"))
 
 @bp.route("/nova", methods=["GET","POST"])
 def nova():
@@ -39,6 +49,7 @@ def editar(id):
 @bp.post("/<int:id>/excluir")
 def excluir(id):
     e = Station.query.get_or_404(id)
+    resumo.remover_estacao(e.id)
     db.session.delete(e)
     db.session.commit()
     flash("Estação excluída.", "success")
@@ -0,0 +1,44 @@
+"""Versão dos dados (tabela versao_dados), usada como parte das chaves de cache.
+
+Os eventos after_insert/after_update/after_delete de ScheduledRide, Expense e
+Station marcam a sessão; no fim do flush a versão sobe uma vez, na mesma
+transação da alteração. Escritas em massa que não passam pelo ORM chamam
+incrementar() diretamente.
+"""
+from sqlalchemy import event, update, select, func
+from sqlalchemy.orm import Session, object_session
+from .models import db, ScheduledRide, Expense, Station, VersaoDados
+
+_MARCA = "versao_dados_alterada"
+
+
+def _marcar(mapper, connection, target):
+    sessao = object_session(target)
+    if sessao is not None:
+        sessao.info[_MARCA] = True
+
+
+for _model in (ScheduledRide, Expense, Station):
+    for _evento in ("after_insert", "after_update", "after_delete"):
+        event.listen(_model, _evento, _marcar)
+
+
+@event.listens_for(Session, "after_flush")
+def _incrementar_no_flush(session, flush_context):
+    if session.info.pop(_MARCA, False):
+        session.execute(update(VersaoDados).where(VersaoDados.id == 1).values(versao=VersaoDados.versao + 1))
+
+
+def incrementar():
+    """Sobe a versão na transação atual (sem commit)."""
+    db.session.execute(update(VersaoDados).where(VersaoDados.id == 1).values(versao=VersaoDados.versao + 1))
+
+
+def atual():
+    return db.session.execute(select(VersaoDados.versao).where(VersaoDados.id == 1)).scalar() or 0
+
+
+def avancar_alem(anterior):
+    """Após trocar o banco (restore), garante versão maior que a do banco anterior."""
+    db.session.execute(update(VersaoDados).where(VersaoDados.id == 1)
+                       .values(versao=func.max(VersaoDados.versao, anterior) + 1))
@@ -3,7 +3,11 @@ from flask import Flask, render_template, request, redirect, url_for, flash
 from dotenv import load_dotenv
 import os
 from datetime import datetime
-from models import init_db, get_session, Station, Run
+from sqlalchemy import select, func, and_, or_
+from models import init_db, get_engine, get_session, pool_status, Station, Run
+from purge import purge_runs, archive_name, PurgeJob, PURGE_CHUNK
+from amazon_flex import metricas
+import click
 from forms import StationForm, RunForm
 
 load_dotenv()
@@ -15,6 +19,16 @@ app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-key')
 init_db()
 Session = get_session()
 
+# Latência, SQL e templates por endpoint (/metrics); mesmo exportador do amazon_flex
+metricas.init_app(app, get_engine(), caminho='/metrics')
+
+# Exclusão em lotes disparada pelo relatório (estado em arquivo, visto por todos os workers)
+purge_job = PurgeJob(os.path.join(app.instance_path, 'purge', 'status.json'))
+
+# Corridas por página em /reports (o total vem sempre do período inteiro)
+REPORT_PAGE_SIZE = 200
+REPORT_PAGE_MAX = 1000
+
 def calc_margin(total_revenue, total_tips, total_cost):
     lucro = (total_revenue or 0) + (total_tips or 0) - (total_cost or 0)
     base = (total_revenue or 0)
@@ -26,6 +40,28 @@ def calc_margin(total_revenue, total_tips, total_cost):
 def index():
     return render_template('index.html')
 
+@app.route('/metrics/pool')
+def metrics_pool():
+    # Checkouts, conexões em uso e overflow do pool deste worker
+    return pool_status()
+
+@app.route('/purge/status')
+def purge_status():
+    # Progresso da exclusão em lotes iniciada em /reports (por qualquer worker)
+    return purge_job.status()
+
+@app.cli.command('purge-runs')
+@click.option('--before', 'before', required=True, help='Exclui corridas com início antes desta data (YYYY-MM-DD).')
+@click.option('--chunk', default=PURGE_CHUNK, show_default=True, help='Corridas por transação.')
+@click.option('--archive', 'archive_path', default=None, help='Grava as corridas excluídas neste CSV .gz antes.')
+def purge_runs_cmd(before, chunk, archive_path):
+    """Exclui corridas antigas em lotes, com progresso."""
+    cut = datetime.strptime(before, '%Y-%m-%d')
+    def progress(deleted, total):
+        click.echo(f'\r{deleted}/{total} corrida(s) excluída(s)', nl=False)
+    deleted = purge_runs(Session, cut, chunk=chunk, archive_path=archive_path, progress=progress)
+    click.echo(f'\nConcluído: {deleted} corrida(s) anteriores a {cut.date()}.')
+
 # ---------- ESTAÇÕES ----------
 @app.route('/stations')
 def stations():
@@ -147,45 +183,78 @@ def reports():
     end = request.values.get('end')
     action_delete_before = request.values.get('delete_before')  # data para excluir corridas anteriores
 
-    # Exclusão de corridas mais antigas que uma data
+    # Exclusão de corridas mais antigas que uma data: em lotes, em segundo plano
     if action_delete_before and request.method == 'POST':
         try:
             cut = datetime.strptime(action_delete_before, '%Y-%m-%d')
-            with Session() as s:
-                q = s.query(Run).filter(Run.start_dt < cut)
-                deleted = q.delete(synchronize_session=False)
-                s.commit()
-            flash(f'{deleted} corrida(s) anteriores a {cut.date()} foram excluídas.', 'warning')
-        except Exception as e:
+        except ValueError:
             flash('Data inválida para exclusão.', 'danger')
+        else:
+            archive_path = archive_name(os.path.join(app.instance_path, 'purge'), cut) if request.values.get('archive') else None
+            if purge_job.start(Session, cut, archive_path):
+                flash(f'Exclusão das corridas anteriores a {cut.date()} iniciada; acompanhe em {url_for("purge_status")}.', 'warning')
+            else:
+                flash('Já existe uma exclusão em andamento.', 'danger')
 
     qparams = {}
+    filters = []
+    if station_id:
+        filters.append(Run.station_id == station_id)
+    if start:
+        try:
+            start_dt = datetime.strptime(start, '%Y-%m-%d')
+            filters.append(Run.start_dt >= start_dt)
+            qparams['start'] = start
+        except:
+            pass
+    if end:
+        try:
+            end_dt = datetime.strptime(end, '%Y-%m-%d')
+            filters.append(Run.end_dt <= end_dt)
+            qparams['end'] = end
+        except:
+            pass
+
+    # LIMIT negativo no SQLite devolveria tudo
+    page_size = max(1, min(request.args.get('per_page', REPORT_PAGE_SIZE, type=int) or REPORT_PAGE_SIZE, REPORT_PAGE_MAX))
+    if page_size != REPORT_PAGE_SIZE:
+        qparams['per_page'] = page_size
+    after = request.args.get('after')
     with Session() as s:
-        q = s.query(Run)
-        if station_id:
-            q = q.filter(Run.station_id == station_id)
-        if start:
-            try:
-                start_dt = datetime.strptime(start, '%Y-%m-%d')
-                q = q.filter(Run.start_dt >= start_dt)
-                qparams['start'] = start
-            except:
-                pass
-        if end:
+        # Agregados: uma consulta só, com os mesmos filtros da listagem
+        totals_row = s.execute(
+            select(
+                func.coalesce(func.sum(Run.hours), 0.0),
+                func.coalesce(func.sum(Run.miles), 0.0),
+                func.coalesce(func.sum(Run.revenue), 0.0),
+                func.coalesce(func.sum(Run.tips), 0.0),
+                func.coalesce(func.sum(Run.cost), 0.0),
+                func.count(Run.id),
+            ).where(*filters)
+        ).one()
+
+        # Listagem paginada por cursor (start_dt, id): ?after=<start_dt>_<id>
+        q = select(Run).where(*filters)
+        if after:
             try:
-                end_dt = datetime.strptime(end, '%Y-%m-%d')
-                q = q.filter(Run.end_dt <= end_dt)
-                qparams['end'] = end
-            except:
-                pass
-        data = q.order_by(Run.start_dt.asc()).all()
+                after_dt, after_id = after.rsplit('_', 1)
+                after_dt, after_id = datetime.fromisoformat(after_dt), int(after_id)
+                q = q.where(or_(Run.start_dt > after_dt, and_(Run.start_dt == after_dt, Run.id > after_id)))
+            except ValueError:
+                after = None
+        data = s.scalars(q.order_by(Run.start_dt.asc(), Run.id.asc()).limit(page_size + 1)).all()
+    next_after = None
+    if len(data) > page_size:
+        data = data[:page_size]
+        next_after = f"{data[-1].start_dt.isoformat()}_{data[-1].id}"
 
     # Agregados
-    total_hours = round(sum(r.hours for r in data), 2)
-    total_miles = round(sum((r.miles or 0) for r in data), 2)
-    total_revenue = round(sum((r.revenue or 0) for r in data), 2)
-    total_tips = round(sum((r.tips or 0) for r in data), 2)
-    total_cost = round(sum((r.cost or 0) for r in data), 2)
+    total_hours, total_miles, total_revenue, total_tips, total_cost, total_runs = totals_row
+    total_hours = round(total_hours, 2)
+    total_miles = round(total_miles, 2)
+    total_revenue = round(total_revenue, 2)
+    total_tips = round(total_tips, 2)
+    total_cost = round(total_cost, 2)
     margin_pct, lucro = calc_margin(total_revenue, total_tips, total_cost)
 
     return render_template(
@@ -195,6 +264,8 @@ def reports():
         sel_station=station_id,
         start=start or '',
         end=end or '',
+        next_url=url_for('reports', station_id=station_id, after=next_after, **qparams) if next_after else None,
+        first_url=url_for('reports', station_id=station_id, **qparams) if after else None,
         totals=dict(
             hours=total_hours,
             miles=total_miles,
@@ -203,6 +274,7 @@ def reports():
             cost=total_cost,
             lucro=lucro,
             margin_pct=margin_pct,
+            runs=total_runs,
         )
     )
 
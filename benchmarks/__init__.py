@@ -0,0 +1 @@
+"""Benchmarks do amazon_flex (rodar da raiz do repositório com `python -m benchmarks.<modulo>`)."""
@@ -0,0 +1,99 @@
+"""Gerador determinístico de dados sintéticos do Flex para os benchmarks.
+
+Preenche um banco SQLite novo (schema das migrações do app) com estações,
+corridas de um ano e despesas, metade vinculada a corridas; resumo_diario
+e as colunas derivadas são recalculados no fim. A mesma semente e os
+mesmos tamanhos geram sempre o mesmo banco.
+
+    python -m benchmarks.dados /tmp/flex_100k.db --corridas 100000
+"""
+import argparse
+import os
+import random
+from datetime import datetime, timedelta
+
+LOTE = 10_000
+ANO = datetime(2024, 1, 1)
+DURACOES = (2.0, 3.0, 3.5, 4.0, 4.5)
+
+
+def criar_app(caminho):
+    """App apontando para `caminho` (DB_FILE absoluto), com o schema migrado."""
+    os.environ["DB_FILE"] = os.path.abspath(caminho)
+    from amazon_flex import create_app
+    return create_app()
+
+
+def _corrida(rnd, estacoes):
+    # Blocos começam entre 6h e 22h, em múltiplos de 15 min
+    dia = ANO + timedelta(days=rnd.randrange(366))
+    inicio = dia.replace(hour=rnd.randint(6, 22), minute=rnd.choice((0, 15, 30, 45)))
+    horas = rnd.choice(DURACOES)
+    return {
+        "inicio": inicio,
+        "fim": inicio + timedelta(hours=horas),
+        "horas": horas,
+        "valor": round(horas * rnd.uniform(18, 28), 2),
+        "gorjeta": round(rnd.uniform(0, 25), 2) if rnd.random() < 0.6 else 0.0,
+        "distance_miles": round(horas * rnd.uniform(8, 18), 1),
+        "station_id": rnd.choice(estacoes) if rnd.random() < 0.95 else None,
+        "exclude_from_reports": rnd.random() < 0.03,
+    }
+
+
+def gerar(caminho, corridas, estacoes=20, despesas=None, semente=42):
+    """Cria `caminho` com os dados; despesas padrão = corridas/5. Retorna o app."""
+    from sqlalchemy import insert
+    from amazon_flex.models import db, Station, ScheduledRide, Expense
+    from amazon_flex import resumo, versao, derivados
+
+    if os.path.exists(caminho):
+        os.remove(caminho)
+    despesas = corridas // 5 if despesas is None else despesas
+    rnd = random.Random(semente)
+    app = criar_app(caminho)
+    with app.app_context():
+        db.session.execute(insert(Station), [
+            {"nome": f"Estação {i:02d}", "codigo": f"D{i:03d}" if i % 3 else None} for i in range(1, estacoes + 1)
+        ])
+        ids_estacoes = list(range(1, estacoes + 1))
+
+        inicios = []
+        for feitos in range(0, corridas, LOTE):
+            lote = [_corrida(rnd, ids_estacoes) for _ in range(min(LOTE, corridas - feitos))]
+            inicios += [r["inicio"] for r in lote]
+            db.session.execute(insert(ScheduledRide), lote)
+
+        for feitos in range(0, despesas, LOTE):
+            lote = []
+            for _ in range(min(LOTE, despesas - feitos)):
+                if inicios and rnd.random() < 0.5:
+                    ride_id = rnd.randrange(len(inicios))
+                    lote.append({"data": inicios[ride_id], "descricao": "Combustível",
+                                 "valor": round(rnd.uniform(15, 60), 2), "ride_id": ride_id + 1})
+                else:
+                    lote.append({"data": ANO + timedelta(days=rnd.randrange(366), hours=rnd.randint(6, 22)),
+                                 "descricao": rnd.choice(("Pedágio", "Manutenção", "Celular", "Lavagem")),
+                                 "valor": round(rnd.uniform(5, 120), 2), "ride_id": None})
+            db.session.execute(insert(Expense), lote)
+
+        derivados.recalcular()
+        resumo.reconstruir()
+        versao.incrementar()
+        db.session.commit()
+    return app
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("caminho")
+    ap.add_argument("--corridas", type=int, default=10_000)
+    ap.add_argument("--estacoes", type=int, default=20)
+    ap.add_argument("--despesas", type=int, default=None, help="padrão: corridas/5")
+    ap.add_argument("--semente", type=int, default=42)
+    args = ap.parse_args(argv)
+    gerar(args.caminho, args.corridas, args.estacoes, args.despesas, args.semente)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""Latência, consultas e pico de memória das rotas mais usadas, por volume de dados.
+
+Para cada tamanho (corridas) gera um banco com benchmarks.dados e mede cada
+rota num processo novo (o pico de RSS é do processo). Antes de cada repetição
+os caches do app (relatórios e PDFs) são esvaziados, então a mediana/p95 e as
+consultas são de cache miss, o custo real da consulta; o mesmo request logo
+em seguida dá o tempo com cache (quente_ms). O primeiro request do processo
+(templates ainda não compilados) fica à parte em primeira_ms. O resultado vai
+para um JSON que serve de base para comparar commits.
+
+    python -m benchmarks.endpoints --tamanhos 10000 100000 --saida base.json
+    python -m benchmarks.endpoints --comparar base.json   # sai com 1 se piorou
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+
+from benchmarks import dados
+
+TAMANHOS = (10_000, 100_000, 1_000_000)
+PERIODO = "inicio=2024-04-01&fim=2024-06-30"  # um trimestre (PDF ainda gerado no request)
+
+ROTAS = {
+    "relatorios.index": "/relatorios/?" + PERIODO,
+    "relatorios.pdf": "/relatorios/pdf?" + PERIODO,
+    "relatorios.csv_export": "/relatorios/csv?" + PERIODO,
+    "relatorios.estacoes_compare": "/relatorios/estacoes?" + PERIODO,
+    "relatorios.ranking": "/relatorios/ranking?metrica=por_hora&" + PERIODO,
+    "relatorios.serie": "/relatorios/serie?inicio=2024-01-01&fim=2024-12-31",
+    "rides.index": "/corridas/",
+    "expenses.index": "/despesas/",
+    "backup.download": "/backup/download",
+}
+
+
+def _rss_pico_mb():
+    """Pico de RSS do processo. VmHWM é do espaço de memória atual; ru_maxrss
+    (fallback fora do Linux) herda o pico do pai através do fork/exec."""
+    try:
+        with open("/proc/self/status") as f:
+            for linha in f:
+                if linha.startswith("VmHWM:"):
+                    return round(int(linha.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    import resource
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def _medir(caminho, instancia, rota, url, repeticoes, fila):
+    """Roda no processo filho: sobe o app sobre `caminho` e mede `url`."""
+    try:
+        fila.put(_medir_rota(caminho, instancia, rota, url, repeticoes))
+    except Exception as e:  # o pai não pode ficar esperando a fila
+        fila.put({"rota": rota, "erro": repr(e)})
+
+
+def _esfriar(app):
+    """Esvazia os caches do app: o próximo request é um cache miss."""
+    from amazon_flex import relatorio_pdf
+    cache = app.extensions["cache_relatorios"]
+    cache.memoria.limpar()
+    if cache.disco is not None:
+        shutil.rmtree(cache.disco.diretorio, ignore_errors=True)
+        os.makedirs(cache.disco.diretorio, exist_ok=True)
+    shutil.rmtree(relatorio_pdf.diretorio(app), ignore_errors=True)
+
+
+def _request(cliente, url, consultas):
+    consultas[0] = 0
+    t0 = time.perf_counter()
+    resp = cliente.get(url)
+    tamanho = len(resp.get_data())  # consome respostas em streaming
+    resp.close()
+    return (time.perf_counter() - t0) * 1000, consultas[0], resp.status_code, tamanho
+
+
+def _medir_rota(caminho, instancia, rota, url, repeticoes):
+    from sqlalchemy import event
+    from amazon_flex.models import db
+
+    app = dados.criar_app(caminho)
+    app.instance_path = instancia  # PDFs e temporários fora do instance/ do projeto
+    consultas = [0]
+    with app.app_context():
+        event.listen(db.engine, "before_cursor_execute", lambda *a: consultas.__setitem__(0, consultas[0] + 1))
+    cliente = app.test_client()
+    rss_boot = _rss_pico_mb()
+
+    frias, quentes = [], []
+    for _ in range(1 + repeticoes):
+        _esfriar(app)
+        ms, n_fria, status, tamanho = _request(cliente, url, consultas)
+        frias.append(ms)
+        ms, n_quente, _, _ = _request(cliente, url, consultas)
+        quentes.append(ms)
+
+    medidas = sorted(frias[1:]) or frias
+    return {
+        "rota": rota,
+        "status": status,
+        "bytes": tamanho,
+        "primeira_ms": round(frias[0], 2),
+        "mediana_ms": round(statistics.median(medidas), 2),
+        "p95_ms": round(medidas[min(len(medidas) - 1, int(len(medidas) * 0.95))], 2),
+        "quente_ms": round(statistics.median(quentes[1:] or quentes), 2),
+        "consultas": n_fria,
+        "consultas_quente": n_quente,
+        "rss_boot_mb": rss_boot,
+        "rss_pico_mb": _rss_pico_mb(),
+    }
+
+
+def medir_tamanho(corridas, rotas, repeticoes, diretorio, semente):
+    caminho = os.path.join(diretorio, f"flex_{corridas}_{semente}.db")
+    if not os.path.exists(caminho):
+        t0 = time.perf_counter()
+        dados.gerar(caminho, corridas, semente=semente)
+        print(f"[{corridas}] banco gerado em {time.perf_counter() - t0:.1f}s", flush=True)
+
+    ctx = mp.get_context("spawn")
+    resultados = []
+    for rota in rotas:
+        instancia = tempfile.mkdtemp(dir=diretorio)
+        fila = ctx.Queue()
+        p = ctx.Process(target=_medir, args=(caminho, instancia, rota, ROTAS[rota], repeticoes, fila))
+        p.start()
+        r = fila.get()
+        p.join()
+        shutil.rmtree(instancia, ignore_errors=True)
+        if "erro" in r:
+            print(f"[{corridas}] {rota}: falhou ({r['erro']})", flush=True)
+            continue
+        r["corridas"] = corridas
+        resultados.append(r)
+        print(f"[{corridas}] {rota}: {r['status']} mediana (sem cache) {r['mediana_ms']} ms,"
+              f" com cache {r['quente_ms']} ms, {r['consultas']} consulta(s), pico {r['rss_pico_mb']} MB", flush=True)
+    return resultados
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparar(base, atual, tolerancia):
+    """Lista de regressões: mediana sem cache acima de (1+tolerancia)x a base ou mais consultas."""
+    antes = {(r["corridas"], r["rota"]): r for r in base["resultados"]}
+    regressoes = []
+    for r in atual["resultados"]:
+        b = antes.get((r["corridas"], r["rota"]))
+        if b is None:
+            continue
+        variacao = (r["mediana_ms"] - b["mediana_ms"]) / b["mediana_ms"] if b["mediana_ms"] else 0.0
+        print(f"{r['corridas']:>9} {r['rota']:<30} {b['mediana_ms']:>10.2f} -> {r['mediana_ms']:>10.2f} ms"
+              f" ({variacao:+.0%})  consultas {b['consultas']} -> {r['consultas']}")
+        if variacao > tolerancia:
+            regressoes.append(f"{r['rota']} com {r['corridas']} corridas: mediana {variacao:+.0%}")
+        if r["consultas"] > b["consultas"]:
+            regressoes.append(f"{r['rota']} com {r['corridas']} corridas: {b['consultas']} -> {r['consultas']} consultas")
+        if r["status"] != b["status"]:
+            regressoes.append(f"{r['rota']} com {r['corridas']} corridas: status {b['status']} -> {r['status']}")
+    return regressoes
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--tamanhos", type=int, nargs="+", default=None, help=f"corridas por banco (padrão: {TAMANHOS})")
+    ap.add_argument("--rotas", nargs="+", choices=sorted(ROTAS), default=None)
+    ap.add_argument("--repeticoes", type=int, default=5, help="requests sem cache medidos depois do primeiro")
+    ap.add_argument("--semente", type=int, default=42)
+    ap.add_argument("--dados", default=None, help="diretório para guardar/reaproveitar os bancos gerados")
+    ap.add_argument("--saida", default=None, help="grava o resultado neste JSON")
+    ap.add_argument("--comparar", default=None, help="JSON base; sai com 1 se houver regressão")
+    ap.add_argument("--tolerancia", type=float, default=0.2, help="piora aceita na mediana (0.2 = 20%%)")
+    args = ap.parse_args(argv)
+
+    base = None
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            base = json.load(f)
+    # Sem parâmetros, a comparação repete a configuração da base
+    tamanhos = args.tamanhos or (base["config"]["tamanhos"] if base else list(TAMANHOS))
+    rotas = args.rotas or (base["config"]["rotas"] if base else list(ROTAS))
+
+    diretorio = args.dados or tempfile.mkdtemp(prefix="flex_bench_")
+    os.makedirs(diretorio, exist_ok=True)
+    resultados = []
+    for corridas in tamanhos:
+        resultados += medir_tamanho(corridas, rotas, args.repeticoes, diretorio, args.semente)
+
+    atual = {
+        "gerado_em": datetime.now().isoformat(timespec="seconds"),
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "config": {"tamanhos": tamanhos, "rotas": rotas, "repeticoes": args.repeticoes, "semente": args.semente},
+        "resultados": resultados,
+    }
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(atual, f, indent=2, ensure_ascii=False)
+
+    if base is not None:
+        regressoes = comparar(base, atual, args.tolerancia)
+        for r in regressoes:
+            print("REGRESSÃO:", r)
+        if regressoes:
+            raise SystemExit(1)
+    return atual
+
+
+if __name__ == "__main__":
+    main()
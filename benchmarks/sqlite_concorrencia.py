@@ -0,0 +1,128 @@
+"""Vazão de leitura do relatório enquanto há escritas em andamento.
+
+Compara o journal padrão do SQLite (rollback, synchronous=FULL) com o perfil
+de amazon_flex.perfil_sqlite (WAL por padrão, ou o que estiver no ambiente).
+Um processo escritor insere corridas em transações curtas sem parar; N
+processos leitores rodam a soma do relatório durante o tempo pedido.
+
+    python -m benchmarks.sqlite_concorrencia --leitores 4 --segundos 5
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from amazon_flex.perfil_sqlite import perfil_do_ambiente, aplicar
+
+PERFIL_PADRAO = {"busy_timeout": 5000, "journal_mode": "DELETE", "synchronous": "FULL"}
+
+CONSULTA = (
+    "SELECT coalesce(sum(valor),0), coalesce(sum(gorjeta),0), coalesce(sum(distance_miles),0), count(id) "
+    "FROM scheduled_rides WHERE inicio >= ? AND fim <= ? AND exclude_from_reports IS 0"
+)
+INSERE = (
+    "INSERT INTO scheduled_rides (inicio, fim, horas, valor, gorjeta, distance_miles, exclude_from_reports) "
+    "VALUES (?, ?, ?, ?, ?, ?, 0)"
+)
+
+
+def conectar(caminho, perfil):
+    conn = sqlite3.connect(caminho, timeout=30)
+    aplicar(conn, perfil)
+    return conn
+
+
+def preparar(caminho, linhas):
+    conn = sqlite3.connect(caminho)
+    conn.executescript(
+        "CREATE TABLE scheduled_rides (id INTEGER PRIMARY KEY, inicio DATETIME NOT NULL, fim DATETIME NOT NULL,"
+        " horas FLOAT NOT NULL, valor FLOAT NOT NULL, gorjeta FLOAT NOT NULL, distance_miles FLOAT NOT NULL,"
+        " exclude_from_reports BOOLEAN NOT NULL DEFAULT 0);"
+        "CREATE INDEX ix_scheduled_rides_relatorio ON scheduled_rides (inicio, fim, exclude_from_reports,"
+        " valor, gorjeta, distance_miles, horas);"
+    )
+    rnd = random.Random(42)
+    base = datetime(2024, 1, 1)
+    conn.executemany(INSERE, (_corrida(rnd, base) for _ in range(linhas)))
+    conn.commit()
+    conn.close()
+
+
+def _corrida(rnd, base):
+    ini = base + timedelta(minutes=rnd.randint(0, 60*24*365))
+    fim = ini + timedelta(hours=rnd.choice([2, 3, 4, 5]))
+    return (ini.isoformat(sep=" "), fim.isoformat(sep=" "), (fim-ini).seconds/3600,
+            rnd.uniform(50, 150), rnd.uniform(0, 20), rnd.uniform(10, 80))
+
+
+def escritor(caminho, perfil, parar, escritas):
+    conn = conectar(caminho, perfil)
+    rnd = random.Random(os.getpid())
+    base = datetime(2024, 1, 1)
+    n = 0
+    while not parar.is_set():
+        conn.execute(INSERE, _corrida(rnd, base))
+        conn.commit()
+        n += 1
+    escritas.value = n
+    conn.close()
+
+
+def leitor(caminho, perfil, segundos, fila):
+    conn = conectar(caminho, perfil)
+    params = ("2024-03-01 00:00:00", "2024-08-31 23:59:59.999999")
+    n, fim = 0, time.perf_counter() + segundos
+    while time.perf_counter() < fim:
+        conn.execute(CONSULTA, params).fetchone()
+        n += 1
+    fila.put(n)
+    conn.close()
+
+
+def rodar(nome, perfil, linhas, leitores, segundos):
+    with tempfile.TemporaryDirectory() as tmp:
+        caminho = os.path.join(tmp, "bench.db")
+        preparar(caminho, linhas)
+        conectar(caminho, perfil).close()  # journal_mode é gravado no arquivo
+
+        parar, escritas, fila = mp.Event(), mp.Value("i", 0), mp.Queue()
+        w = mp.Process(target=escritor, args=(caminho, perfil, parar, escritas))
+        w.start()
+        rs = [mp.Process(target=leitor, args=(caminho, perfil, segundos, fila)) for _ in range(leitores)]
+        for p in rs:
+            p.start()
+        leituras = sum(fila.get() for _ in rs)
+        for p in rs:
+            p.join()
+        parar.set()
+        w.join()
+        return {
+            "perfil": nome,
+            "pragmas": perfil,
+            "leituras_por_s": round(leituras/segundos, 1),
+            "escritas_por_s": round(escritas.value/segundos, 1),
+        }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--linhas", type=int, default=50_000, help="corridas iniciais no banco")
+    ap.add_argument("--leitores", type=int, default=4)
+    ap.add_argument("--segundos", type=float, default=5.0)
+    args = ap.parse_args(argv)
+
+    resultados = [
+        rodar("padrao", PERFIL_PADRAO, args.linhas, args.leitores, args.segundos),
+        rodar("perfil", perfil_do_ambiente(), args.linhas, args.leitores, args.segundos),
+    ]
+    print(json.dumps(resultados, indent=2, ensure_ascii=False))
+    return resultados
+
+
+if __name__ == "__main__":
+    main()
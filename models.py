@@ -1,8 +1,10 @@
 
 from flask import current_app
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, ForeignKey
+from sqlalchemy import create_engine, event, make_url, Index, Column, Integer, String, Float, DateTime, ForeignKey
 from sqlalchemy.orm import declarative_base, relationship, Session, scoped_session, sessionmaker
+from sqlalchemy.pool import QueuePool, StaticPool
 import os
+import threading
 
 Base = declarative_base()
 
@@ -15,6 +17,11 @@ class Station(Base):
 
 class Run(Base):
     __tablename__ = 'runs'
+    __table_args__ = (
+        # Filtro por período e paginação por (start_dt, id) em /reports
+        Index('ix_runs_start_dt', 'start_dt', 'id'),
+        Index('ix_runs_station_start', 'station_id', 'start_dt'),
+    )
     id = Column(Integer, primary_key=True)
     station_id = Column(Integer, ForeignKey('stations.id'), nullable=False)
     start_dt = Column(DateTime, nullable=False)
@@ -28,16 +35,82 @@ class Run(Base):
 
     station = relationship('Station', back_populates='runs')
 
-def get_engine():
-    db_url = os.getenv('DATABASE_URL') or 'sqlite:///instance/app.db'
-    if db_url.startswith('sqlite:///') and 'instance/app.db' in db_url:
+# Engine único por processo: init_db() e get_session() compartilham o mesmo pool.
+_engine = None
+_engine_pid = None
+_engine_lock = threading.Lock()
+_pool_stats = {'checkouts': 0, 'checkins': 0, 'connects': 0, 'invalidated': 0}
+
+def _pool_options(url):
+    """Configuração do pool a partir do ambiente (DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT)."""
+    opts = {'pool_pre_ping': True}
+    if url.get_backend_name() == 'sqlite':
+        # A conexão passa entre threads do worker; o pool garante um dono por vez
+        opts['connect_args'] = {'check_same_thread': False}
+        if url.database in (None, '', ':memory:'):
+            # Banco em memória só existe dentro de uma conexão
+            opts['poolclass'] = StaticPool
+            return opts
+    opts.update(
+        poolclass=QueuePool,
+        pool_size=int(os.getenv('DB_POOL_SIZE', '5')),
+        max_overflow=int(os.getenv('DB_MAX_OVERFLOW', '10')),
+        pool_timeout=float(os.getenv('DB_POOL_TIMEOUT', '30')),
+    )
+    return opts
+
+def _count(key):
+    def listener(*args):
+        _pool_stats[key] += 1
+    return listener
+
+def _create_engine():
+    url = make_url(os.getenv('DATABASE_URL') or 'sqlite:///instance/app.db')
+    if url.get_backend_name() == 'sqlite' and url.database == 'instance/app.db':
         os.makedirs('instance', exist_ok=True)
-    engine = create_engine(db_url, future=True)
+    engine = create_engine(url, future=True, **_pool_options(url))
+    event.listen(engine, 'checkout', _count('checkouts'))
+    event.listen(engine, 'checkin', _count('checkins'))
+    event.listen(engine, 'connect', _count('connects'))
+    event.listen(engine, 'invalidate', _count('invalidated'))
     return engine
 
+def get_engine():
+    """Engine do processo, criado na primeira chamada (depois do fork nos workers do gunicorn)."""
+    global _engine, _engine_pid
+    if _engine is None or _engine_pid != os.getpid():
+        with _engine_lock:
+            if _engine is None:
+                _engine = _create_engine()
+            elif _engine_pid != os.getpid():
+                # Herdado do master (gunicorn --preload): não reutiliza as conexões do pai
+                _engine.dispose(close=False)
+            _engine_pid = os.getpid()
+    return _engine
+
+def _after_fork():
+    global _engine_pid
+    if _engine is not None:
+        _engine.dispose(close=False)
+        _engine_pid = os.getpid()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+def pool_status():
+    """Números do pool para o endpoint de métricas."""
+    pool = get_engine().pool
+    status = dict(_pool_stats, pool=type(pool).__name__, pid=os.getpid())
+    if isinstance(pool, QueuePool):
+        status.update(size=pool.size(), checked_in=pool.checkedin(),
+                      checked_out=pool.checkedout(), overflow=pool.overflow())
+    return status
+
 def init_db():
+    from schema import migrate
     engine = get_engine()
-    Base.metadata.create_all(engine)
+    # Uma consulta à schema_version por boot; tabelas/índices só quando há migração pendente
+    migrate(engine)
     return engine
 
 def get_session():
@@ -0,0 +1,145 @@
+"""Exclusão em lotes das corridas antigas (ação "excluir antes de" do relatório).
+
+Em vez de um DELETE único, que trava o SQLite durante toda a exclusão, as
+corridas são apagadas em faixas de id de até PURGE_CHUNK linhas, cada uma na
+sua transação curta, com uma pausa entre elas para os outros workers
+escreverem. Opcionalmente cada faixa é gravada antes num CSV .gz.
+"""
+import csv
+import gzip
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import select, delete, func
+from models import Run
+
+PURGE_CHUNK = int(os.getenv('PURGE_CHUNK', '1000'))
+PURGE_PAUSE = float(os.getenv('PURGE_PAUSE', '0.01'))  # segundos entre lotes
+# Sem progresso há mais que isso (s), a exclusão é dada como morta (worker reiniciado)
+PURGE_STALE = float(os.getenv('PURGE_STALE', '300'))
+
+ARCHIVE_COLUMNS = ('id', 'station_id', 'start_dt', 'end_dt', 'hours', 'miles', 'cost', 'revenue', 'tips')
+
+
+def purge_runs(Session, cut, chunk=PURGE_CHUNK, archive_path=None, progress=None, pause=PURGE_PAUSE):
+    """Exclui as corridas com start_dt < cut e retorna quantas foram excluídas.
+
+    `progress(excluidas, total)` é chamado depois de cada lote. Com
+    `archive_path`, as linhas de cada lote vão para o CSV gzip antes do DELETE.
+    """
+    cond = Run.start_dt < cut
+    with Session() as s:
+        total = s.scalar(select(func.count(Run.id)).where(cond))
+    if progress:
+        progress(0, total)
+
+    archive = gzip.open(archive_path, 'wt', newline='', encoding='utf-8') if archive_path else None
+    writer = None
+    if archive:
+        writer = csv.writer(archive)
+        writer.writerow(ARCHIVE_COLUMNS)
+
+    deleted, last_id = 0, 0
+    try:
+        while True:
+            with Session() as s:
+                # Próxima faixa: ids reais das próximas `chunk` corridas a excluir
+                ids = s.scalars(
+                    select(Run.id).where(cond, Run.id > last_id).order_by(Run.id).limit(chunk)
+                ).all()
+                if not ids:
+                    break
+                faixa = (Run.id >= ids[0]) & (Run.id <= ids[-1]) & cond
+                if writer:
+                    rows = s.execute(select(*(getattr(Run, c) for c in ARCHIVE_COLUMNS)).where(faixa).order_by(Run.id))
+                    writer.writerows(rows)
+                    archive.flush()
+                deleted += s.execute(delete(Run).where(faixa)).rowcount
+                s.commit()
+                last_id = ids[-1]
+            if progress:
+                progress(deleted, total)
+            if pause:
+                time.sleep(pause)
+    finally:
+        if archive:
+            archive.close()
+    return deleted
+
+
+def archive_name(directory, cut):
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.now().strftime('%Y%m%d%H%M%S')
+    return os.path.join(directory, f'runs_before_{cut.date().isoformat()}_{stamp}.csv.gz')
+
+
+class PurgeJob:
+    """Exclusão em segundo plano, uma por vez entre todos os workers.
+
+    O estado vai para o JSON `status_path` a cada lote e /purge/status lê
+    dele, então qualquer worker responde pelo progresso da exclusão que outro
+    iniciou. O arquivo `<status_path>.lock`, criado com O_EXCL, garante uma
+    exclusão por vez; um lock sem progresso há PURGE_STALE segundos é de um
+    worker que morreu e é descartado.
+    """
+
+    def __init__(self, status_path):
+        self.status_path = status_path
+        self.lock_path = status_path + '.lock'
+
+    def status(self):
+        try:
+            with open(self.status_path, encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return {'running': False}
+        if state.get('running') and self._stale():
+            state.update(running=False, error=state.get('error') or 'interrompida: o worker parou sem concluir')
+        return state
+
+    def _stale(self):
+        try:
+            return time.time() - os.path.getmtime(self.lock_path) > PURGE_STALE
+        except OSError:  # sem lock: ninguém está excluindo
+            return True
+
+    def _write(self, state):
+        tmp = f'{self.status_path}.{os.getpid()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp, self.status_path)
+
+    def start(self, Session, cut, archive_path=None):
+        os.makedirs(os.path.dirname(self.status_path) or '.', exist_ok=True)
+        if os.path.exists(self.lock_path) and self._stale():
+            try:
+                os.remove(self.lock_path)
+            except OSError:
+                pass
+        try:
+            fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        os.write(fd, str(os.getpid()).encode())
+        os.close(fd)
+        state = {'running': True, 'cut': cut.date().isoformat(), 'deleted': 0, 'total': None,
+                 'archive': archive_path, 'error': None, 'pid': os.getpid()}
+        self._write(state)
+        threading.Thread(target=self._run, args=(Session, cut, archive_path, state), daemon=True).start()
+        return True
+
+    def _run(self, Session, cut, archive_path, state):
+        def progress(deleted, total):
+            state.update(deleted=deleted, total=total)
+            self._write(state)
+            os.utime(self.lock_path)  # sinal de vida para os outros workers
+        try:
+            purge_runs(Session, cut, archive_path=archive_path, progress=progress)
+        except Exception as e:
+            state['error'] = str(e)
+        finally:
+            state['running'] = False
+            self._write(state)
+            os.remove(self.lock_path)
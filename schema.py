@@ -0,0 +1,35 @@
+"""Versão do schema do app raiz (tabela schema_version, app='root').
+
+No boot, init_db() faz uma consulta; só com migração pendente pega o lock de
+escrita (BEGIN IMMEDIATE), relê a versão e aplica as que faltam. O executor é o
+mesmo do amazon_flex (amazon_flex.migracoes.executar, que só depende do
+SQLAlchemy); aqui ficam só as migrações deste app.
+"""
+from sqlalchemy.orm import Session
+from amazon_flex.migracoes import executar
+
+APP = 'root'
+
+
+def _m1_tables(conn):
+    from models import Base
+    Base.metadata.create_all(bind=conn)
+
+
+def _m2_run_indexes(conn):
+    # create_all não cria índices novos em tabelas que já existiam
+    from models import Run
+    for idx in Run.__table__.indexes:
+        idx.create(bind=conn, checkfirst=True)
+
+
+MIGRATIONS = [
+    (1, 'tabelas', _m1_tables),
+    (2, 'índices de runs (start_dt, station_id)', _m2_run_indexes),
+]
+
+
+def migrate(engine):
+    """Aplica as migrações pendentes; retorna os números aplicados."""
+    with Session(engine) as session:
+        return executar(session, APP, MIGRATIONS)
@@ -0,0 +1,72 @@
+import itertools
+import sqlite3
+import pytest
+from benchmarks import dados
+
+
+@pytest.fixture
+def gerar(tmp_path, monkeypatch):
+    """Fábrica de apps sobre um banco sintético novo em tmp_path: gerar(corridas, estacoes=..., despesas=...)."""
+    monkeypatch.setenv("DB_FILE", "flex.db")  # dados.criar_app troca; o monkeypatch restaura no fim
+    contador = itertools.count()
+
+    def fabrica(corridas, **kw):
+        app = dados.gerar(str(tmp_path / f"flex_{next(contador)}.db"), corridas, **kw)
+        app.instance_path = str(tmp_path)  # PDFs e cache em disco fora do instance/ do projeto
+        app.config["TESTING"] = True
+        return app
+
+    return fabrica
+
+
+@pytest.fixture
+def app(gerar):
+    return gerar(500, estacoes=8)
+
+
+@pytest.fixture
+def cliente(app):
+    return app.test_client()
+
+
+# Schema criado pelo create_all/ensure_schema da versão sem migrações versionadas
+SCHEMA_BASE = """
+CREATE TABLE stations (
+    id INTEGER NOT NULL PRIMARY KEY, nome VARCHAR(120) NOT NULL UNIQUE,
+    codigo VARCHAR(32), endereco VARCHAR(255), criado_em DATETIME);
+CREATE TABLE scheduled_rides (
+    id INTEGER NOT NULL PRIMARY KEY, titulo VARCHAR(160), inicio DATETIME NOT NULL, fim DATETIME NOT NULL,
+    horas FLOAT NOT NULL, valor FLOAT NOT NULL, gorjeta FLOAT NOT NULL, distance_miles FLOAT NOT NULL,
+    exclude_from_reports BOOLEAN DEFAULT '0' NOT NULL,
+    station_id INTEGER REFERENCES stations (id) ON DELETE SET NULL);
+CREATE TABLE expenses (
+    id INTEGER NOT NULL PRIMARY KEY, descricao VARCHAR(160), data DATETIME NOT NULL, valor FLOAT NOT NULL,
+    ride_id INTEGER REFERENCES scheduled_rides (id) ON DELETE CASCADE);
+INSERT INTO stations (id, nome) VALUES (1, 'Estação 01');
+INSERT INTO scheduled_rides VALUES
+    (1, NULL, '2024-03-01 08:00:00', '2024-03-01 12:00:00', 4.0, 90.0, 10.0, 40.0, 0, 1),
+    (2, NULL, '2024-03-02 08:00:00', '2024-03-02 11:00:00', 3.0, 70.0, 0.0, 0.0, 0, NULL);
+INSERT INTO expenses VALUES
+    (1, 'Combustível', '2024-03-01 09:00:00', 20.0, 1),
+    (2, 'Pedágio', '2024-03-05 10:00:00', 5.0, NULL);
+"""
+
+
+@pytest.fixture
+def banco_base(tmp_path):
+    """Arquivo SQLite com o schema anterior às migrações versionadas (sem schema_version)."""
+    caminho = str(tmp_path / "base.db")
+    conn = sqlite3.connect(caminho)
+    conn.executescript(SCHEMA_BASE)
+    conn.close()
+    return caminho
+
+
+def contar_sql(app):
+    """Lista que recebe cada comando SQL executado no engine do app."""
+    from sqlalchemy import event
+    from amazon_flex.models import db
+    comandos = []
+    with app.app_context():
+        event.listen(db.engine, "before_cursor_execute", lambda conn, cur, stmt, *a: comandos.append(stmt))
+    return comandos
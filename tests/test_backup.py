@@ -0,0 +1,118 @@
+"""Snapshot do banco vivo (amazon_flex.backup.snapshot) com escritas concorrentes."""
+import sqlite3
+import threading
+import time
+import pytest
+from amazon_flex import backup
+
+
+def banco(caminho, modo):
+    conn = sqlite3.connect(caminho)
+    conn.execute(f"PRAGMA journal_mode={modo}")
+    conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, dado TEXT)")
+    conn.executemany("INSERT INTO t (dado) VALUES (?)", [("x" * 500,)] * 4000)
+    conn.commit()
+    conn.close()
+
+
+def escrevendo(caminho, parar):
+    conn = sqlite3.connect(caminho, timeout=5)
+    while not parar.is_set():
+        conn.execute("INSERT INTO t (dado) VALUES ('novo')")
+        conn.commit()
+        time.sleep(0.001)
+    conn.close()
+
+
+@pytest.fixture
+def escritor():
+    parar, threads = threading.Event(), []
+
+    def iniciar(caminho):
+        t = threading.Thread(target=escrevendo, args=(caminho, parar))
+        t.start()
+        threads.append(t)
+
+    yield iniciar
+    parar.set()
+    for t in threads:
+        t.join()
+
+
+def test_wal_copia_num_passo_mesmo_com_escritas(tmp_path, escritor, monkeypatch):
+    origem, destino = str(tmp_path / "vivo.db"), str(tmp_path / "copia.db")
+    banco(origem, "wal")
+    monkeypatch.setattr(backup, "BACKUP_REINICIOS", 0)
+    escritor(origem)
+    time.sleep(0.02)
+    backup.snapshot(origem, destino)
+
+    copia = sqlite3.connect(destino)
+    assert copia.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+    assert copia.execute("SELECT count(*) FROM t").fetchone()[0] >= 4000
+    copia.close()
+
+
+def test_rollback_desiste_depois_de_reiniciar_demais(tmp_path, escritor, monkeypatch):
+    origem, destino = str(tmp_path / "vivo.db"), str(tmp_path / "copia.db")
+    banco(origem, "delete")
+    monkeypatch.setattr(backup, "BACKUP_PAGINAS", 1)
+    monkeypatch.setattr(backup, "BACKUP_PAUSA", 0.01)
+    monkeypatch.setattr(backup, "BACKUP_REINICIOS", 2)
+    escritor(origem)
+    with pytest.raises(backup.BackupInterrompido):
+        backup.snapshot(origem, destino)
+
+
+def test_download_entrega_o_banco(cliente):
+    resp = cliente.get("/backup/download")
+    assert resp.status_code == 200
+    assert resp.get_data()[:16] == b"SQLite format 3\x00"
+
+
+def test_backup_anterior_aos_derivados_e_aceito(app, tmp_path):
+    from amazon_flex.migracoes import COLUNAS_DERIVADAS
+    caminho = str(tmp_path / "antigo.db")
+    with app.app_context():
+        backup.snapshot(backup._db_path(), caminho)
+    conn = sqlite3.connect(caminho)
+    conn.execute("DROP INDEX ix_scheduled_rides_lucro")
+    for tabela, coluna, _ in COLUNAS_DERIVADAS:
+        conn.execute(f"ALTER TABLE {tabela} DROP COLUMN {coluna}")
+    conn.commit()
+    conn.close()
+    with app.app_context():
+        assert backup.validar_candidato(caminho) == []
+
+
+def contagens(app):
+    from amazon_flex.models import db, ScheduledRide, Expense
+    with app.app_context():
+        return db.session.query(ScheduledRide).count(), db.session.query(Expense).count()
+
+
+def enviar(cliente, caminho):
+    with open(caminho, "rb") as f:
+        return cliente.post("/backup/restore", data={"dbfile": (f, "backup.db")})
+
+
+def test_restore_de_backup_base_migra_antes_de_trocar(app, cliente, banco_base):
+    from amazon_flex.migracoes import MIGRACOES, versao_atual
+    from amazon_flex.models import db
+    assert enviar(cliente, banco_base).status_code == 302
+    assert contagens(app) == (2, 2)
+    with app.app_context():
+        assert versao_atual(db.session, "amazon_flex") == max(n for n, _, _ in MIGRACOES)
+
+
+def test_restore_com_migracao_falhando_mantem_o_banco(app, cliente, banco_base, monkeypatch):
+    from amazon_flex import migracoes
+
+    def quebrar(conn):
+        raise RuntimeError("falhou")
+
+    antes = contagens(app)
+    monkeypatch.setattr(migracoes, "MIGRACOES", migracoes.MIGRACOES + [(99, "quebrada", quebrar)])
+    resp = enviar(cliente, banco_base)
+    assert resp.status_code == 302
+    assert contagens(app) == antes
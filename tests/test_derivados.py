@@ -0,0 +1,25 @@
+"""Colunas derivadas das corridas mantidas pelos eventos de amazon_flex.derivados."""
+from amazon_flex import derivados
+from amazon_flex.models import db, ScheduledRide, Expense
+
+
+def derivados_gravados():
+    return {r.id: (round(r.despesas_vinculadas, 6), round(r.lucro, 6))
+            for r in db.session.query(ScheduledRide).order_by(ScheduledRide.id)}
+
+
+def test_mover_e_alterar_despesa_expirada(app):
+    with app.app_context():
+        despesa = Expense.query.filter(Expense.ride_id.isnot(None)).first()
+        outra = ScheduledRide.query.filter(ScheduledRide.id != despesa.ride_id).first()
+        db.session.commit()  # expira os atributos: o valor antigo precisa vir do banco
+
+        despesa.ride_id = outra.id
+        despesa.valor = despesa.valor + 10.0
+        db.session.commit()
+        depois = derivados_gravados()
+
+        derivados.recalcular()
+        db.session.expire_all()
+        assert derivados_gravados() == depois
+        db.session.rollback()
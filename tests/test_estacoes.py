@@ -0,0 +1,55 @@
+"""Comparativo por estação: número fixo de comandos SQL, qualquer que seja o número de estações."""
+from datetime import date
+import pytest
+from sqlalchemy import text
+from amazon_flex.models import db
+from amazon_flex.agregados import por_estacao, limites
+from conftest import contar_sql
+
+PERIODO = "inicio=2024-01-01&fim=2024-12-31"
+
+
+def comandos_por_estacao(app):
+    comandos = contar_sql(app)
+    with app.app_context():
+        linhas = por_estacao(date(2024, 1, 1), date(2024, 12, 31))
+    return len(comandos), linhas
+
+
+def comandos_da_pagina(app):
+    comandos = contar_sql(app)
+    resp = app.test_client().get("/relatorios/estacoes?" + PERIODO)  # cache frio: app novo
+    assert resp.status_code == 200
+    return len(comandos)
+
+
+def test_numero_de_consultas_nao_depende_das_estacoes(gerar):
+    poucas, muitas = gerar(400, estacoes=5), gerar(400, estacoes=200)
+
+    n_poucas, linhas_poucas = comandos_por_estacao(poucas)
+    n_muitas, linhas_muitas = comandos_por_estacao(muitas)
+    assert (len(linhas_poucas), len(linhas_muitas)) == (5, 200)
+    assert n_poucas == n_muitas == 1
+
+    # versão dos dados + comparativo + totais
+    assert comandos_da_pagina(poucas) == comandos_da_pagina(muitas) == 3
+
+
+def test_linhas_batem_com_as_tabelas(app):
+    with app.app_context():
+        dt_ini, dt_fim = limites(date(2024, 3, 1), date(2024, 8, 31))
+        brutos = {nome: (receita, custos) for nome, receita, custos in db.session.execute(text("""
+            SELECT s.nome,
+                   COALESCE(SUM(r.valor + r.gorjeta), 0),
+                   COALESCE(SUM((SELECT COALESCE(SUM(e.valor), 0) FROM expenses e WHERE e.ride_id = r.id)), 0)
+            FROM stations s
+            LEFT JOIN scheduled_rides r ON r.station_id = s.id
+                 AND r.inicio >= :ini AND r.fim <= :fim AND r.exclude_from_reports = 0
+            GROUP BY s.id
+        """), {"ini": dt_ini, "fim": dt_fim})}
+        linhas = por_estacao(date(2024, 3, 1), date(2024, 8, 31))
+    assert len(linhas) == len(brutos)
+    for l in linhas:
+        receita, custos = brutos[l["estacao"].split(" (")[0]]
+        assert l["receita"] == pytest.approx(receita, abs=1e-6)
+        assert l["custos"] == pytest.approx(custos, abs=1e-6)
@@ -0,0 +1,50 @@
+"""Exportador Prometheus (amazon_flex.metricas), no app principal e num app Flask sem Flask-SQLAlchemy."""
+import re
+import time
+from flask import Flask, Response, stream_with_context
+from sqlalchemy import create_engine, text
+from amazon_flex import metricas
+
+
+def contagem(texto, endpoint):
+    m = re.search(rf'http_request_duration_seconds_count{{endpoint="{re.escape(endpoint)}",pid="\d+"}} (\d+)', texto)
+    return int(m.group(1)) if m else 0
+
+
+def soma(texto, endpoint):
+    m = re.search(rf'http_request_duration_seconds_sum{{endpoint="{re.escape(endpoint)}",pid="\d+"}} ([\d.]+)', texto)
+    return float(m.group(1))
+
+
+def test_streaming_conta_ate_o_fim_do_corpo(app):
+    cliente = app.test_client()
+    resp = cliente.get("/relatorios/csv?inicio=2024-01-01&fim=2024-12-31")
+    assert contagem(cliente.get("/metricas").get_data(as_text=True), "relatorios.csv_export") == 0
+    assert resp.get_data().count(b"\n") > 1
+    resp.close()
+    texto = cliente.get("/metricas").get_data(as_text=True)
+    assert contagem(texto, "relatorios.csv_export") == 1
+    assert re.search(r'sql_statements_total{endpoint="relatorios.csv_export",pid="\d+"} [1-9]', texto)
+
+
+def test_app_sem_flask_sqlalchemy():
+    app = Flask(__name__)
+    engine = create_engine("sqlite://")
+    metricas.init_app(app, engine, caminho="/metrics")
+
+    @app.get("/lento")
+    def lento():
+        def corpo():
+            with engine.connect() as conn:
+                yield str(conn.execute(text("SELECT 1")).scalar())
+            time.sleep(0.05)
+            yield "fim"
+        return Response(stream_with_context(corpo()))
+
+    cliente = app.test_client()
+    resp = cliente.get("/lento")
+    assert resp.get_data() == b"1fim"
+    resp.close()  # o servidor WSGI fecha a resposta depois do último pedaço
+    texto = cliente.get("/metrics").get_data(as_text=True)
+    assert contagem(texto, "lento") == 1 and soma(texto, "lento") >= 0.05
+    assert re.search(r'sql_statements_total{endpoint="lento",pid="\d+"} 1', texto)
@@ -0,0 +1,25 @@
+"""Migrações do app principal (amazon_flex.migracoes) sobre um banco anterior a schema_version."""
+import sqlite3
+from benchmarks import dados
+
+
+def test_banco_base_migra_ate_a_ultima_versao(banco_base, monkeypatch):
+    from amazon_flex.migracoes import MIGRACOES, versao_atual
+    from amazon_flex.models import db, ScheduledRide
+    from amazon_flex.agregados import totais
+    from datetime import date
+
+    monkeypatch.setenv("DB_FILE", "flex.db")  # criar_app troca; o monkeypatch restaura no fim
+    app = dados.criar_app(banco_base)  # create_app roda migrar()
+    with app.app_context():
+        assert versao_atual(db.session, "amazon_flex") == max(n for n, _, _ in MIGRACOES)
+        lucros = dict(db.session.query(ScheduledRide.id, ScheduledRide.lucro))
+        assert lucros == {1: 80.0, 2: 70.0}
+        t = totais(date(2024, 3, 1), date(2024, 3, 31))
+        assert (t["qtd"], t["receita"], t["custo"]) == (2, 170.0, 25.0)
+
+    conn = sqlite3.connect(banco_base)
+    indices = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    conn.close()
+    assert {"ix_scheduled_rides_relatorio", "ix_scheduled_rides_lucro", "ix_scheduled_rides_inicio_id",
+            "ix_expenses_data_id", "ix_expenses_ride_id"} <= indices
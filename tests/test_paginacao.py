@@ -0,0 +1,18 @@
+"""Paginação keyset das listagens (amazon_flex.paginacao)."""
+import pytest
+
+
+@pytest.mark.parametrize("por_pagina, esperado", [("-5", 1), ("0", 200), ("3", 3), ("100000", 500), ("abc", 200)])
+def test_por_pagina_fica_entre_1_e_o_maximo(cliente, por_pagina, esperado):
+    itens = cliente.get(f"/corridas/json?por_pagina={por_pagina}").get_json()["itens"]
+    assert len(itens) == esperado
+
+
+def test_percorre_todas_as_corridas_sem_repetir(cliente):
+    vistos, url = [], "/corridas/json?por_pagina=7"
+    while url:
+        dados = cliente.get(url).get_json()
+        assert len(dados["itens"]) <= 7
+        vistos += [c["id"] for c in dados["itens"]]
+        url = dados["proximo"]
+    assert len(vistos) == len(set(vistos)) == 500
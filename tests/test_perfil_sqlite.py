@@ -0,0 +1,22 @@
+"""Perfil aplicado em cada conexão (amazon_flex.perfil_sqlite)."""
+import sqlite3
+import threading
+from amazon_flex import perfil_sqlite
+
+
+def test_troca_para_wal_espera_o_lock_de_outro_processo(tmp_path, monkeypatch):
+    caminho = str(tmp_path / "flex.db")
+    escritor = sqlite3.connect(caminho, check_same_thread=False, isolation_level=None)
+    escritor.execute("CREATE TABLE t (id INTEGER PRIMARY KEY)")
+    escritor.execute("BEGIN EXCLUSIVE")
+    liberar = threading.Timer(0.3, escritor.execute, ("COMMIT",))
+    liberar.start()
+
+    monkeypatch.delenv("SQLITE_JOURNAL_MODE", raising=False)
+    monkeypatch.delenv("SQLITE_BUSY_TIMEOUT", raising=False)
+    conn = sqlite3.connect(caminho, timeout=0)
+    perfil_sqlite.aplicar(conn, perfil_sqlite.perfil_do_ambiente())
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    conn.close()
+    liberar.join()
+    escritor.close()
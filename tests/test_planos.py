@@ -0,0 +1,38 @@
+"""Planos de consulta (amazon_flex.planos) e a migração dos índices das listagens."""
+from sqlalchemy import text
+from amazon_flex.models import db
+from amazon_flex import planos
+from amazon_flex.migracoes import migrar
+
+
+def test_nenhum_scan_completo_nem_ordem_temporaria(app):
+    with app.app_context():
+        assert planos.verificar() == {}
+        # Com estatísticas o planejador pode mudar de ideia
+        db.session.execute(text("ANALYZE"))
+        db.session.commit()
+        assert planos.verificar() == {}
+
+
+def test_verificar_acusa_scan_completo(app):
+    with app.app_context():
+        db.session.execute(text("DROP INDEX ix_scheduled_rides_inicio_id"))
+        db.session.execute(text("DROP INDEX ix_scheduled_rides_relatorio"))
+        falhas = planos.verificar()
+        db.session.rollback()
+    assert "relatorios.corridas" in falhas
+    assert any(l.startswith("SCAN scheduled_rides") for l in falhas["relatorios.corridas"])
+
+
+def test_migracao_6_recria_indices_das_listagens(app):
+    with app.app_context():
+        db.session.execute(text("DROP INDEX ix_scheduled_rides_inicio_id"))
+        db.session.execute(text("DROP INDEX ix_expenses_data_id"))
+        db.session.execute(text("DELETE FROM schema_version WHERE app = 'amazon_flex' AND versao = 6"))
+        db.session.commit()
+        assert "rides.index" in planos.verificar()
+
+        assert migrar() == [6]
+        indices = {r[0] for r in db.session.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'"))}
+        assert {"ix_scheduled_rides_inicio_id", "ix_expenses_data_id"} <= indices
+        assert planos.verificar() == {}
@@ -0,0 +1,62 @@
+"""Exclusão em lotes do app raiz (purge.PurgeJob): estado compartilhado entre workers pelo arquivo."""
+import os
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, insert, select, func
+from sqlalchemy.orm import sessionmaker
+from models import Base, Station, Run
+import purge
+
+
+def sessao_com_corridas(tmp_path, n):
+    engine = create_engine(f"sqlite:///{tmp_path / 'runs.db'}")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(engine)
+    with Session() as s:
+        s.execute(insert(Station), [{"id": 1, "name": "DXX1"}])
+        inicio = datetime(2023, 1, 1)
+        s.execute(insert(Run), [{"station_id": 1, "start_dt": inicio + timedelta(hours=i),
+                                 "end_dt": inicio + timedelta(hours=i, minutes=30)} for i in range(n)])
+        s.commit()
+    return Session
+
+
+def esperar(job):
+    limite = time.monotonic() + 10
+    while job.status()["running"] or os.path.exists(job.lock_path):
+        assert time.monotonic() < limite
+        time.sleep(0.01)
+    return job.status()
+
+
+def test_outro_worker_ve_o_progresso_e_nao_inicia_outra(tmp_path):
+    Session = sessao_com_corridas(tmp_path, 5000)
+    caminho = str(tmp_path / "purge" / "status.json")
+    worker_a, worker_b = purge.PurgeJob(caminho), purge.PurgeJob(caminho)
+
+    assert worker_a.start(Session, datetime(2023, 4, 1))
+    assert worker_b.status()["running"]
+    assert not worker_b.start(Session, datetime(2023, 2, 1))
+
+    final = esperar(worker_b)
+    assert final["error"] is None and final["deleted"] == final["total"] == 90 * 24
+    with Session() as s:
+        assert s.scalar(select(func.count(Run.id))) == 5000 - 90 * 24
+    assert not os.path.exists(worker_a.lock_path)
+    assert worker_b.start(Session, datetime(2023, 5, 1))  # livre de novo
+    esperar(worker_a)
+
+
+def test_lock_sem_progresso_de_worker_morto_e_descartado(tmp_path, monkeypatch):
+    Session = sessao_com_corridas(tmp_path, 10)
+    caminho = str(tmp_path / "status.json")
+    job = purge.PurgeJob(caminho)
+    job._write({"running": True, "cut": "2023-01-01", "deleted": 0, "total": 10, "error": None})
+    open(job.lock_path, "w").close()
+    assert not job.start(Session, datetime(2024, 1, 1))
+
+    monkeypatch.setattr(purge, "PURGE_STALE", 0)
+    time.sleep(0.01)
+    assert job.status()["running"] is False and "interrompida" in job.status()["error"]
+    assert job.start(Session, datetime(2024, 1, 1))
+    assert esperar(job)["deleted"] == 10
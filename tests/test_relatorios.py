@@ -0,0 +1,36 @@
+"""Rotas de /relatorios: página do período e parâmetros inválidos."""
+import html
+import re
+from datetime import date
+from amazon_flex.agregados import totais
+
+LINHA = re.compile(rb"<td>\d\d/\d\d/\d{4} \d\d:\d\d - ")
+PROXIMA = re.compile(rb'href="([^"]*depois=[^"]*)">Pr')
+
+
+def test_index_pagina_as_corridas_e_guarda_so_os_totais(app):
+    cliente = app.test_client()
+    url, linhas, paginas = "/relatorios/?inicio=2024-01-01&fim=2024-12-31&station_id=3&por_pagina=10", 0, 0
+    while url:
+        resp = cliente.get(url)
+        assert resp.status_code == 200
+        linhas += len(LINHA.findall(resp.data))
+        paginas += 1
+        proxima = PROXIMA.search(resp.data)
+        url = html.unescape(proxima.group(1).decode()) if proxima else None
+        assert url is None or ("station_id=3" in url and "por_pagina=10" in url)
+    with app.app_context():
+        esperado = totais(date(2024, 1, 1), date(2024, 12, 31), "3")["qtd"]
+    assert linhas == esperado and paginas == -(-esperado // 10)
+
+    cache = app.extensions["cache_relatorios"].memoria._dados
+    assert cache and all(set(v) == {"t", "estacoes"} for k, v in cache.items() if k[0] == "relatorios.index")
+
+
+def test_parametros_invalidos_dao_400(cliente):
+    for url in ("/relatorios/?station_id=abc", "/relatorios/csv?station_id=1.5",
+                "/relatorios/?inicio=2024-13-01&fim=2024-12-31"):
+        assert cliente.get(url).status_code == 400, url
+    for url in ("/relatorios/ranking?station_id=abc", "/relatorios/serie?inicio=ontem&fim=hoje"):
+        resp = cliente.get(url)
+        assert resp.status_code == 400 and "erro" in resp.get_json(), url
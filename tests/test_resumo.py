@@ -0,0 +1,83 @@
+"""resumo_diario mantido pelas rotas contra o reconstruído das tabelas brutas."""
+import random
+import pytest
+from amazon_flex.models import db, ResumoDiario, ScheduledRide, Expense, Station
+from amazon_flex import resumo
+
+
+def linhas_do_resumo():
+    return {(r.dia, r.dia_fim, r.station_id): {c: getattr(r, c) for c in resumo.CAMPOS}
+            for r in ResumoDiario.query.all()}
+
+
+def conferir_com_reconstruido(app):
+    with app.app_context():
+        incremental = linhas_do_resumo()
+        resumo.reconstruir()
+        db.session.flush()
+        reconstruido = linhas_do_resumo()
+        db.session.rollback()
+    assert incremental.keys() == reconstruido.keys()
+    for chave, campos in reconstruido.items():
+        assert incremental[chave]["qtd"] == campos["qtd"], chave
+        for c in resumo.CAMPOS:
+            assert incremental[chave][c] == pytest.approx(campos[c], abs=1e-6), (chave, c)
+
+
+def corrida_aleatoria(rnd, estacoes):
+    inicio = f"2024-{rnd.randint(5, 6):02d}-{rnd.randint(1, 28):02d}T{rnd.randint(6, 20):02d}:00"
+    fim = inicio[:11] + f"{int(inicio[11:13]) + rnd.randint(1, 3):02d}:30"
+    return {"inicio": inicio, "fim": fim, "valor": f"{rnd.uniform(20, 120):.2f}",
+            "gorjeta": f"{rnd.uniform(0, 20):.2f}", "distance_miles": f"{rnd.uniform(5, 60):.1f}",
+            "station_id": str(rnd.choice(estacoes)) if rnd.random() < 0.9 else "",
+            **({"exclude_from_reports": "1"} if rnd.random() < 0.1 else {})}
+
+
+def test_escritas_aleatorias_batem_com_reconstruir(gerar):
+    app = gerar(300, estacoes=6)
+    cliente = app.test_client()
+    rnd = random.Random(7)
+    for _ in range(150):
+        with app.app_context():
+            corridas = [i for (i,) in db.session.query(ScheduledRide.id)]
+            despesas = [i for (i,) in db.session.query(Expense.id)]
+            estacoes = [i for (i,) in db.session.query(Station.id)]
+        acao = rnd.random()
+        if acao < 0.25:
+            resp = cliente.post("/corridas/nova", data=corrida_aleatoria(rnd, estacoes))
+        elif acao < 0.45:
+            resp = cliente.post(f"/corridas/{rnd.choice(corridas)}/editar", data=corrida_aleatoria(rnd, estacoes))
+        elif acao < 0.6:
+            resp = cliente.post(f"/corridas/{rnd.choice(corridas)}/excluir")
+        elif acao < 0.8:
+            resp = cliente.post("/despesas/nova", data={
+                "data": f"2024-06-{rnd.randint(1, 28):02d}", "descricao": "Teste",
+                "valor": f"{rnd.uniform(1, 80):.2f}",
+                "ride_id": str(rnd.choice(corridas)) if rnd.random() < 0.6 else ""})
+        elif acao < 0.97:
+            resp = cliente.post(f"/despesas/{rnd.choice(despesas)}/excluir")
+        else:
+            resp = cliente.post(f"/estacoes/{rnd.choice(estacoes)}/excluir")
+        assert resp.status_code == 302
+    conferir_com_reconstruido(app)
+
+
+def test_linha_que_zera_e_apagada(gerar):
+    app = gerar(0, estacoes=1)
+    cliente = app.test_client()
+    cliente.post("/corridas/nova", data={"inicio": "2025-02-10T08:00", "fim": "2025-02-10T11:00",
+                                         "valor": "0.1", "gorjeta": "0.2", "distance_miles": "0.3",
+                                         "station_id": "1"})
+    cliente.post("/despesas/nova", data={"data": "2025-02-10", "valor": "0.7", "ride_id": "1"})
+    with app.app_context():
+        assert len(linhas_do_resumo()) == 2  # a da estação e a das despesas pela data (station_id 0)
+
+    cliente.post("/despesas/1/excluir")
+    cliente.post("/corridas/1/excluir")
+    with app.app_context():
+        assert linhas_do_resumo() == {}
+
+    # A mesma chave volta a ser criada depois de apagada
+    cliente.post("/corridas/nova", data={"inicio": "2025-02-10T08:00", "fim": "2025-02-10T09:00",
+                                         "valor": "10", "station_id": "1"})
+    conferir_com_reconstruido(app)
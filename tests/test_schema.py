@@ -0,0 +1,26 @@
+"""Migrações do app raiz (schema.py) pelo executor compartilhado amazon_flex.migracoes.executar."""
+import os
+import subprocess
+import sys
+from sqlalchemy import create_engine, text
+import schema
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_migra_uma_vez_e_registra(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'app.db'}")
+    assert schema.migrate(engine) == [1, 2]
+    assert schema.migrate(engine) == []
+    with engine.connect() as conn:
+        versoes = conn.execute(text("SELECT app, versao FROM schema_version ORDER BY versao")).all()
+        indices = {r[0] for r in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'"))}
+    assert versoes == [("root", 1), ("root", 2)]
+    assert {"ix_runs_start_dt", "ix_runs_station_start"} <= indices
+
+
+def test_app_raiz_nao_carrega_flask_sqlalchemy(tmp_path):
+    codigo = "import sys, app; print('flask_sqlalchemy' in sys.modules)"
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{tmp_path / 'app.db'}")
+    saida = subprocess.run([sys.executable, "-c", codigo], cwd=RAIZ, env=env, capture_output=True, text=True, check=True)
+    assert saida.stdout.strip() == "False"
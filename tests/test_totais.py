@@ -0,0 +1,66 @@
+"""Totais do relatório (resumo_diario) contra somas diretas em scheduled_rides/expenses."""
+import random
+from datetime import date, timedelta
+import pytest
+from sqlalchemy import text
+from amazon_flex.models import db
+from amazon_flex.agregados import totais, limites
+
+
+def totais_brutos(inicio, fim, station_id=None):
+    dt_ini, dt_fim = limites(inicio, fim)
+    filtro_estacao = "AND station_id = :sid" if station_id else ""
+    corridas = db.session.execute(text(f"""
+        SELECT COALESCE(SUM(valor), 0), COALESCE(SUM(gorjeta), 0), COALESCE(SUM(distance_miles), 0),
+               COALESCE(SUM(horas), 0), COUNT(*)
+        FROM scheduled_rides
+        WHERE inicio >= :ini AND fim <= :fim AND exclude_from_reports = 0 {filtro_estacao}
+    """), {"ini": dt_ini, "fim": dt_fim, "sid": station_id}).one()
+    despesas = db.session.execute(text(
+        "SELECT COALESCE(SUM(valor), 0) FROM expenses WHERE data >= :ini AND data <= :fim"
+    ), {"ini": dt_ini, "fim": dt_fim}).scalar()
+    valor, gorjeta, milhas, horas, qtd = corridas
+    return {"valor": valor, "gorjeta": gorjeta, "receita": valor + gorjeta, "milhas": milhas,
+            "horas": horas, "qtd": qtd, "custo": despesas, "lucro": valor + gorjeta - despesas}
+
+
+def conferir(inicio, fim, station_id=None):
+    esperado = totais_brutos(inicio, fim, station_id)
+    obtido = totais(inicio, fim, station_id)
+    assert obtido["qtd"] == esperado["qtd"]
+    for campo in ("valor", "gorjeta", "receita", "milhas", "horas", "custo", "lucro"):
+        assert obtido[campo] == pytest.approx(esperado[campo], abs=1e-6), campo
+
+
+def periodos(rnd, n):
+    for _ in range(n):
+        inicio = date(2024, 1, 1) + timedelta(days=rnd.randrange(366))
+        yield inicio, inicio + timedelta(days=rnd.randrange(120))
+
+
+def test_totais_batem_com_as_tabelas(app):
+    rnd = random.Random(1)
+    with app.app_context():
+        conferir(date(2024, 1, 1), date(2024, 12, 31))
+        conferir(date(2023, 1, 1), date(2023, 12, 31))  # período vazio
+        for inicio, fim in periodos(rnd, 20):
+            conferir(inicio, fim)
+            conferir(inicio, fim, str(rnd.randint(1, 8)))
+
+
+def test_corrida_de_dois_dias_fica_fora_se_termina_depois_do_fim(app):
+    cliente = app.test_client()
+    cliente.post("/corridas/nova", data={"inicio": "2025-03-01T22:00", "fim": "2025-03-02T02:00",
+                                         "valor": "80", "gorjeta": "5", "distance_miles": "30"})
+    with app.app_context():
+        assert totais(date(2025, 3, 1), date(2025, 3, 1))["qtd"] == 0
+        assert totais(date(2025, 3, 1), date(2025, 3, 2))["receita"] == pytest.approx(85.0)
+        conferir(date(2025, 3, 1), date(2025, 3, 2))
+
+
+def test_pagina_do_relatorio_mostra_os_totais(app):
+    with app.app_context():
+        esperado = totais_brutos(date(2024, 4, 1), date(2024, 6, 30))
+    resp = app.test_client().get("/relatorios/?inicio=2024-04-01&fim=2024-06-30")
+    assert resp.status_code == 200
+    assert f"$ {esperado['receita']:.2f}".encode() in resp.data